@@ -0,0 +1,23 @@
+'''
+abaqusConstants.py (synthetic stand-in)
+=======================================
+
+Symbolic constants used with the synthetic odbAccess.py stand-in, for
+ivolBench.py. Never imported when running under Abaqus.
+'''
+
+# Copyright 2017 Confluent Medical Technologies
+# Released as part of nitinol-design-concepts
+# https://github.com/confluentmedical/nitinol-design-concepts
+# under terms of Apache 2.0 license
+# http://www.apache.org/licenses/LICENSE-2.0.txt
+
+TRUE = True
+FALSE = False
+INTEGRATION_POINT = 'INTEGRATION_POINT'
+CENTROID = 'CENTROID'
+NODAL = 'NODAL'
+ELEMENT_NODAL = 'ELEMENT_NODAL'
+MAX_PRINCIPAL = 'MAX_PRINCIPAL'
+MIN_PRINCIPAL = 'MIN_PRINCIPAL'
+PRESS = 'PRESS'
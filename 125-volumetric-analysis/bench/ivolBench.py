@@ -0,0 +1,328 @@
+'''
+ivolBench.py
+============
+
+Time and memory-profile outputToText of ivolResults.004.py end to end on
+synthetic output databases, without Abaqus. The synthetic odbAccess.py and
+abaqusConstants.py in this folder stand in for the Abaqus modules.
+
+Usage: python ivolBench.py
+      [-sizes n,n,...]  (integration points, default 10000,100000,1000000,10000000)
+      [-script scriptFile]  (default ../ivolResults.004.py)
+      [-output resultsFile]  (default ivolBench.jsonl)
+      [-label label]  (name of this run in the results, e.g. a git commit)
+      [-nIp n]  (integration points per element, default 5)
+      [-instances n]  (part instances, default 1)
+      [-frames n]  (frames per step, default 3)
+      [-repeat n]  (runs of each size, default 1)
+      [-blockSize n]
+      [-format csv|npy|both]
+      [-columns name,name,...]
+      [-cycle ends|full]
+      [-elset HALF]
+      [-profile]  (include the -profile phases of each run)
+      [-workers n]  (worker processes of each run, as -workers of ivolResults)
+      [-storage full|compact]
+      [-aggregate element]
+
+Run with the same Python 2.7 and numpy versions as Abaqus python for results
+close to those under Abaqus. Each run is made in a new Python process, so
+the peak memory of one size does not hide that of the next. Each process
+creates a synthetic ODB with the given number of integration points (split
+evenly over the part instances), runs outputToText with the given options
+into a temporary folder, and reports:
+
+    wallSeconds      elapsed time of outputToText
+    cpuSeconds       user and system CPU time of outputToText
+    baseRssMB        peak resident memory before outputToText
+    peakRssMB        peak resident memory at the end of the run
+    pointsPerSecond  integration points written per second of wall time
+    outputMB         size of the results written
+
+One JSON record per run is appended to the results file, with the script
+version, label, Python and numpy versions and options, so that results of
+different versions of the script can be compared. Versions before .006,
+e.g. the original ivolResults.004.py, take no options, so run them without
+the options that follow -repeat above. With -profile, each record
+also holds the phases from the -profile report of ivolResults.004.py. A table
+is printed at the end. Peak memory is not measured on Windows.
+'''
+
+# Copyright 2017 Confluent Medical Technologies
+# Released as part of nitinol-design-concepts
+# https://github.com/confluentmedical/nitinol-design-concepts
+# under terms of Apache 2.0 license
+# http://www.apache.org/licenses/LICENSE-2.0.txt
+
+import os
+import sys
+import imp
+import json
+import time
+import shutil
+import socket
+import inspect
+import platform
+import tempfile
+import subprocess
+from sys import argv, exit
+
+benchDir = os.path.dirname(os.path.abspath(__file__))
+defaultSizes = [10000, 100000, 1000000, 10000000]
+
+# the first line of each run's output starting with this holds its record
+recordPrefix = 'IVOLBENCH '
+
+#=================================================================
+# peakMemory
+# Peak resident memory of this process in MB, or None if not available
+
+def peakMemory():
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on Mac OS
+    if sys.platform == 'darwin':
+        return peak/1024.0/1024.0
+    return peak/1024.0
+
+def folderSize(path):
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    total = 0
+    for root, dirs, files in os.walk(path):
+        for name in files:
+            total += os.path.getsize(os.path.join(root, name))
+    return total
+
+#=================================================================
+# runOnce
+# Run outputToText on a synthetic odb in this process, and return a record
+# of the time and memory used. Called in a new process by benchmark.
+
+def runOnce(setup):
+    # the synthetic modules must be found before any Abaqus modules
+    sys.path.insert(0, benchDir)
+    import numpy
+    import odbAccess
+    ivolResults = imp.load_source('ivolResults', setup['script'])
+
+    workDir = tempfile.mkdtemp(prefix='ivolBench')
+    try:
+        odbName = os.path.join(workDir, 'bench.odb')
+        open(odbName, 'w').close()
+        nInstances = setup['instances']
+        nEl = max(1, setup['points']//(setup['nIp']*nInstances))
+        odbAccess.synthetic(odbName, nEl=nEl, nIp=setup['nIp'],
+                            steps=('crimp', 'cycle'), frames=setup['frames'],
+                            nInstances=nInstances)
+        partInstance = 'PART-1-1'
+        if nInstances > 1:
+            partInstance = 'ASSEMBLY'
+        outputFile = os.path.join(workDir, 'bench.ivol.csv')
+        paramList = [odbName, None, partInstance, 'crimp', 'cycle', outputFile]
+        # versions before .006 take no options, and return nothing
+        legacy = len(inspect.getargspec(ivolResults.outputToText).args) == 1
+        if legacy and setup['options']:
+            raise ValueError('%s takes no options; run it without %s' %(
+                os.path.basename(setup['script']), ', '.join(sorted(setup['options']))))
+
+        baseRss = peakMemory()
+        stdout = sys.stdout
+        sys.stdout = open(os.devnull, 'w')
+        try:
+            cpuStart = sum(os.times()[:2])
+            wallStart = time.time()
+            if setup['options']:
+                written = ivolResults.outputToText(paramList, setup['options'])
+            else:
+                written = ivolResults.outputToText(paramList)
+            wallSeconds = time.time() - wallStart
+            cpuSeconds = sum(os.times()[:2]) - cpuStart
+        finally:
+            sys.stdout.close()
+            sys.stdout = stdout
+
+        outputBytes = 0
+        for name in os.listdir(workDir):
+            if name.startswith('bench.ivol'):
+                outputBytes += folderSize(os.path.join(workDir, name))
+        points = nEl*setup['nIp']*nInstances
+        record = {
+            'script': os.path.basename(setup['script']),
+            'scriptVersion': getattr(ivolResults, 'scriptVersion', None),
+            'label': setup['label'],
+            'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'host': socket.gethostname(),
+            'python': platform.python_version(),
+            'numpy': numpy.__version__,
+            'points': points,
+            'elements': nEl*nInstances,
+            'nIp': setup['nIp'],
+            'instances': nInstances,
+            'frames': setup['frames'],
+            'options': setup['options'],
+            'status': 'ok',
+            'wallSeconds': round(wallSeconds, 3),
+            'cpuSeconds': round(cpuSeconds, 3),
+            'baseRssMB': baseRss,
+            'peakRssMB': peakMemory(),
+            'pointsPerSecond': int(points/max(wallSeconds, 1e-9)),
+            'outputMB': round(outputBytes/1024.0/1024.0, 3)}
+        profileFile = os.path.join(workDir, 'bench.ivol.profile.json')
+        if os.path.isfile(profileFile):
+            f = open(profileFile)
+            record['phases'] = json.load(f)['phases']
+            f.close()
+        if legacy:
+            written = outputBytes or None
+        if written is None:
+            record['status'] = 'error'
+            record['pointsPerSecond'] = None
+    finally:
+        shutil.rmtree(workDir, ignore_errors=True)
+    return record
+
+#=================================================================
+# benchmark
+# Run each size in a new process, append the records to the results file
+# and return them
+
+def benchmark(setup, sizes, repeat, resultsFile):
+    records = []
+    for points in sizes:
+        for i in range(repeat):
+            runSetup = dict(setup)
+            runSetup['points'] = points
+            process = subprocess.Popen([sys.executable, os.path.abspath(__file__),
+                                        '-run', json.dumps(runSetup)],
+                                       stdout=subprocess.PIPE)
+            output = process.communicate()[0].decode('utf-8')
+            record = None
+            for line in output.splitlines():
+                if line.startswith(recordPrefix):
+                    record = json.loads(line[len(recordPrefix):])
+            if record is None or process.returncode != 0:
+                # failed runs (e.g. out of memory) are recorded too
+                record = {'script': os.path.basename(setup['script']),
+                          'label': setup['label'], 'points': points,
+                          'options': setup['options'],
+                          'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                          'status': 'failed (exit code %s)' %(process.returncode)}
+            records.append(record)
+            f = open(resultsFile, 'a')
+            f.write(json.dumps(record, sort_keys=True) + '\n')
+            f.close()
+            print resultsRow(record)
+            sys.stdout.flush()
+    return records
+
+resultsColumns = [('points', '%10s'), ('wallSeconds', '%13s'), ('cpuSeconds', '%12s'),
+                  ('pointsPerSecond', '%17s'), ('baseRssMB', '%11s'),
+                  ('peakRssMB', '%11s'), ('outputMB', '%10s'), ('status', '  %s')]
+
+def resultsRow(record):
+    row = ''
+    for name, format in resultsColumns:
+        value = record.get(name)
+        if isinstance(value, float):
+            value = '%.1f' %(value)
+        row += format %(value,)
+    return row
+
+def resultsHeader():
+    return ''.join([format %(name,) for name, format in resultsColumns])
+
+#==================================================================
+# S T A R T
+#
+if __name__ == '__main__':
+
+    # a single run in a new process, started by benchmark
+    if len(argv) == 3 and argv[1] == '-run':
+        record = runOnce(json.loads(argv[2]))
+        print recordPrefix + json.dumps(record)
+        exit(0)
+
+    # initialize parameters
+    sizes = defaultSizes
+    repeat = 1
+    resultsFile = 'ivolBench.jsonl'
+    setup = {'script': os.path.join(os.path.dirname(benchDir), 'ivolResults.004.py'),
+             'label': None, 'nIp': 5, 'instances': 1, 'frames': 3, 'options': {}}
+    options = setup['options']
+
+    # parse the parameters from the argument list
+    argList = argv
+    argCount = len(argList)
+    i=1
+    try:
+        while (i < argCount):
+            if (argList[i][:3] == "-si"):
+                i+=1
+                sizes = [int(float(size)) for size in argList[i].split(',')]
+            elif (argList[i][:3] == "-sc"):
+                i+=1
+                setup['script'] = os.path.abspath(argList[i])
+            elif (argList[i][:3] == "-ou"):
+                i+=1
+                resultsFile = argList[i]
+            elif (argList[i][:3] == "-re"):
+                i+=1
+                repeat = int(argList[i])
+            elif (argList[i][:3] == "-la"):
+                i+=1
+                setup['label'] = argList[i]
+            elif (argList[i][:3] == "-ni"):
+                i+=1
+                setup['nIp'] = int(argList[i])
+            elif (argList[i][:3] == "-in"):
+                i+=1
+                setup['instances'] = int(argList[i])
+            elif (argList[i][:3] == "-fr"):
+                i+=1
+                setup['frames'] = int(argList[i])
+            elif (argList[i][:3] == "-bl"):
+                i+=1
+                options['blockSize'] = int(argList[i])
+            elif (argList[i][:3] == "-fo"):
+                i+=1
+                options['format'] = argList[i].lower()
+            elif (argList[i][:3] == "-co"):
+                i+=1
+                options['columns'] = [name.strip() for name in argList[i].split(',')]
+            elif (argList[i][:3] == "-cy"):
+                i+=1
+                options['cycle'] = argList[i].lower()
+            elif (argList[i][:3] == "-el"):
+                i+=1
+                options['elset'] = argList[i].upper()
+            elif (argList[i][:3] == "-pr"):
+                options['profile'] = True
+            elif (argList[i][:3] == "-wo"):
+                i+=1
+                options['workers'] = int(argList[i])
+            elif (argList[i][:3] == "-st"):
+                i+=1
+                options['storage'] = argList[i].lower()
+            elif (argList[i][:3] == "-ag"):
+                i+=1
+                options['aggregate'] = argList[i].lower()
+            elif (argList[i][:3] == "-he"):
+                print __doc__
+                exit(0)
+            else:
+                print "***ERROR: Unknown argument %s" %(argList[i])
+                print __doc__
+                exit(1)
+            i+=1
+    except (IndexError, ValueError):
+        print "***ERROR: Arguments are missing or not valid"
+        print __doc__
+        exit(1)
+
+    print 'Benchmark of %s, results appended to %s\n' %(setup['script'], resultsFile)
+    print resultsHeader()
+    benchmark(setup, sizes, repeat, resultsFile)
@@ -0,0 +1,416 @@
+'''
+odbAccess.py (synthetic stand-in)
+=================================
+
+A pure Python / numpy stand-in for the parts of the Abaqus odbAccess module
+used by ivolResults.004.py, so the script can be run and timed without an
+Abaqus license. It is only used by ivolBench.py, which puts this folder first
+on the Python path; it is never imported when running under Abaqus.
+
+Synthetic output databases are created with synthetic(), and registered under
+a file name so that openOdb() finds them:
+
+    import odbAccess
+    odbAccess.synthetic('Job-1.odb', nInstances=1, nEl=2000, nIp=5,
+                        steps=('crimp', 'cycle'), frames=3)
+
+Each frame has LE (logarithmic strain, engineering shear), S, IVOL and SDV21
+field output at the integration points of every part instance. Field data is
+random, generated from the seed when bulkDataBlocks or values are accessed,
+so an output database of millions of integration points takes little memory
+until its fields are read, as with a real ODB. The subset of a field for an
+element set only generates the data of its own integration points.
+
+With coordinates=True, every frame also has COORD output at the integration
+points, and each part instance has nodes and elements: a block of 8 node
+hexahedra of size 0.1, for the -xyz option. With coordinates='mesh', only
+the nodes and elements are created, as for an analysis without COORD output.
+
+Element sets can be added with ElementSetFromElementLabels of a part
+instance or the root assembly. FieldOutput supports getSubset(region=...) by
+part instance or element set,
+addition and subtraction of fields, multiplication by a number,
+getScalarField(invariant=...) with MAX_PRINCIPAL, MIN_PRINCIPAL or PRESS of
+tensors, and bulkDataBlocks. Its values are FieldValue objects with data,
+elementLabel, integrationPoint and instance, and for tensors also
+maxPrincipal, minPrincipal and press.
+
+As in an ODB, data, the results of field arithmetic and invariants are
+single precision, and values return the same numbers as bulkDataBlocks and
+getScalarField (as Python floats).
+'''
+
+# Copyright 2017 Confluent Medical Technologies
+# Released as part of nitinol-design-concepts
+# https://github.com/confluentmedical/nitinol-design-concepts
+# under terms of Apache 2.0 license
+# http://www.apache.org/licenses/LICENSE-2.0.txt
+
+import zlib
+import numpy
+
+odbRegistry = {}
+
+def openOdb(path, readOnly=True):
+    if path not in odbRegistry:
+        raise IOError('no synthetic odb %s' %(path))
+    return odbRegistry[path]
+
+#=================================================================
+# Repository
+# Abaqus repositories behave like dictionaries keyed by name
+
+class Repository(dict):
+    pass
+
+class OdbObject:
+    pass
+
+class OdbInstance:
+
+    def __init__(self, name):
+        self.name = name
+        self.elementSets = Repository()
+        self.nodes = []
+        self.elements = []
+
+    def ElementSetFromElementLabels(self, name, elementLabels):
+        self.elementSets[name] = OdbSet(name, {self.name: numpy.array(elementLabels,
+                                                                      dtype=numpy.int32)})
+        return self.elementSets[name]
+
+class OdbAssembly:
+
+    def __init__(self, instances):
+        self.instances = Repository([(i.name, i) for i in instances])
+        self.elementSets = Repository()
+
+    # elementLabels is a sequence of (instance name, labels)
+    def ElementSetFromElementLabels(self, name, elementLabels):
+        self.elementSets[name] = OdbSet(name, dict([(instanceName, numpy.array(labels,
+                                                     dtype=numpy.int32))
+                                                    for instanceName, labels in elementLabels]))
+        return self.elementSets[name]
+
+class OdbSet:
+
+    def __init__(self, name, members):
+        self.name = name
+        # element labels of the set, for each part instance name
+        self.members = members
+
+class FieldValue:
+    pass
+
+class OdbMeshNode:
+
+    def __init__(self, label, coordinates):
+        self.label = label
+        self.coordinates = coordinates
+
+class OdbMeshElement:
+
+    def __init__(self, label, connectivity):
+        self.label = label
+        self.connectivity = connectivity
+
+class FieldBulkData:
+    pass
+
+#=================================================================
+# FieldOutput
+# blocks is a list of (instance, elementLabels, integrationPoints, getData),
+# where getData() returns the data of the block, rounded to single precision
+# when read, and getData(rows) the data of some rows only. A subset of a
+# field only generates the data of its own rows.
+
+tensorSuffixes = ('11', '22', '33', '12', '13', '23')
+
+class FieldOutput:
+
+    def __init__(self, name, blocks, engineeringShear=False, nComponents=1):
+        self.name = name
+        self.blocks = blocks
+        self.engineeringShear = engineeringShear
+        self.nComponents = nComponents
+        if nComponents > 1:
+            self.componentLabels = tuple([name + suffix for suffix in
+                                          tensorSuffixes[:nComponents]])
+        else:
+            self.componentLabels = ()
+        self.valueList = None
+
+    def derived(self, blocks, nComponents=None):
+        if nComponents is None:
+            nComponents = self.nComponents
+        return FieldOutput(self.name, blocks, self.engineeringShear, nComponents)
+
+    # data is stored in single precision, as in an ODB
+    def bulkDataBlocks(self):
+        result = []
+        for instance, el, ip, getData in self.blocks:
+            block = FieldBulkData()
+            block.instance = instance
+            block.elementLabels = el
+            block.integrationPoints = ip
+            block.data = getData().astype(numpy.float32)
+            block.componentLabels = self.componentLabels
+            result.append(block)
+        return result
+    bulkDataBlocks = property(bulkDataBlocks)
+
+    def values(self):
+        if self.valueList is None:
+            self.valueList = []
+            for instance, el, ip, getData in self.blocks:
+                data = getData().astype(numpy.float32)
+                if self.nComponents > 1:
+                    pMin = tensorInvariant(data, 'MIN_PRINCIPAL', self.engineeringShear)
+                    pMax = tensorInvariant(data, 'MAX_PRINCIPAL', self.engineeringShear)
+                    press = tensorInvariant(data, 'PRESS', self.engineeringShear)
+                for i in range(len(el)):
+                    value = FieldValue()
+                    value.instance = instance
+                    value.elementLabel = int(el[i])
+                    value.integrationPoint = int(ip[i])
+                    value.data = data[i]
+                    if self.nComponents > 1:
+                        value.minPrincipal = float(pMin[i])
+                        value.maxPrincipal = float(pMax[i])
+                        value.press = float(press[i])
+                    else:
+                        value.data = float(data[i])
+                    self.valueList.append(value)
+        return self.valueList
+    values = property(values)
+
+    def getSubset(self, region=None, position=None):
+        blocks = []
+        for instance, el, ip, getData in self.blocks:
+            if isinstance(region, OdbInstance):
+                if instance.name == region.name:
+                    blocks.append((instance, el, ip, getData))
+            else:
+                labels = region.members.get(instance.name)
+                if labels is None:
+                    continue
+                keep = subsetRows(el, labels)
+                blocks.append((instance, el[keep], ip[keep],
+                               lambda rows=None, getData=getData, keep=keep:
+                               getData(subsetOf(keep, rows))))
+        return self.derived(blocks)
+
+    def getScalarField(self, invariant=None, componentLabel=None):
+        if componentLabel is not None:
+            j = list(self.componentLabels).index(componentLabel)
+            select = lambda data: data[:, j]
+        else:
+            select = lambda data, shear=self.engineeringShear:\
+                     tensorInvariant(data, invariant, shear)
+        return self.derived([(instance, el, ip, lambda rows=None, getData=getData:
+                              select(readRows(getData, rows).astype(numpy.float32)))
+                             for instance, el, ip, getData in self.blocks], 1)
+
+    # field arithmetic in single precision
+    def combine(self, other, operation):
+        blocks = []
+        for a, b in zip(self.blocks, other.blocks):
+            blocks.append((a[0], a[1], a[2], lambda rows=None, a=a[3], b=b[3]:
+                           operation(readRows(a, rows).astype(numpy.float32),
+                                     readRows(b, rows).astype(numpy.float32))))
+        return self.derived(blocks)
+
+    def __add__(self, other):
+        return self.combine(other, numpy.add)
+
+    def __sub__(self, other):
+        return self.combine(other, numpy.subtract)
+
+    def __mul__(self, factor):
+        return self.derived([(instance, el, ip, lambda rows=None, getData=getData:
+                              numpy.float32(factor)*readRows(getData, rows).astype(numpy.float32))
+                             for instance, el, ip, getData in self.blocks])
+    __rmul__ = __mul__
+
+# data of some rows of a block, or all of them; getData of a field changed by
+# a test may only take rows in this way
+def readRows(getData, rows):
+    if rows is None:
+        return getData()
+    return getData(rows)
+
+# rows of a block in a set of element labels, in the order of the block
+def subsetRows(el, labels):
+    labels = numpy.unique(labels)
+    if len(el) > 1 and not numpy.all(el[1:] >= el[:-1]):
+        return numpy.nonzero(numpy.in1d(el, labels))[0]
+    # elements are in order, so the rows of each are found by bisection
+    lo = numpy.searchsorted(el, labels, 'left')
+    lengths = numpy.searchsorted(el, labels, 'right') - lo
+    starts = numpy.cumsum(lengths) - lengths
+    return numpy.arange(lengths.sum()) + numpy.repeat(lo - starts, lengths)
+
+def subsetOf(keep, rows):
+    if rows is None:
+        return keep
+    return keep[rows]
+
+#=================================================================
+# tensorInvariant
+# MAX_PRINCIPAL, MIN_PRINCIPAL or PRESS of single precision tensors given as
+# 11, 22, 33, 12, 13, 23, rounded to single precision
+
+def tensorInvariant(data, name, engineeringShear=False):
+    if name == 'PRESS':
+        return (-data[:, :3].astype(numpy.float64).sum(axis=1)/3.0).astype(numpy.float32)
+    principals = principalValues(data, engineeringShear)
+    if name == 'MAX_PRINCIPAL':
+        return principals[:, 2].astype(numpy.float32)
+    if name == 'MIN_PRINCIPAL':
+        return principals[:, 0].astype(numpy.float32)
+    raise ValueError('invariant %s is not supported' %(name))
+
+#=================================================================
+# principalValues
+# Sorted eigenvalues of symmetric tensors given as 11, 22, 33, 12, 13, 23
+
+def principalValues(data, engineeringShear=False):
+    shear = 1.0
+    if engineeringShear:
+        shear = 0.5
+    t = numpy.zeros((len(data), 3, 3))
+    full = numpy.zeros((len(data), 6))
+    full[:, :data.shape[1]] = data
+    for k, (i, j) in enumerate([(0, 0), (1, 1), (2, 2)]):
+        t[:, i, j] = full[:, k]
+    for k, (i, j) in enumerate([(0, 1), (0, 2), (1, 2)]):
+        t[:, i, j] = t[:, j, i] = shear*full[:, 3 + k]
+    return numpy.linalg.eigvalsh(t)
+
+#=================================================================
+# synthetic
+# Create and register a synthetic odb. Element labels 1..nEl with nIp
+# integration points each, in every part instance. The element set HALF
+# holds the first half of the elements of the first instance.
+
+fieldScales = {'LE': 0.01, 'S': 300.0, 'IVOL': 1e-3, 'SDV21': 1.0}
+
+# rows of random data generated together, from a stream of their own, and
+# stored in single precision
+chunkRows = 4096
+
+def randomData(seed, name, stepName, frameIndex, instanceName, n, rows=None):
+    stream = '%s/%s/%s/%i/%s' %(seed, name, stepName, frameIndex, instanceName)
+    if rows is None:
+        rows = slice(None)
+        chunks = range((n + chunkRows - 1)//chunkRows)
+        nRows = n
+    else:
+        rows = numpy.asarray(rows)
+        chunks = numpy.unique(rows//chunkRows)
+        nRows = len(rows)
+    result = numpy.zeros((nRows,) + randomChunk(stream, name, 0, 0).shape[1:],
+                         dtype=numpy.float32)
+    # only the chunks holding the rows are generated
+    for k in chunks:
+        chunk = randomChunk(stream, name, k, min(chunkRows, n - k*chunkRows))
+        if isinstance(rows, slice):
+            result[k*chunkRows:k*chunkRows + len(chunk)] = chunk
+        else:
+            at = numpy.nonzero(rows//chunkRows == k)[0]
+            result[at] = chunk[rows[at] - k*chunkRows]
+    return result
+
+def randomChunk(stream, name, k, size):
+    rs = numpy.random.RandomState(zlib.crc32('%s/%i' %(stream, k)) & 0x7fffffff)
+    if name == 'COORD':
+        return rs.random_sample((size, 3))
+    if name in ('LE', 'S'):
+        return rs.standard_normal((size, 6))*fieldScales[name]
+    return rs.random_sample(size)*fieldScales[name]
+
+def synthetic(path, nEl=2000, nIp=5, steps=('crimp', 'cycle'), frames=3,
+              nInstances=1, instanceNames=None, seed=1, coordinates=False):
+    if instanceNames is None:
+        instanceNames = ['PART-%i-1' %(i + 1) for i in range(nInstances)]
+    instances = [OdbInstance(name) for name in instanceNames]
+    el = numpy.repeat(numpy.arange(1, nEl + 1, dtype=numpy.int32), nIp)
+    ip = numpy.tile(numpy.arange(1, nIp + 1, dtype=numpy.int32), nEl)
+    fieldNames = ['LE', 'S', 'IVOL', 'SDV21']
+    if coordinates:
+        centroids = hexMesh(instances, nEl)
+        if coordinates != 'mesh':
+            fieldNames.append('COORD')
+
+    odb = OdbObject()
+    odb.name = path
+    odb.steps = Repository()
+    for stepName in steps:
+        step = OdbObject()
+        step.name = stepName
+        step.frames = []
+        for frameIndex in range(frames):
+            frame = OdbObject()
+            frame.frameId = frameIndex
+            frame.fieldOutputs = Repository()
+            for name in fieldNames:
+                blocks = []
+                for instance in instances:
+                    getData = lambda rows=None, name=name, stepName=stepName,\
+                              frameIndex=frameIndex, instanceName=instance.name:\
+                              randomData(seed, name, stepName, frameIndex, instanceName,
+                                         len(el), rows)
+                    if name == 'COORD':
+                        # integration points within their element, displaced
+                        # a little in each frame
+                        getData = lambda rows=None, getData=getData, frameIndex=frameIndex:\
+                                  pointCentroids(centroids, nIp, rows) +\
+                                  0.04*(getData(rows) - 0.5) + 0.01*frameIndex
+                    blocks.append((instance, el, ip, getData))
+                nComponents = 1
+                if name in ('LE', 'S'):
+                    nComponents = 6
+                elif name == 'COORD':
+                    nComponents = 3
+                frame.fieldOutputs[name] = FieldOutput(name, blocks, name == 'LE', nComponents)
+                if name == 'COORD':
+                    frame.fieldOutputs[name].componentLabels = ('COOR1', 'COOR2', 'COOR3')
+            step.frames.append(frame)
+        odb.steps[stepName] = step
+
+    odb.rootAssembly = OdbAssembly(instances)
+    half = numpy.arange(1, nEl//2 + 1, dtype=numpy.int32)
+    instances[0].elementSets['HALF'] = OdbSet('HALF', {instances[0].name: half})
+    odb.close = lambda: None
+    odbRegistry[path] = odb
+    return odb
+
+# centroid of the element of each row, or of the given rows
+def pointCentroids(centroids, nIp, rows=None):
+    if rows is None:
+        return numpy.repeat(centroids, nIp, axis=0)
+    return centroids[numpy.asarray(rows)//nIp]
+
+#=================================================================
+# hexMesh
+# Nodes and elements 1..nEl of a block of hexahedra of size 0.1, the same in
+# every part instance. Returns the element centroids.
+
+def hexMesh(instances, nEl, size=0.1):
+    n = int(numpy.ceil(nEl**(1.0/3.0)))
+    e = numpy.arange(nEl)
+    ijk = numpy.column_stack((e//(n*n), (e//n) % n, e % n))
+    def nodeLabel(i, j, k):
+        return (i*(n + 1) + j)*(n + 1) + k + 1
+    corners = [(0, 0, 0), (1, 0, 0), (1, 1, 0), (0, 1, 0),
+               (0, 0, 1), (1, 0, 1), (1, 1, 1), (0, 1, 1)]
+    connectivity = numpy.column_stack([nodeLabel(ijk[:,0] + a, ijk[:,1] + b, ijk[:,2] + c)
+                                       for a, b, c in corners])
+    g = numpy.arange(n + 1)
+    grid = numpy.array(numpy.meshgrid(g, g, g, indexing='ij')).reshape(3, -1).T
+    for instance in instances:
+        instance.nodes = [OdbMeshNode(int(nodeLabel(i, j, k)), tuple(size*numpy.array((i, j, k))))
+                          for i, j, k in grid]
+        instance.elements = [OdbMeshElement(int(e[m]) + 1, tuple(connectivity[m].tolist()))
+                             for m in range(nEl)]
+    return size*(ijk + 0.5)
@@ -7,3 +7,9 @@
 # http://www.apache.org/licenses/LICENSE-2.0.txt
 
 abq2017 python ivolResults.004.py -odb open-frame-fatigue-v25mm-9pct.odb -pa D101-ASCUT-FRAME-1 -cr crimp-10mm -la diastole-03
+
+# For a design study with many ODBs, list them in a manifest CSV file (columns
+# odb, partInstance, crimpStepName, lastStepName) and run them four at a time:
+# abq2017 python ivolBatch.py -manifest ivolBatch.csv -workers 4
+# or run every ODB matching a pattern with the same parameters:
+# abq2017 python ivolBatch.py -odb "open-frame-fatigue-*.odb" -pa D101-ASCUT-FRAME-1 -cr crimp-10mm -la diastole-03 -workers 4
@@ -0,0 +1,485 @@
+'''
+ivolBatch.py
+============
+
+Run ivolResults.004.py on many output databases, several at a time. Each ODB
+is processed by outputToText in a separate worker process, failed jobs are
+retried, and a summary of the run is written to a CSV file.
+
+Usage: abaqus python ivolBatch.py
+      -manifest manifestFile | -odbName "pattern*.odb"
+      [-oldOdb crimpOdbName]
+      [-partInstance partInstanceName]
+      [-crimpStepName crimpStepName]
+      [-lastStepName lastStepName]
+      [-workers n]  (worker processes, default 1)
+      [-retries n]  (retries of a failed job, default 1)
+      [-timeout hours]  (time limit of each job, default 24)
+      [-overwrite yes]
+      [-summary summaryFile]  (default ivolBatch.summary.csv)
+      [-elset elementSetName]
+      [-blockSize n]
+      [-format csv|npy|both]
+      [-columns name,name,...]
+      [-cache cacheFolder]
+      [-maxCache MB]
+      [-cycle ends|full]
+      [-profile]
+      [-volumes]
+      [-symmetry n]
+      [-topK n]
+      [-rankBy cycEA|cycSA|cycTau]
+      [-xyz crimp,load,unload]
+      [-update]  (skip jobs whose results are up to date, and replace others)
+      [-storage full|compact]
+      [-aggregate element]
+      [-gumbel parameterFile]
+
+The manifest is a CSV file with a header line naming its columns, and one
+line per job, for example:
+
+    odb, partInstance, crimpStepName, lastStepName
+    open-frame-fatigue-v25mm-9pct.odb, D101-ASCUT-FRAME-1, crimp-10mm, diastole-03
+    open-frame-fatigue-v25mm-12pct.odb, D101-ASCUT-FRAME-1, crimp-10mm, diastole-03
+
+The odb column is required. Optional columns are oldOdb, partInstance,
+crimpStepName, lastStepName, elset and outputFile; blank or missing values
+are taken from the command line. Lines starting with # are ignored. Instead
+of a manifest, "-odbName" may be a pattern with wildcards, and every
+matching ODB uses the parameters from the command line. Options after
+-elset apply to every job, as described in ivolResults.004.py.
+
+Each worker runs one job at a time, and is replaced by a new process after
+each job, so memory is returned and ODBs are closed between jobs. Every
+worker uses Abaqus licence tokens while it runs, so set -workers to stay
+within the licence token limit. Messages from each job are written to a log
+file next to its results, ending in .ivol.log, instead of the screen.
+
+Jobs whose results file already exists are skipped unless "-overwrite yes"
+is given; no job ever prompts for a file name. A job that fails (an error
+message, or an exception) is run again up to -retries more times. A job
+that has not finished -timeout hours after its worker started it, e.g.
+because Abaqus crashed or the operating system stopped its worker process
+for lack of memory, is failed too; once every job has finished or failed,
+the workers of any such job are stopped, and it is retried with the others.
+Jobs still waiting to start when every worker has such a job fail with
+them. The summary file lists each job with its status (done, skipped or
+failed), attempts, run time, files written and any error message.
+
+With "-update", jobs are skipped only if the manifest written with their
+results (see ivolResults.004.py) shows they are up to date with the ODBs,
+script version and options; other results are replaced. A nightly run over
+a folder of ODBs then only extracts new or changed ODBs, and a batch that
+was interrupted continues with the jobs not yet done.
+'''
+
+# Copyright 2017 Confluent Medical Technologies
+# Released as part of nitinol-design-concepts
+# https://github.com/confluentmedical/nitinol-design-concepts
+# under terms of Apache 2.0 license
+# http://www.apache.org/licenses/LICENSE-2.0.txt
+
+import os
+import sys
+import csv
+import imp
+import glob
+import time
+import traceback
+import multiprocessing
+from sys import argv, exit
+
+# ivolResults.004.py cannot be imported by name because of the dots
+ivolResults = imp.load_source('ivolResults', os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), 'ivolResults.004.py'))
+
+jobKeys = ['odb', 'oldOdb', 'partInstance', 'crimpStepName', 'lastStepName',
+           'elset', 'outputFile']
+summaryKeys = ['odb', 'lastStepName', 'status', 'attempts', 'seconds',
+               'files', 'message']
+
+# seconds between checks of jobs that may have timed out
+pollSeconds = 1.0
+
+#=================================================================
+# readManifest
+# Jobs from a manifest CSV file, as dictionaries with the keys in jobKeys.
+# Blank or missing values are taken from defaults.
+
+def readManifest(manifestFile, defaults):
+    f = open(manifestFile, 'rb')
+    lines = [line for line in f if line.strip() and not line.lstrip().startswith('#')]
+    f.close()
+    reader = csv.reader(lines, skipinitialspace=True)
+    header = [name.strip() for name in reader.next()]
+    unknown = [name for name in header if name not in jobKeys]
+    if 'odb' not in header or unknown:
+        raise ValueError('manifest %s needs an odb column, and may also have %s; '
+                         'not %s' %(manifestFile, ', '.join(jobKeys[1:]), unknown))
+    jobs = []
+    for row in reader:
+        job = dict(defaults)
+        for name, value in zip(header, row):
+            if value.strip():
+                job[name] = value.strip()
+        jobs.append(job)
+    return jobs
+
+#=================================================================
+# completeJob
+# Check a job has the required parameters, and complete the ODB and output
+# file names as ivolResults.004.py does from the command line
+
+def completeJob(job):
+    missing = [key for key in ('odb', 'partInstance', 'crimpStepName', 'lastStepName')
+               if not job.get(key)]
+    if missing:
+        raise ValueError('job %s is missing %s' %(job.get('odb'), ', '.join(missing)))
+    job['odb'] = ivolResults.rightTrim(job['odb'], '.odb')
+    if job.get('oldOdb'):
+        job['oldOdb'] = ivolResults.rightTrim(job['oldOdb'], '.odb')
+    else:
+        job['oldOdb'] = None
+    # part instance and set names are upper case in the odb
+    job['partInstance'] = job['partInstance'].upper()
+    if job.get('elset'):
+        job['elset'] = job['elset'].upper()
+    if not job.get('outputFile'):
+        job['outputFile'] = job['odb'][:-4] + '.ivol.csv'
+    return job
+
+#=================================================================
+# outputExists
+# True if the results of a single step job already exist. Jobs with several
+# steps are checked for each step by outputToText.
+
+def outputExists(job, options):
+    outputFile = job['outputFile']
+    outputFormat = options.get('format', 'csv')
+    if outputFormat in ('csv', 'both') and os.path.isfile(outputFile):
+        return True
+    if outputFormat in ('npy', 'both') and os.path.isdir(ivolResults.binaryName(outputFile)):
+        return True
+    return False
+
+#=================================================================
+# jobArguments
+# Parameter list and options of outputToText for a job
+
+def jobArguments(job, options):
+    jobOptions = dict(options)
+    if job.get('elset'):
+        jobOptions['elset'] = job['elset']
+    paramList = [job['odb'], job['oldOdb'], job['partInstance'],
+                 job['crimpStepName'], job['lastStepName'], job['outputFile']]
+    return paramList, jobOptions
+
+#=================================================================
+# runJob
+# Run outputToText for one job in a worker process, with its messages
+# written to a log file. Returns a dictionary with the keys in summaryKeys.
+# The time the job starts is recorded in jobStarts, shared with the
+# process running the batch, which times each job from its start.
+
+jobStarts = None
+
+def initWorker(starts):
+    global jobStarts
+    jobStarts = starts
+
+def runJob(args):
+    job, options, attempt, index = args
+    result = {'odb': job['odb'], 'lastStepName': job['lastStepName'],
+              'attempts': attempt, 'files': '', 'message': ''}
+    started = time.time()
+    if jobStarts is not None:
+        jobStarts[index] = started
+    logFile = job['outputFile']
+    if logFile.endswith('.csv'):
+        logFile = logFile[:-4]
+    logFile = logFile + '.log'
+    log = open(logFile, 'a')
+    stdout = sys.stdout
+    sys.stdout = log
+    try:
+        try:
+            print '\n===== %s attempt %i of %s' %(time.ctime(), attempt, job['odb'])
+            paramList, jobOptions = jobArguments(job, options)
+            written = ivolResults.outputToText(paramList, jobOptions)
+            if written is None:
+                result['status'] = 'failed'
+                result['message'] = 'error reported in %s' %(logFile)
+            else:
+                result['status'] = 'done'
+                result['files'] = ' '.join(written)
+        except Exception, e:
+            traceback.print_exc(file=log)
+            result['status'] = 'failed'
+            result['message'] = '%s: %s' %(e.__class__.__name__, e)
+    finally:
+        sys.stdout = stdout
+        log.close()
+    result['seconds'] = round(time.time() - started, 1)
+    return result
+
+#=================================================================
+# runBatch
+# Run jobs on a pool of worker processes, retrying failed jobs. Returns a
+# list of results in the order of the jobs.
+
+def runBatch(jobs, options, workers=1, retries=1, timeout=24.0):
+    results = [None]*len(jobs)
+    pending = []
+    for i, job in enumerate(jobs):
+        if options.get('update'):
+            # jobs done by an earlier (e.g. interrupted) run are not run again
+            if ivolResults.upToDate(*jobArguments(job, options)) is not None:
+                results[i] = {'odb': job['odb'], 'lastStepName': job['lastStepName'],
+                              'status': 'skipped', 'attempts': 0, 'seconds': 0,
+                              'files': '', 'message': 'results up to date'}
+                print 'skipped %s (results up to date)' %(job['odb'])
+            else:
+                pending.append(i)
+        elif not options.get('overwrite') and outputExists(job, options):
+            results[i] = {'odb': job['odb'], 'lastStepName': job['lastStepName'],
+                          'status': 'skipped', 'attempts': 0, 'seconds': 0,
+                          'files': '', 'message': 'results file exists'}
+            print 'skipped %s (results file exists)' %(job['odb'])
+        else:
+            pending.append(i)
+
+    attempt = 1
+    finished = len(jobs) - len(pending)
+    limit = timeout*3600.0
+    while pending and attempt <= retries + 1:
+        # a new worker process for every job, so each starts clean
+        nWorkers = min(workers, len(pending))
+        starts = multiprocessing.Array('d', len(jobs), lock=False)
+        pool = multiprocessing.Pool(nWorkers, initWorker, (starts,), maxtasksperchild=1)
+        try:
+            tasks = [(i, pool.apply_async(runJob, ((jobs[i], options, attempt, i),)))
+                     for i in pending]
+            pool.close()
+            failed = []
+            timedOut = False
+            for i, task in tasks:
+                # jobs start in order, so an earlier job times out first
+                result = waitJob(i, task, tasks, starts, limit, nWorkers)
+                if result is None:
+                    # the result of a worker that died never arrives
+                    timedOut = True
+                    result = {'odb': jobs[i]['odb'],
+                              'lastStepName': jobs[i]['lastStepName'],
+                              'status': 'failed', 'attempts': attempt, 'files': '',
+                              'seconds': 0,
+                              'message': 'not started; every worker process had a '
+                                         'job with no result after %g hours' %(timeout)}
+                    if starts[i]:
+                        result['seconds'] = round(time.time() - starts[i], 1)
+                        result['message'] = 'no result after %g hours; the worker '\
+                                            'process may have stopped' %(timeout)
+                results[i] = result
+                if result['status'] == 'failed':
+                    failed.append(i)
+                else:
+                    finished += 1
+                print '[%i/%i] %s %s (%.1f s)' %(finished, len(jobs), result['status'],
+                                                 result['odb'], result['seconds'])
+            if timedOut:
+                pool.terminate()
+            else:
+                pool.join()
+        except KeyboardInterrupt:
+            pool.terminate()
+            raise
+        pending = failed
+        attempt += 1
+    return results
+
+#=================================================================
+# waitJob
+# Result of the task of job i, or None if it has had no result limit seconds
+# after it started, or cannot start because every worker has such a job
+
+def waitJob(i, task, tasks, starts, limit, nWorkers):
+    while not task.ready():
+        now = time.time()
+        if starts[i]:
+            if now >= starts[i] + limit:
+                return None
+            task.wait(min(pollSeconds, starts[i] + limit - now))
+        else:
+            hung = [k for k, t in tasks
+                    if starts[k] and now >= starts[k] + limit and not t.ready()]
+            if len(hung) >= nWorkers:
+                return None
+            task.wait(pollSeconds)
+    return task.get()
+
+#=================================================================
+# writeSummary
+# Write results of the batch run to a CSV file, and totals to the screen
+
+def writeSummary(summaryFile, results):
+    f = open(summaryFile, 'wb')
+    writer = csv.writer(f)
+    writer.writerow(summaryKeys)
+    for result in results:
+        writer.writerow([result[key] for key in summaryKeys])
+    f.close()
+
+    counts = {'done': 0, 'skipped': 0, 'failed': 0}
+    for result in results:
+        counts[result['status']] += 1
+    seconds = sum([result['seconds'] for result in results])
+    print '\n%i jobs: %i done, %i skipped, %i failed, %.1f s total job time' %(
+        len(results), counts['done'], counts['skipped'], counts['failed'], seconds)
+    for result in results:
+        if result['status'] == 'failed':
+            print '  failed: %s (%s)' %(result['odb'], result['message'])
+    print 'Summary written to the file: %s\n' %(summaryFile)
+    return counts
+
+#==================================================================
+# S T A R T
+#
+if __name__ == '__main__':
+
+    # initialize parameters
+    manifestFile = None
+    defaults = {}
+    options = {'overwrite': False}
+    workers = 1
+    retries = 1
+    timeout = 24.0
+    summaryFile = 'ivolBatch.summary.csv'
+
+    # parse the parameters from the argument list
+    argList = argv
+    argCount = len(argList)
+    i=1
+    try:
+        while (i < argCount):
+            if (argList[i][:3] == "-mf" or argList[i][:4] == "-man"):
+                i+=1
+                manifestFile = argList[i]
+            elif (argList[i][:3] == "-od"):
+                i+=1
+                defaults['odb'] = argList[i]
+            elif (argList[i][:3] == "-ol"):
+                i+=1
+                defaults['oldOdb'] = argList[i]
+            elif (argList[i][:3] == "-pa"):
+                i+=1
+                defaults['partInstance'] = argList[i]
+            elif (argList[i][:3] == "-cr"):
+                i+=1
+                defaults['crimpStepName'] = argList[i]
+            elif (argList[i][:3] == "-la"):
+                i+=1
+                defaults['lastStepName'] = argList[i]
+            elif (argList[i][:3] == "-el"):
+                i+=1
+                defaults['elset'] = argList[i]
+            elif (argList[i][:3] == "-wo"):
+                i+=1
+                workers = int(argList[i])
+            elif (argList[i][:3] == "-re"):
+                i+=1
+                retries = int(argList[i])
+            elif (argList[i][:3] == "-ti"):
+                i+=1
+                timeout = float(argList[i])
+            elif (argList[i][:3] == "-su"):
+                i+=1
+                summaryFile = argList[i]
+            elif (argList[i][:3] == "-ov"):
+                i+=1
+                options['overwrite'] = argList[i] in ['Y', 'y', 'Yes', 'yes', 'T', 'True', 'TRUE']
+            elif (argList[i][:3] == "-bl"):
+                i+=1
+                options['blockSize'] = int(argList[i])
+            elif (argList[i][:3] == "-fo"):
+                i+=1
+                options['format'] = argList[i].lower()
+            elif (argList[i][:3] == "-ca"):
+                i+=1
+                options['cache'] = argList[i]
+            elif (argList[i][:4] == "-max"):
+                i+=1
+                options['maxCache'] = float(argList[i])
+            elif (argList[i][:3] == "-cy"):
+                i+=1
+                options['cycle'] = argList[i].lower()
+            elif (argList[i][:3] == "-co"):
+                i+=1
+                options['columns'] = [name.strip() for name in argList[i].split(',')]
+            elif (argList[i][:3] == "-pr"):
+                options['profile'] = True
+            elif (argList[i][:3] == "-vo"):
+                options['volumes'] = True
+            elif (argList[i][:3] == "-sy"):
+                i+=1
+                options['symmetry'] = float(argList[i])
+            elif (argList[i][:3] == "-to"):
+                i+=1
+                options['topK'] = int(argList[i])
+            elif (argList[i][:3] == "-ra"):
+                i+=1
+                options['rankBy'] = argList[i]
+            elif (argList[i][:3] == "-up"):
+                options['update'] = True
+            elif (argList[i][:3] == "-st"):
+                i+=1
+                options['storage'] = argList[i].lower()
+            elif (argList[i][:3] == "-gu"):
+                i+=1
+                options['gumbel'] = argList[i]
+            elif (argList[i][:3] == "-ag"):
+                i+=1
+                options['aggregate'] = argList[i].lower()
+            elif (argList[i][:3] == "-xy"):
+                i+=1
+                options['xyz'] = [name.strip().lower() for name in argList[i].split(',')]
+            elif (argList[i][:3] == "-he"):
+                print __doc__
+                exit(0)
+            else:
+                print "***ERROR: Unknown argument %s" %(argList[i])
+                print __doc__
+                exit(1)
+            i+=1
+    except IndexError:
+        print "***ERROR: All required arguments are not provided"
+        print __doc__
+        exit(1)
+
+    try:
+        if manifestFile != None:
+            odbPattern = defaults.pop('odb', None)
+            jobs = readManifest(manifestFile, defaults)
+        elif 'odb' in defaults:
+            odbPattern = defaults.pop('odb')
+            jobs = [dict(defaults, odb=name) for name in sorted(glob.glob(odbPattern))]
+            if not jobs:
+                print "***ERROR: No ODB matches %s" %(odbPattern)
+                exit(1)
+        else:
+            print "***ERROR: A manifest or odbName pattern is required"
+            print __doc__
+            exit(1)
+        jobs = [completeJob(job) for job in jobs]
+    except (IOError, ValueError), e:
+        print "***ERROR: %s" %(e)
+        exit(1)
+
+    if workers < 1 or retries < 0 or timeout <= 0:
+        print "***ERROR: -workers must be at least 1, -retries at least 0, " \
+              "and -timeout more than 0"
+        exit(1)
+
+    print 'Running %i jobs on %i worker processes\n' %(len(jobs), min(workers, len(jobs)))
+    results = runBatch(jobs, options, workers, retries, timeout)
+    counts = writeSummary(summaryFile, results)
+    if counts['failed']:
+        exit(1)
@@ -0,0 +1,223 @@
+'''
+ivolClient.py
+=============
+
+Query a running ivolServer.py for results columns of an ODB, as numpy arrays,
+without starting Abaqus or opening the ODB for each query. Runs in any Python
+with numpy.
+
+Usage (from Python, with numpy):
+    from ivolClient import IvolClient
+    client = IvolClient(port=8765)
+    data, header = client.extract(odb='open-frame-fatigue-v25mm-9pct.odb',
+                                  partInstance='D101-ASCUT-FRAME-1',
+                                  crimpStepName='crimp-10mm',
+                                  lastStepName='diastole-03',
+                                  columns=['cycEA', 'cycSA', 'ldV'])
+    client.close()
+
+data is a dictionary of column arrays (el and ip are always included), and
+header has the number of rows, the column names, types and shapes, the time
+taken by the server and the number of fields found in its cache. Other
+arguments of extract are frames (load and unload frame indexes of
+lastStepName, default [0, -1]), crimpFrame (default -1), oldOdb, elset and
+cycle (ends or full), as in ivolResults.004.py. Errors of the server, e.g. an
+unknown step, are raised as IvolServerError with the server's message.
+
+Usage (command line):
+    python ivolClient.py -odbName odbName -partInstance partInstanceName
+      -crimpStepName crimpStepName -lastStepName lastStepName
+      [-oldOdb crimpOdbName] [-elset elementSetName] [-columns name,name,...]
+      [-frames load,unload] [-cycle ends|full]
+      [-port n]  (default 8765)
+      [-output file.npz]  (save the columns)
+    python ivolClient.py -status | -shutdown [-port n]
+
+Messages in both directions are a 4 byte (big endian) length, a JSON header of
+that length, and for results the bytes of each column in the order of the
+arrays of the header (name, type and shape of each column).
+'''
+
+# Copyright 2017 Confluent Medical Technologies
+# Released as part of nitinol-design-concepts
+# https://github.com/confluentmedical/nitinol-design-concepts
+# under terms of Apache 2.0 license
+# http://www.apache.org/licenses/LICENSE-2.0.txt
+
+import sys
+import json
+import time
+import socket
+import struct
+import numpy
+
+defaultPort = 8765
+
+class IvolServerError(Exception):
+    pass
+
+#=================================================================
+# sendMessage, receiveMessage
+# A JSON header, and arrays whose type and shape are described by the
+# arrays of the header
+
+def sendMessage(sock, header, arrays=()):
+    text = json.dumps(header).encode('utf-8')
+    sock.sendall(struct.pack('!I', len(text)) + text)
+    for array in arrays:
+        sock.sendall(numpy.ascontiguousarray(array).data)
+
+def receiveExactly(sock, n):
+    data = bytearray(n)
+    view = memoryview(data)
+    received = 0
+    while received < n:
+        count = sock.recv_into(view[received:], min(n - received, 1 << 22))
+        if count == 0:
+            raise EOFError('connection closed')
+        received += count
+    return data
+
+def receiveMessage(sock):
+    length, = struct.unpack('!I', bytes(receiveExactly(sock, 4)))
+    header = json.loads(bytes(receiveExactly(sock, length)).decode('utf-8'))
+    arrays = []
+    for column in header.get('arrays', []):
+        dtype = numpy.dtype(str(column['dtype']))
+        count = int(numpy.prod(column['shape']))
+        if count == 0:
+            arrays.append(numpy.zeros(column['shape'], dtype=dtype))
+            continue
+        data = receiveExactly(sock, count*dtype.itemsize)
+        arrays.append(numpy.frombuffer(data, dtype=dtype).reshape(column['shape']))
+    return header, arrays
+
+#=================================================================
+# IvolClient
+# Connection to a server on this computer, kept open for many queries
+
+class IvolClient:
+
+    def __init__(self, port=defaultPort, host='127.0.0.1'):
+        self.sock = socket.create_connection((host, port))
+
+    def request(self, header):
+        sendMessage(self.sock, header)
+        response, arrays = receiveMessage(self.sock)
+        if response.get('status') != 'ok':
+            raise IvolServerError(response.get('message'))
+        return response, arrays
+
+    def extract(self, odb, partInstance, crimpStepName, lastStepName, columns=None,
+                **options):
+        header = dict(options, command='extract', odb=odb, partInstance=partInstance,
+                      crimpStepName=crimpStepName, lastStepName=lastStepName,
+                      columns=columns)
+        response, arrays = self.request(header)
+        data = dict([(column['name'], array)
+                     for column, array in zip(response['arrays'], arrays)])
+        return data, response
+
+    def status(self):
+        return self.request({'command': 'status'})[0]
+
+    def closeOdb(self, odb):
+        return self.request({'command': 'close', 'odb': odb})[0]
+
+    def shutdown(self):
+        return self.request({'command': 'shutdown'})[0]
+
+    def close(self):
+        self.sock.close()
+
+#==================================================================
+# S T A R T
+#
+if __name__ == '__main__':
+
+    port = defaultPort
+    command = 'extract'
+    outputFile = None
+    request = {}
+    argList = sys.argv
+    argCount = len(argList)
+    i=1
+    try:
+        while (i < argCount):
+            if (argList[i][:3] == "-od"):
+                i+=1
+                request['odb'] = argList[i]
+            elif (argList[i][:3] == "-ol"):
+                i+=1
+                request['oldOdb'] = argList[i]
+            elif (argList[i][:3] == "-pa"):
+                i+=1
+                request['partInstance'] = argList[i].upper()
+            elif (argList[i][:3] == "-cr"):
+                i+=1
+                request['crimpStepName'] = argList[i]
+            elif (argList[i][:3] == "-la"):
+                i+=1
+                request['lastStepName'] = argList[i]
+            elif (argList[i][:3] == "-el"):
+                i+=1
+                request['elset'] = argList[i].upper()
+            elif (argList[i][:3] == "-co"):
+                i+=1
+                request['columns'] = [name.strip() for name in argList[i].split(',')]
+            elif (argList[i][:3] == "-fr"):
+                i+=1
+                request['frames'] = [int(frame) for frame in argList[i].split(',')]
+            elif (argList[i][:3] == "-cy"):
+                i+=1
+                request['cycle'] = argList[i].lower()
+            elif (argList[i][:3] == "-po"):
+                i+=1
+                port = int(argList[i])
+            elif (argList[i][:3] == "-ou"):
+                i+=1
+                outputFile = argList[i]
+            elif (argList[i][:3] == "-st"):
+                command = 'status'
+            elif (argList[i][:3] == "-sh"):
+                command = 'shutdown'
+            elif (argList[i][:3] == "-he"):
+                sys.stdout.write(__doc__)
+                sys.exit(0)
+            else:
+                sys.stdout.write("***ERROR: Unknown argument %s\n" %(argList[i]))
+                sys.stdout.write(__doc__)
+                sys.exit(1)
+            i+=1
+    except (IndexError, ValueError):
+        sys.stdout.write("***ERROR: Arguments are missing or not valid\n")
+        sys.stdout.write(__doc__)
+        sys.exit(1)
+
+    try:
+        client = IvolClient(port)
+    except socket.error as e:
+        sys.stdout.write("***ERROR: No ivolServer.py on port %i (%s)\n" %(port, e))
+        sys.exit(1)
+    try:
+        if command != 'extract':
+            response = client.request({'command': command})[0]
+            sys.stdout.write(json.dumps(response, indent=2, sort_keys=True) + '\n')
+        else:
+            started = time.time()
+            request['command'] = 'extract'
+            response, arrays = client.request(request)
+            sys.stdout.write('%i rows of %s in %.2f seconds (%.2f on the server, '
+                             '%i of %i fields cached)\n' %(
+                response['nRows'], ', '.join([c['name'] for c in response['arrays']]),
+                time.time() - started, response['seconds'], response['fieldsCached'],
+                response['fieldsRead']))
+            if outputFile:
+                numpy.savez(outputFile, **dict([(str(c['name']), a) for c, a in
+                                                zip(response['arrays'], arrays)]))
+                sys.stdout.write('Columns written to %s\n' %(outputFile))
+    except IvolServerError as e:
+        sys.stdout.write('%s\n' %(e))
+        sys.exit(1)
+    finally:
+        client.close()
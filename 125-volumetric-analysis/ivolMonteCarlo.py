@@ -0,0 +1,423 @@
+'''
+ivolMonteCarlo.py
+=================
+
+Monte-Carlo estimate of stress intensity factor K and its cyclic change dK,
+combining the volumetric FEA results of ivolResults.004.py with the
+volumetric density and Gumbel size distribution of inclusions from XCT scans,
+as in ../215-monte-carlo/monte-carlo-xct-fea.R. Rows are appended to a .mc.csv
+file with the same columns, for monte-carlo-visualize.R.
+
+Usage: python ivolMonteCarlo.py
+      -results resultsFile  (.ivol.csv file or .ivol folder of ivolResults.004.py)
+      [-material eli|se508]  (default eli)
+      [-gumbel parameterFile]  (gumbel-parameters.json of xctGumbel.py)
+      [-runs n]  (Monte-Carlo runs, default 10)
+      [-first n]  (number of the first run, default 1)
+      [-seed n]  (random number seed, default 42)
+      [-symmetry n]  (volume symmetry factor, default 1)
+      [-ident modelIdent]  (model ident written in each row, default OF-2017-01)
+      [-output mcFile]  (default: the results file name ending in .mc.csv)
+      [-workers n]  (worker processes, default 1)
+      [-batch n]  (runs calculated together by a worker, default 1e6 points)
+
+Each run assigns an integer number of inclusions to every integration point,
+rounding iProb = probV*cycV up or down at random with the probability of its
+fractional part, where cycV is the mean of ldV and ulV times the symmetry
+factor. Points with inclusions get the root area size of their largest
+inclusion in each plane from the Gumbel quantile function, and K and dK in
+each direction from the tensile stresses of the loading and unloading frames
+(ldS11..ldS33, ulS11..ulS33). Each run writes the median and 99th percentile
+of dK33 and K33, and for the point of largest dK in each direction its strain
+and stress amplitudes, defect size, stress range, dK and K, and the largest K
+in that direction, to 4 significant digits.
+
+The random numbers of each run come from their own stream, seeded by -seed
+and the run number, so results do not depend on -workers or -batch, and
+another set of runs can be added with -first. Runs are calculated in
+batches of -batch runs, as arrays of runs by integration points, by -workers
+processes, and rows are appended to the output file in run order as
+batches finish. The largest of n uniform random numbers is drawn directly as
+U**(1/n), rather than as n numbers.
+
+Material parameters are read from the gumbel-parameters.json file written
+by ../210-xct-methods/xctGumbel.py given with -gumbel, or else from the file
+recorded by ivolResults.004.py -gumbel (in the manifest of CSV results, or
+the summary.json of binary results), or else are those of
+monte-carlo-xct-fea.R (in materials below). A warning is printed if the
+file recorded in the results has changed since.
+
+From Python, with numpy, results already in memory can be used directly:
+    from ivolRead import readIvol
+    from ivolMonteCarlo import monteCarlo, materials
+    data, meta = readIvol('open-frame-fatigue-v25mm-9pct.ivol')
+    for row in monteCarlo(data, materials['eli'], runs=1000, symmetry=16):
+        print row
+data is a dictionary of column arrays, with the columns in requiredColumns.
+'''
+
+# Copyright 2017 Confluent Medical Technologies
+# Released as part of nitinol-design-concepts
+# https://github.com/confluentmedical/nitinol-design-concepts
+# under terms of Apache 2.0 license
+# http://www.apache.org/licenses/LICENSE-2.0.txt
+
+import os
+import sys
+import math
+import time
+import json
+import hashlib
+import numpy
+import multiprocessing
+from sys import argv, exit
+
+from ivolRead import readIvol
+
+#=================================================================
+# materials
+# Volumetric probability of inclusions probV (particles per mm^3) and Gumbel
+# parameters of root area inclusion size (micron) in each plane, from
+# ../210-xct-methods/out/gumbel-parameters.csv
+
+materials = {
+    'se508': {'probV': 7474.7403,
+              'id': 'se508',
+              'cutoff': 8,
+              'xy': {'mu': 2.836400, 's': 1.3627438},
+              'yz': {'mu': 3.586776, 's': 1.9563104},
+              'xz': {'mu': 3.550664, 's': 1.8617355}},
+    'eli':   {'probV': 340.0763,
+              'id': 'eli',
+              'cutoff': 8,
+              'xy': {'mu': 1.768962, 's': 0.4022094},
+              'yz': {'mu': 2.056096, 's': 0.3980918},
+              'xz': {'mu': 2.267019, 's': 0.4506382}},
+    }
+
+#=================================================================
+# readMaterials
+# Materials of a gumbel-parameters.json file of xctGumbel.py, and the file
+# named by the gumbel reference in the summary of results, if any
+
+def readMaterials(gumbelFile, sha1=None):
+    f = open(gumbelFile, 'rb')
+    data = f.read()
+    f.close()
+    if sha1 is not None and hashlib.sha1(data).hexdigest() != sha1:
+        print 'Warning: %s has changed since the results were written' %(gumbelFile)
+    materials = json.loads(data).get('materials')
+    if not isinstance(materials, dict):
+        raise ValueError('%s is not a gumbel-parameters.json file of xctGumbel.py'
+                         %(gumbelFile))
+    return materials
+
+def resultsGumbel(resultsFile, meta):
+    gumbel = meta.get('gumbel')
+    if gumbel is None and resultsFile.endswith('.csv'):
+        # the reference of CSV results is in the manifest written next to them
+        gumbel = manifestGumbel(resultsFile[:-len('.csv')] + '.manifest.json')
+    if gumbel is None:
+        return None, None
+    sha1 = meta.get('gumbelSha1')
+    if isinstance(gumbel, dict):
+        gumbel, sha1 = gumbel['file'], gumbel.get('sha1')
+    # relative to the folder of the results
+    folder = os.path.dirname(os.path.abspath(resultsFile.rstrip('/\\')))
+    return os.path.join(folder, gumbel), sha1
+
+def manifestGumbel(manifestFile):
+    try:
+        f = open(manifestFile)
+        manifest = json.load(f)
+        f.close()
+    except (IOError, ValueError):
+        return None
+    return manifest.get('gumbel')
+
+requiredColumns = ['cycEA', 'cycSA', 'ldV', 'ulV', 'ldS11', 'ldS22', 'ldS33',
+                   'ulS11', 'ulS22', 'ulS33']
+
+# stress direction, and the plane of the defect perpendicular to it
+directions = [('11', 'yz'), ('22', 'xz'), ('33', 'xy')]
+
+mcHeader = ['ident', 'matl', 'run', 'dK33.q50', 'dK33.q99', 'k33.q50', 'k33.q99']
+for direction, plane in directions:
+    mcHeader += ['dK%s.%s' %(direction, name) for name in
+                 ('cycEA', 'cycSA', 'D', 'dS', 'dK', 'k')] + ['k%s.k' %(direction)]
+
+# geometry factor F of a surface defect (Murakami)
+shapeFactor = 0.65
+
+#=================================================================
+# monteCarloPoints
+# Arrays of the integration points that may hold an inclusion (iProb > 0),
+# with the tensile stresses and stress ranges of each direction
+
+def monteCarloPoints(data, material, symmetry=1.0):
+    missing = [name for name in requiredColumns if name not in data]
+    if missing:
+        raise ValueError('results have no %s column; ivolMonteCarlo.py needs %s'
+                         %(', '.join(missing), ', '.join(requiredColumns)))
+    cycV = (numpy.asarray(data['ldV'], dtype=numpy.float64) +
+            numpy.asarray(data['ulV'], dtype=numpy.float64))/2.0*symmetry
+    iProb = material['probV']*cycV
+    keep = iProb > 0
+    points = {'whole': numpy.floor(iProb[keep])}
+    points['fraction'] = iProb[keep] - points['whole']
+    for name in ('cycEA', 'cycSA'):
+        points[name] = numpy.asarray(data[name], dtype=numpy.float64)[keep]
+    for direction, plane in directions:
+        # only tensile stresses open a crack
+        ld = numpy.maximum(numpy.asarray(data['ldS' + direction], dtype=numpy.float64)[keep], 0)
+        ul = numpy.maximum(numpy.asarray(data['ulS' + direction], dtype=numpy.float64)[keep], 0)
+        points['S' + direction] = ld
+        points['dS' + direction] = abs(ld - ul)
+    return points
+
+#=================================================================
+# runBatch
+# Rows of runs first..first+count-1, as lists of values in mcHeader order
+# after ident and matl. Every run has its own random number stream.
+
+def runBatch(points, material, seed, first, count):
+    n = len(points['whole'])
+    runs = numpy.arange(count)
+    uniform = numpy.empty((2, count, n))
+    for i in range(count):
+        uniform[:, i] = numpy.random.RandomState([seed, first + i]).random_sample((2, n))
+
+    # number of inclusions at each point, and its largest inclusion as a
+    # Gumbel reduced variate -log(-log(U)) for the largest U of nIncl
+    nIncl = points['whole'] + (uniform[0] < points['fraction'])
+    has = nIncl > 0
+    counts = has.sum(axis=1)
+    oldSettings = numpy.seterr(divide='ignore', invalid='ignore')
+    try:
+        largest = uniform[1]**(1.0/numpy.maximum(nIncl, 1))
+        reduced = -numpy.log(-numpy.log(largest))
+    finally:
+        numpy.seterr(**oldSettings)
+    del uniform, nIncl, largest
+
+    columns = {}
+    for direction, plane in directions:
+        size = numpy.maximum(material[plane]['mu'] + material[plane]['s']*reduced, 0)
+        factor = shapeFactor*numpy.sqrt(math.pi*size/1e6)
+        k = numpy.where(has, points['S' + direction]*factor, -1.0)
+        dK = numpy.where(has, points['dS' + direction]*factor, -1.0)
+        row = dK.argmax(axis=1)
+        if direction == '33':
+            columns['dK33.q50'], columns['dK33.q99'] = quantiles(dK, counts, (0.5, 0.99))
+            columns['k33.q50'], columns['k33.q99'] = quantiles(k, counts, (0.5, 0.99))
+        prefix = 'dK' + direction + '.'
+        columns[prefix + 'cycEA'] = points['cycEA'][row]
+        columns[prefix + 'cycSA'] = points['cycSA'][row]
+        columns[prefix + 'D'] = size[runs, row]
+        columns[prefix + 'dS'] = points['dS' + direction][row]
+        columns[prefix + 'dK'] = dK[runs, row]
+        columns[prefix + 'k'] = k[runs, row]
+        columns['k' + direction + '.k'] = k.max(axis=1)
+
+    # a run without any inclusion has no results
+    names = mcHeader[3:]
+    values = numpy.column_stack([columns[name] for name in names])
+    values[counts == 0] = numpy.nan
+    return [[first + i] + values[i].tolist() for i in range(count)]
+
+#=================================================================
+# quantiles
+# Quantiles of each row of values over its counts[i] values that are not
+# negative, interpolated between order statistics (R quantile type 7)
+
+def quantiles(values, counts, probabilities):
+    ordered = numpy.sort(values, axis=1)
+    n = ordered.shape[1]
+    runs = numpy.arange(len(counts))
+    result = []
+    for p in probabilities:
+        position = (n - counts) + p*numpy.maximum(counts - 1, 0)
+        lower = numpy.minimum(numpy.floor(position).astype(int), n - 1)
+        upper = numpy.minimum(lower + 1, n - 1)
+        weight = position - lower
+        result.append((1 - weight)*ordered[runs, lower] + weight*ordered[runs, upper])
+    return result
+
+#=================================================================
+# monteCarlo
+# Generate the rows of runs first..first+runs-1 in run order, calculated in
+# batches of batch runs by workers processes
+
+workerPoints = None
+
+def setupWorker(points):
+    global workerPoints
+    workerPoints = points
+
+def workerBatch(args):
+    return runBatch(workerPoints, *args)
+
+def batchSize(points, batch=None):
+    if batch is None:
+        batch = int(1e6)//max(1, len(points['whole']))
+    return max(1, int(batch))
+
+def monteCarlo(data, material, runs=10, first=1, seed=42, symmetry=1.0, workers=1,
+               batch=None):
+    points = monteCarloPoints(data, material, symmetry)
+    batch = batchSize(points, batch)
+    tasks = [(material, seed, start, min(batch, first + runs - start))
+             for start in range(first, first + runs, batch)]
+    if workers > 1 and len(tasks) > 1:
+        pool = multiprocessing.Pool(min(workers, len(tasks)), setupWorker, (points,))
+        try:
+            for rows in pool.imap(workerBatch, tasks):
+                for row in rows:
+                    yield row
+            pool.close()
+        finally:
+            pool.terminate()
+            pool.join()
+    else:
+        for task in tasks:
+            for row in runBatch(points, *task):
+                yield row
+
+#=================================================================
+# signif
+# A value rounded to 4 significant digits as written by R, or NA
+
+def signif(value):
+    if value != value or value in (float('inf'), float('-inf')):
+        return 'NA'
+    return '%.15g' %(float('%.4g' %(value)))
+
+def mcName(resultsFile):
+    name = resultsFile.rstrip('/\\')
+    for ending in ('.csv', '.ivol'):
+        if name.endswith(ending):
+            name = name[:-len(ending)]
+    return name + '.mc.csv'
+
+#=================================================================
+# writeMonteCarlo
+# Append rows to the mc file, with a header line if it is new. Returns the
+# number of runs written.
+
+def writeMonteCarlo(rows, mcFile, ident, material):
+    newFile = not os.path.isfile(mcFile) or os.path.getsize(mcFile) == 0
+    f = open(mcFile, 'a')
+    if newFile:
+        f.write(','.join(mcHeader) + '\n')
+    written = 0
+    try:
+        for row in rows:
+            f.write(','.join([ident, material['id'], str(row[0])] +
+                             [signif(value) for value in row[1:]]) + '\n')
+            written += 1
+            if written % 100 == 0:
+                f.flush()
+    finally:
+        f.close()
+    return written
+
+#==================================================================
+# S T A R T
+#
+if __name__ == '__main__':
+
+    # initialize parameters
+    resultsFile = None
+    mcFile = None
+    gumbelFile = None
+    materialName = 'eli'
+    ident = 'OF-2017-01'
+    settings = {'runs': 10, 'first': 1, 'seed': 42, 'symmetry': 1.0, 'workers': 1,
+                'batch': None}
+
+    # parse the parameters from the argument list
+    argList = argv
+    argCount = len(argList)
+    i=1
+    try:
+        while (i < argCount):
+            if (argList[i][:3] == "-re"):
+                i+=1
+                resultsFile = argList[i]
+            elif (argList[i][:3] == "-ma"):
+                i+=1
+                materialName = argList[i].lower()
+            elif (argList[i][:3] == "-gu"):
+                i+=1
+                gumbelFile = argList[i]
+            elif (argList[i][:3] == "-ru"):
+                i+=1
+                settings['runs'] = int(float(argList[i]))
+            elif (argList[i][:3] == "-fi"):
+                i+=1
+                settings['first'] = int(argList[i])
+            elif (argList[i][:3] == "-se"):
+                i+=1
+                settings['seed'] = int(argList[i])
+            elif (argList[i][:3] == "-sy"):
+                i+=1
+                settings['symmetry'] = float(argList[i])
+            elif (argList[i][:3] == "-id"):
+                i+=1
+                ident = argList[i]
+            elif (argList[i][:3] == "-ou"):
+                i+=1
+                mcFile = argList[i]
+            elif (argList[i][:3] == "-wo"):
+                i+=1
+                settings['workers'] = int(argList[i])
+            elif (argList[i][:3] == "-ba"):
+                i+=1
+                settings['batch'] = int(float(argList[i]))
+            elif (argList[i][:3] == "-he"):
+                print __doc__
+                exit(0)
+            else:
+                print "***ERROR: Unknown argument %s" %(argList[i])
+                print __doc__
+                exit(1)
+            i+=1
+    except (IndexError, ValueError):
+        print "***ERROR: Arguments are missing or not valid"
+        print __doc__
+        exit(1)
+
+    if resultsFile is None:
+        print "***ERROR: A results file is required"
+        print __doc__
+        exit(1)
+    if settings['runs'] < 1 or settings['workers'] < 1 or not 0 <= settings['seed'] < 2**32:
+        print "***ERROR: -runs and -workers must be at least 1, and -seed from 0 to 2^32-1"
+        exit(1)
+    if mcFile is None:
+        mcFile = mcName(resultsFile)
+
+    try:
+        data, meta = readIvol(resultsFile, requiredColumns)
+        sha1 = None
+        if gumbelFile is None:
+            gumbelFile, sha1 = resultsGumbel(resultsFile, meta)
+        if gumbelFile is not None:
+            print 'Material parameters from %s' %(gumbelFile)
+            materials = readMaterials(gumbelFile, sha1)
+    except (IOError, ValueError), e:
+        print "***ERROR: %s" %(e)
+        exit(1)
+    if materialName not in materials:
+        print "***ERROR: Unknown material %s. Use %s." %(materialName,
+                                                        ' or '.join(sorted(materials)))
+        exit(1)
+    material = materials[materialName]
+
+    print 'Monte-Carlo runs %i to %i of %s with %s material, appended to %s' %(
+        settings['first'], settings['first'] + settings['runs'] - 1, resultsFile,
+        materialName, mcFile)
+    started = time.time()
+    written = writeMonteCarlo(monteCarlo(data, material, **settings), mcFile, ident,
+                              material)
+    print '%i runs written in %.1f seconds' %(written, time.time() - started)
@@ -0,0 +1,241 @@
+'''
+ivolRead.py
+===========
+
+Read results written by ivolResults.004.py into numpy arrays, from either
+the .ivol.csv text file or the .ivol folder of binary columns written with
+"-format npy". Binary columns are memory-mapped, so loading a column does not
+read or parse the whole file.
+
+Usage (from Python, with numpy):
+    from ivolRead import readIvol
+    data, meta = readIvol('open-frame-fatigue-v25mm-9pct.ivol')
+    data, meta = readIvol('open-frame-fatigue-v25mm-9pct.ivol.csv',
+                          columns=['el', 'ip', 'cycEA', 'ldV'])
+
+data is a dictionary of column arrays, and meta is a dictionary with the
+summary values (nRows, vTotal, cycEMmax, cycEAmax), the ODB names, and
+(for binary results) the steps, part instance and column definitions.
+
+Results written with -xyz have integration point coordinates, and a voxel
+grid of the coordinates of one frame in a file ending in .ivol.grid.npz.
+readGrid reads it, to find rows within a box or radius without scanning
+every row, e.g. the volume with strain amplitude over 0.004 within 0.1 mm of
+a point:
+    from ivolRead import readIvol, readGrid
+    data, meta = readIvol('open-frame-fatigue-v25mm-9pct.ivol')
+    grid, gridMeta = readGrid('open-frame-fatigue-v25mm-9pct.ivol.grid.npz')
+    rows = grid.radius([1.2, 10.5, 3.0], 0.1)
+    hot = rows[abs(data['cycEA'][rows]) > 0.004]
+    volume = data['ldV'][hot].sum()
+Rows are numbered from 0 in the order of the results file. grid.box(lo, hi)
+finds rows within a box.
+'''
+
+# Copyright 2017 Confluent Medical Technologies
+# Released as part of nitinol-design-concepts
+# https://github.com/confluentmedical/nitinol-design-concepts
+# under terms of Apache 2.0 license
+# http://www.apache.org/licenses/LICENSE-2.0.txt
+
+import os
+import re
+import json
+import numpy
+
+# summary lines in the CSV header look like "Total volume:   vTotal   = 11.021"
+summaryPattern = re.compile(r':\s+(\w+)\s+=\s+(.*)$')
+divider = '-----'
+
+#=================================================================
+# readIvol
+# Read columns of a results file or folder. columns=None reads all columns.
+
+def readIvol(path, columns=None, mmapMode='r'):
+    if os.path.isdir(path):
+        return readNpy(path, columns, mmapMode)
+    return readCsv(path, columns)
+
+#=================================================================
+# readNpy
+# Memory-map the .npy column arrays of a binary results folder
+
+def readNpy(path, columns=None, mmapMode='r'):
+    file1 = open(os.path.join(path, 'summary.json'))
+    meta = json.load(file1)
+    file1.close()
+    if columns is None:
+        columns = [c['name'] for c in meta['columns']]
+    missingColumns(path, columns, [c['name'] for c in meta['columns']])
+    data = {}
+    for name in columns:
+        data[name] = numpy.load(os.path.join(path, name + '.npy'),
+                                mmap_mode=mmapMode)
+    return data, meta
+
+#=================================================================
+# readCsv
+# Parse the summary header and columns of a .ivol.csv text file
+
+def readCsv(path, columns=None):
+    meta = {}
+    file1 = open(path)
+    nDividers = 0
+    while nDividers < 2:
+        line = file1.readline()
+        if line == '':
+            raise ValueError('%s is not an ivolResults CSV file' % path)
+        if line.startswith(divider):
+            nDividers += 1
+            continue
+        match = summaryPattern.search(line.rstrip())
+        if nDividers == 0 and match:
+            meta[match.group(1)] = match.group(2).strip()
+    names = [name.strip() for name in file1.readline().split(',')]
+    if columns is None:
+        columns = names
+    missingColumns(path, columns, names)
+    usecols = [names.index(name) for name in columns]
+    values = numpy.loadtxt(file1, delimiter=',', usecols=usecols, ndmin=2)
+    file1.close()
+
+    for key in ('nRows', 'topK', 'elements'):
+        if key in meta:
+            meta[key] = int(meta[key])
+    for key in ('vTotal', 'cycEMmax', 'cycEAmax'):
+        if meta.get(key) == 'NA':
+            meta[key] = None
+        elif key in meta:
+            meta[key] = float(meta[key])
+    meta['columns'] = [{'name': name} for name in columns]
+
+    data = {}
+    for j, name in enumerate(columns):
+        # labels and counts (nIp of -aggregate element) are integers
+        if name in ('el', 'ip', 'nIp'):
+            data[name] = values[:,j].astype(numpy.int32)
+        else:
+            data[name] = values[:,j]
+    return data, meta
+
+def missingColumns(path, columns, names):
+    missing = [name for name in columns if name not in names]
+    if missing:
+        raise ValueError('%s has no column %s' %(path, ', '.join(missing)))
+
+#=================================================================
+# PointGrid
+# Uniform voxel grid of integration point coordinates, for finding the rows
+# of a results file within a box or a radius without scanning every row.
+# Rows are sorted by cell, and only occupied cells are stored, so the grid
+# takes about two integers per point. Written next to results files by
+# ivolResults.004.py -xyz, and read with readGrid.
+
+class PointGrid:
+
+    # xyz is an (n, 3) array of coordinates, one row per results row.
+    # cellSize defaults to a size giving about pointsPerCell points in each
+    # occupied cell.
+    def __init__(self, xyz=None, cellSize=None, pointsPerCell=8):
+        if xyz is None:
+            return
+        xyz = numpy.asarray(xyz, dtype=numpy.float64)
+        self.xyz = xyz
+        self.origin = xyz.min(axis=0) if len(xyz) else numpy.zeros(3)
+        if cellSize is None:
+            cellSize = self.defaultCellSize(pointsPerCell)
+        self.cellSize = float(cellSize)
+        ijk = self.cellIndex(xyz)
+        self.shape = ijk.max(axis=0) + 1 if len(xyz) else numpy.ones(3, dtype=numpy.int64)
+        ids = self.cellId(ijk)
+        self.rows = numpy.argsort(ids, kind='mergesort')
+        sortedIds = ids[self.rows]
+        self.cells, self.starts = numpy.unique(sortedIds, return_index=True)
+        self.starts = numpy.append(self.starts, len(sortedIds))
+
+    # start from the cell size that would fill the bounding box, then
+    # refine it from the number of occupied cells, since meshes of thin
+    # struts occupy a small part of their bounding box
+    def defaultCellSize(self, pointsPerCell):
+        n = len(self.xyz)
+        if n == 0:
+            return 1.0
+        extent = self.xyz.max(axis=0) - self.origin
+        largest = max(float(extent.max()), 1e-12)
+        extent = numpy.maximum(extent, largest*1e-3)
+        cellSize = (numpy.prod(extent)*pointsPerCell/max(n, 1))**(1.0/3.0)
+        for i in range(3):
+            cellSize = max(cellSize, largest/2**20)
+            ijk = numpy.floor((self.xyz - self.origin)/cellSize).astype(numpy.int64)
+            shape = ijk.max(axis=0) + 1
+            ids = (ijk[:,0]*shape[1] + ijk[:,1])*shape[2] + ijk[:,2]
+            occupied = len(numpy.unique(ids))
+            cellSize *= (float(pointsPerCell)*occupied/max(n, 1))**(1.0/3.0)
+        return max(cellSize, largest/2**20)
+
+    def cellIndex(self, xyz):
+        return numpy.floor((xyz - self.origin)/self.cellSize).astype(numpy.int64)
+
+    def cellId(self, ijk):
+        return (ijk[:,0]*self.shape[1] + ijk[:,1])*self.shape[2] + ijk[:,2]
+
+    # rows (sorted) with lo <= xyz <= hi in each direction
+    def box(self, lo, hi):
+        lo = numpy.asarray(lo, dtype=numpy.float64)
+        hi = numpy.asarray(hi, dtype=numpy.float64)
+        candidates = self.candidates(lo, hi)
+        inside = numpy.all((self.xyz[candidates] >= lo) &
+                           (self.xyz[candidates] <= hi), axis=1)
+        return numpy.sort(candidates[inside])
+
+    # rows (sorted) within radius of center
+    def radius(self, center, radius):
+        center = numpy.asarray(center, dtype=numpy.float64)
+        candidates = self.candidates(center - radius, center + radius)
+        d2 = numpy.sum((self.xyz[candidates] - center)**2, axis=1)
+        return numpy.sort(candidates[d2 <= radius*radius])
+
+    # rows of the cells overlapping a box
+    def candidates(self, lo, hi):
+        first = numpy.maximum(self.cellIndex(lo[numpy.newaxis])[0], 0)
+        last = numpy.minimum(self.cellIndex(hi[numpy.newaxis])[0], self.shape - 1)
+        if numpy.any(last < first):
+            return numpy.zeros(0, dtype=numpy.int64)
+        if numpy.prod(last - first + 1) > len(self.cells):
+            # large box: test every occupied cell instead
+            k = self.cells % self.shape[2]
+            j = (self.cells//self.shape[2]) % self.shape[1]
+            i = self.cells//(self.shape[1]*self.shape[2])
+            ijk = numpy.column_stack((i, j, k))
+            found = numpy.nonzero(numpy.all((ijk >= first) & (ijk <= last), axis=1))[0]
+        else:
+            grid = numpy.mgrid[first[0]:last[0] + 1, first[1]:last[1] + 1,
+                               first[2]:last[2] + 1].reshape(3, -1).T
+            ids = self.cellId(grid)
+            pos = numpy.minimum(numpy.searchsorted(self.cells, ids), len(self.cells) - 1)
+            found = pos[self.cells[pos] == ids]
+        if len(found) == 0:
+            return numpy.zeros(0, dtype=numpy.int64)
+        return numpy.concatenate([self.rows[self.starts[c]:self.starts[c + 1]]
+                                  for c in found])
+
+    def save(self, path, **meta):
+        numpy.savez(path, xyz=self.xyz, origin=self.origin,
+                    cellSize=self.cellSize, shape=self.shape, rows=self.rows,
+                    cells=self.cells, starts=self.starts,
+                    meta=json.dumps(meta))
+
+#=================================================================
+# readGrid
+# Read a PointGrid written with PointGrid.save. Returns the grid, and a
+# dictionary of metadata (e.g. the frame of the coordinates).
+
+def readGrid(path):
+    npz = numpy.load(path)
+    grid = PointGrid()
+    for name in ('xyz', 'origin', 'shape', 'rows', 'cells', 'starts'):
+        setattr(grid, name, npz[name])
+    grid.cellSize = float(npz['cellSize'])
+    meta = json.loads(str(npz['meta']))
+    npz.close()
+    return grid, meta
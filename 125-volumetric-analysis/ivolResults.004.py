@@ -11,9 +11,30 @@ Usage: abaqus python ivolResults.py
       -odbName odbName
       [-oldOdb crimpOdbName]
       -partInstance partInstanceName (name of part instance)
+      [-elset elementSetName]  (element set within part instance or assembly)
       -crimpStepName crimpStepName  (name of crimping/prestrain step)
-      -lastStepName lastStepName  (name of final unloading cycle step)
+      -lastStepName lastStepName  (name of final unloading cycle step,
+                                   or a comma separated list or pattern)
       [-overwrite yes]
+      [-blockSize n]  (integration points per block, default 50000)
+      [-format csv|npy|both]  (results file format, default csv)
+      [-columns name,name,...]  (columns to write, default all)
+      [-cache cacheFolder]  (cache of crimp frame fields)
+      [-maxCache MB]  (cache size limit, default 2048)
+      [-cycle ends|full]  (frames defining the fatigue cycle, default ends)
+      [-profile]  (report time and memory of each phase)
+      [-volumes]  (write a volume summary, with exceedance curves and histograms)
+      [-symmetry n]  (volume summary symmetry factor, default 1)
+      [-topK n]  (write only the n most critical integration points)
+      [-rankBy cycEA|cycSA|cycTau]  (column ranking -topK, default cycEA)
+      [-xyz crimp,load,unload]  (write coordinates of these frames, and a grid)
+      [-workers n]  (worker processes, each extracting a partition, default 1)
+      [-splitSets set,set,...]  (element sets as partitions, instead of label ranges)
+      [-update]  (skip results that are up to date, and replace others;
+                  every run writes the manifest they are checked against)
+      [-storage full|compact]  (compact: single precision, small integer labels)
+      [-aggregate element]  (write one row per element instead of per point)
+      [-gumbel parameterFile]  (inclusion parameters the results are used with)
 
 oldOdb is optional, and may be used if crimping (prestrain) results are in a
 different ODB from cyclic results.  The script creates a CSV file with the same 
@@ -21,6 +42,176 @@ job name as odbName, ending in .ivol.csv. If this file exists, script prompts
 for a new file name. The "-overwrite yes" option will override this protection.
 All other parameters are mandatory.
 
+Field output is read only for the part instance (or the whole model if the
+part instance is ASSEMBLY). "-elset" further restricts results to an element
+set of the part instance, or of the assembly.
+
+Fields are read from the ODB, and results calculated and written, in blocks
+of about blockSize integration points, so peak memory depends on blockSize
+rather than model size. Each block is a run of consecutive elements, planned
+from the labels of the IVOL output of the crimp frame (the only field read
+for the whole region), and read through an element set created from its
+labels. If element sets cannot be created in the ODB, the region is read as
+a single block. With several steps (see lastStepName below), the crimp
+fields of every block are kept in memory, so that the crimp frame is read
+only once; with -xyz, so are the coordinates of the grid.
+
+"-format npy" writes a folder ending in .ivol instead of the CSV file, with
+one numpy .npy array per column and a summary.json file holding the summary
+and column definitions. Arrays can be memory-mapped without parsing, e.g.
+numpy.load('Job-2.ivol/cycEA.npy', mmap_mode='r'), or read with ivolRead.py.
+"-format both" writes the CSV file and the .ivol folder.
+
+"-columns" selects a comma separated list of columns to write, for example
+-columns el,ip,ldV,ulV,cycEA,cycSA,ldS,ldS11,ldS22,ldS33,ulS,ulS11,ulS22,ulS33
+Only the fields and frames needed for these columns are read from the ODB.
+Element and integration point labels are always written. Summary values
+whose columns are not selected (preV, cycEM, cycEA) are reported as NA.
+The CSV header describes only the selected columns, so it is shorter than
+the usual 46 lines.
+
+The CSV header of the default results is 46 lines: the summary, then the
+column descriptions between two lines of dashes. The line of column names
+follows the second line of dashes. Options that add summary values (-topK,
+-aggregate) or columns (-xyz) make the header longer, and
+-columns makes it shorter, so readers should find the second line of dashes
+rather than skip a fixed number of lines, as postprocessFEA.R and
+../215-monte-carlo/monte-carlo-xct-fea.R do. ivolRead.py reads any header.
+
+"-cache" keeps the crimp (prestrain) frame fields read from the ODB in a
+folder, keyed by ODB path, size and modification time, step, frame, part
+instance, element set (and the elements of a block or -workers partition) and field. Later runs against the same crimp ODB, e.g.
+several cyclic ODBs with the same -oldOdb, read the fields from the cache
+and do not open the crimp ODB at all. The least recently used fields are
+removed when the folder grows beyond maxCache MB.
+
+By default the fatigue cycle is defined by the first (load) and last (unload)
+frames of lastStepName. "-cycle full" reads every frame of lastStepName, one
+at a time, and keeps the tensor at the frame with the highest (peak) and
+lowest (valley) maximum principal value of each integration point, for strain
+and stress separately. Cycle mean and amplitude (cycEM, cycEA, cycTau, cycSM,
+cycSA) are then calculated from the peak and valley tensors, by the script
+in double precision (see principal values below). Load and unload frame
+columns (ld*, ul*) are still from the first and last frames.
+
+lastStepName may also be a comma separated list of step names, and/or
+patterns with wildcards (* ? [...]), e.g. -lastStepName "diastole-*". The
+ODB is opened and the crimp frame read only once, and one results file is
+written for each matching step, named with the step, e.g.
+Job-2.diastole-01.ivol.csv. Existing files are skipped unless
+"-overwrite yes" is given.
+
+"-profile" records the wall time, CPU time, peak memory and number of
+integration points (or other items) of each phase of the run: opening ODBs,
+reading fields, the cache, the cycle mean and amplitude fields, matching
+rows, the cycle extremes, deriving results and writing each format. A
+table is printed at the end, and the profile is written next to the results
+file, e.g. Job-2.ivol.profile.json. Without -profile, nothing is timed.
+
+"-volumes" calculates the volume summaries of postprocessFEA.R while the
+results are written, and writes them to a small JSON file next to the
+results file, e.g. Job-2.ivol.volumes.json: total volume, transformed
+(martensite) volumes, maximum cyclic values, volume with strain amplitude
+(cycEA) or stress amplitude (cycSA) at or above each threshold, and 2-D
+histograms of volume over (cycEM, cycEA) and (cycSM, cycSA). All volumes are
+multiplied by the "-symmetry" factor, e.g. 16 if the model is 1/16 of the
+component. As in postprocessFEA.R, amplitudes of points in hydrostatic
+compression are taken as zero. Comparing design variants then only needs
+these files, not the results of every integration point.
+
+"-topK n" writes only the n integration points with the largest absolute
+value of the "-rankBy" column (cycEA, cycSA or cycTau), largest first, with
+all selected columns, for quick screening of designs. The summary values
+(nRows, vTotal, cycEMmax, cycEAmax) are still totals over every integration
+point; the rows kept are added to the summary as topK and rankBy. Rows are
+selected block by block as results are derived, so memory does not depend
+on model size.
+
+"-xyz crimp,load,unload" adds the coordinates of each integration point in
+the listed frames as columns (preC1, preC2, preC3, ldC1, ..., ulC3), from
+COORD field output at the integration points. If COORD was not requested in
+the analysis, the undeformed centroid of each element is used for every
+frame instead, with a warning. A voxel grid index of the coordinates of the
+first listed frame is written next to the results file, e.g.
+Job-2.ivol.grid.npz, so that ivolRead.py can find the rows within a box or a
+radius of a point (e.g. around a strut junction) without scanning every row.
+The CSV header then has three more lines of column descriptions for each
+listed frame (see the header layout above).
+
+"-workers n" splits the extraction of one ODB over n worker processes, for
+full models that take hours on one core. The elements of the part instance
+(and -elset) are split into n runs of consecutive elements with equal
+numbers of integration points, from the IVOL output of the crimp frame.
+Each worker opens the ODBs read-only, reads the fields of its partition only
+(through an element set created from its labels, where the odb allows), and
+writes binary part results to a folder ending in .ivol.parts. The parts are
+then merged, in order, into the usual results files, and the summary values
+(nRows, vTotal, cycEMmax, cycEAmax), -volumes, -topK and -xyz are
+calculated over all rows, so the results are the same as from one process.
+"-splitSets A,B,C" uses the given element sets (which should not overlap)
+as the partitions instead. Each worker uses Abaqus licence tokens. The
+messages of each worker are in a .log file in the .ivol.parts folder, which
+is removed once the parts are merged; their warnings (e.g. integration
+points missing from a field) are printed with the name of the part.
+
+Every run, with or without -update, records what its results depend on in a
+manifest next to the results file, e.g. Job-2.ivol.manifest.json: script
+version, path, size and modification time of each ODB, part instance, steps
+and the options that change the results, with the size and modification
+time of each file written. With "-update", a run whose results are all up to date is skipped
+at once, without opening the ODB; otherwise results that are out of date are
+replaced without prompting. The manifest is updated as each step is
+written, so a run with several steps that was interrupted only extracts the
+steps not yet written. With -workers, the parts of an interrupted run are
+kept in the .ivol.parts folder with a manifest of their own, and only the
+partitions not yet written are extracted when the run is started again.
+
+"-storage compact" writes results as single precision (float32) rather than
+double, and element and integration point labels as the smallest unsigned
+integer type that holds them (e.g. uint16 labels for fewer than 65536
+elements, uint8 integration points). Results read from the ODB (components,
+principal values and pressures) are already single precision, so binary
+results are about a third smaller, and columns calculated in double
+precision (ldTau, ulTau, cycTau, and the cycle mean and amplitude of -cycle
+full) half the size. Single precision keeps about 7 significant digits,
+more than the 6 of the CSV file, and more than the ODB data they are
+calculated from, so CSV files are unchanged except for the rounding of the
+last digit of a few of those values in a thousand. Summary values and
+volume summaries are calculated before results are rounded to single
+precision.
+
+"-aggregate element" writes one row per element instead of one per
+integration point, reduced as results are derived: number of integration
+points (nIp), ldV weighted mean of the absolute strain amplitude (cycEA),
+signed absolute maximum strain and stress amplitudes (cycEAmax, cycSA),
+element volumes (preV, ldV, ulV, summed) and volume weighted martensite
+fractions (preM, ldM, ulM). The file is smaller by the number of integration
+points per element. The summary values are still over every integration
+point, and the number of element rows is added to the summary as elements.
+It cannot be combined with -columns, -topK or -xyz.
+
+"-gumbel" names the gumbel-parameters.json file of inclusion densities and
+sizes written by ../210-xct-methods/xctGumbel.py that the results are to be
+used with, e.g. by ivolMonteCarlo.py. Its name (relative to the results), SHA-1
+checksum and materials are recorded as gumbel in the manifest of the results,
+and in the summary.json of binary results, but not in the CSV header, so
+that its length is unchanged. ivolMonteCarlo.py reads the parameters from
+the file. Results are out of date for -update when the file changes.
+
+Principal values and pressures (preE, preS, preP, ldE, ldS, ldP, ulE, ulS,
+ulP) are read from Abaqus as scalar fields, with getScalarField and the
+MAX_PRINCIPAL, MIN_PRINCIPAL and PRESS invariants, in bulk. The cycle mean,
+0.5*(load + unload), and amplitude, 0.5*(load - unload), are calculated by
+Abaqus field arithmetic, and their principal values read in the same way.
+These are the single precision values that ivolResults.004.py before .005
+read one FieldValue at a time, and shear (ldTau, ulTau, cycTau) is
+calculated from them in double precision, as it did, so the default results
+are the same as those of ivolResults.004.py, value for value. With -cycle
+full, the peak and valley of each integration point may be in any frame, so
+the cycle mean and amplitude are calculated by the script instead, in double
+precision from the tensor components; these agree with Abaqus principal
+values to about 1e-7 of the largest principal value of each tensor.
+
 Field output requests must include strain, stress, state dependant variables,
 and integration point volume:
 LE, S, SDV, IVOL
@@ -80,18 +271,1748 @@ ulS33  = unloading stress in material 3 direction (Z)
 .002 add shear strain results. correct error in stress amplitude calculation
 .003 add S11, S22, S33 components
 .004 correction to overwritePref behavior
+.005 read field output, principal values and pressures as numpy arrays from
+     bulk data blocks, for all integration points at once
+.006 derive and write results in blocks of integration points (-blockSize)
+.007 optional columnar binary output (-format npy or both)
+.008 optional selection of columns (-columns); only the fields needed for
+     the selected columns are read and derived
+.009 read field output only for the part instance, and optional element set
+     (-elset)
+.010 match rows of each field by element and integration point labels,
+     rather than by position, when combining frames and ODBs
+.011 optional cache of crimp frame fields shared between runs (-cache)
+.012 optional cycle mean and amplitude from the extremes over all frames of
+     the last step (-cycle full)
+.013 several cycle steps from one run, e.g. -lastStepName "diastole-*"
+.014 outputToText returns the files written, for the ivolBatch.py driver
+.015 optional time and memory profile of each phase of a run (-profile)
+.016 cycle mean and amplitude principal values of -cycle full from the peak
+     and valley components in one pass, without full tensors
+.017 optional volume summary, with exceedance curves and histograms (-volumes)
+.018 optional output of only the most critical integration points (-topK)
+.019 optional integration point coordinates and a voxel grid index (-xyz)
+.020 optional extraction of partitions of the model by worker processes
+     (-workers, -splitSets), merged into one results file
+.021 manifest of the sources and options of the results, and optional
+     skipping of results that are up to date (-update)
+.022 optional single precision results and compact labels (-storage compact)
+.023 optional output of one row per element (-aggregate element)
+.024 optional reference to XCT inclusion parameters in the results (-gumbel)
 '''
 
+scriptVersion = '.024'
+
 import os
+import re
+import sys
+import time
+import json
+import fnmatch
+import shutil
+import hashlib
 from sys import argv, exit
+import numpy
 from odbAccess import *
-from abaqusConstants import TRUE
+from abaqusConstants import TRUE, MAX_PRINCIPAL, MIN_PRINCIPAL, PRESS
+
+#=================================================================
+# Profile
+# Wall time, CPU time, peak memory and item counts of each phase of a run,
+# for the -profile option. Code being profiled calls
+#     started = profile.start()
+#     ...
+#     profile.stop('phase', started, count)
+# Phases are timed separately, so phases must not be nested.
+
+class Profile:
+
+    def __init__(self):
+        self.phases = []
+        self.totals = {}
+        self.started = self.start()
+
+    def start(self):
+        return (time.time(), cpuTime())
+
+    def stop(self, name, started, count=0):
+        wall, cpu = self.start()
+        if name not in self.totals:
+            self.phases.append(name)
+            self.totals[name] = {'phase': name, 'calls': 0, 'count': 0,
+                                 'wallSeconds': 0.0, 'cpuSeconds': 0.0}
+        entry = self.totals[name]
+        entry['calls'] += 1
+        entry['count'] += count
+        entry['wallSeconds'] += wall - started[0]
+        entry['cpuSeconds'] += cpu - started[1]
+        # peak memory of the process at the end of the phase
+        entry['peakRssMB'] = peakMemory()
+
+    def report(self, metadata):
+        wall, cpu = self.start()
+        report = dict(metadata)
+        report['phases'] = [self.totals[name] for name in self.phases]
+        report['total'] = {'wallSeconds': wall - self.started[0],
+                           'cpuSeconds': cpu - self.started[1],
+                           'peakRssMB': peakMemory()}
+        return report
+
+    def table(self):
+        lines = ['%-14s %6s %12s %10s %10s %10s' %('phase', 'calls', 'count',
+                                                   'wall (s)', 'cpu (s)', 'peak (MB)')]
+        for name in self.phases + ['total']:
+            if name == 'total':
+                entry = self.report({})['total']
+                entry['calls'] = entry['count'] = ''
+            else:
+                entry = self.totals[name]
+            lines.append('%-14s %6s %12s %10.2f %10.2f %10s' %(
+                name, entry['calls'], entry['count'], entry['wallSeconds'],
+                entry['cpuSeconds'], summaryValue(entry['peakRssMB'])))
+        return '\n'.join(lines) + '\n'
+
+    def write(self, profileFile, metadata):
+        file1 = open(profileFile,'w')
+        json.dump(self.report(metadata), file1, indent=2, sort_keys=True)
+        file1.close()
+        return profileFile
+
+# without -profile, hooks do nothing
+class NoProfile:
+
+    def start(self):
+        return None
+
+    def stop(self, name, started, count=0):
+        pass
+
+noProfile = NoProfile()
+
+def cpuTime():
+    times = os.times()
+    return times[0] + times[1]
+
+#=================================================================
+# peakMemory
+# Peak resident memory (working set on Windows) of this process in MB, or
+# None if it cannot be found
+
+def peakMemory():
+    try:
+        import resource
+    except ImportError:
+        return windowsPeakMemory()
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on Mac OS
+    if sys.platform == 'darwin':
+        return round(peak/1024.0/1024.0, 1)
+    return round(peak/1024.0, 1)
+
+def windowsPeakMemory():
+    try:
+        import ctypes
+        from ctypes import wintypes
+        class ProcessMemoryCounters(ctypes.Structure):
+            _fields_ = [('cb', wintypes.DWORD),
+                        ('PageFaultCount', wintypes.DWORD),
+                        ('PeakWorkingSetSize', ctypes.c_size_t),
+                        ('WorkingSetSize', ctypes.c_size_t),
+                        ('QuotaPeakPagedPoolUsage', ctypes.c_size_t),
+                        ('QuotaPagedPoolUsage', ctypes.c_size_t),
+                        ('QuotaPeakNonPagedPoolUsage', ctypes.c_size_t),
+                        ('QuotaNonPagedPoolUsage', ctypes.c_size_t),
+                        ('PagefileUsage', ctypes.c_size_t),
+                        ('PeakPagefileUsage', ctypes.c_size_t)]
+        counters = ProcessMemoryCounters()
+        counters.cb = ctypes.sizeof(counters)
+        process = ctypes.windll.kernel32.GetCurrentProcess()
+        if not ctypes.windll.psapi.GetProcessMemoryInfo(process, ctypes.byref(counters),
+                                                        counters.cb):
+            return None
+        return round(counters.PeakWorkingSetSize/1024.0/1024.0, 1)
+    except Exception:
+        return None
+
+#=================================================================
+# profileName
+# Name of the -profile report, next to the results file
+
+def profileName(outputFile):
+    return binaryName(outputFile) + '.profile.json'
+
+#=================================================================
+# fieldArrays
+# Read a field output as contiguous numpy arrays from its bulk data blocks.
+# Returns element labels, integration points, and data with one row per
+# integration point (one column per component, or a flat array for scalars),
+# and the instanceCode of each row. Data is kept in the precision stored in
+# the ODB.
+
+def fieldArrays(field):
+    blocks = [b for b in field.bulkDataBlocks if len(b.elementLabels)]
+    if not blocks:
+        # no values in the region, e.g. a block of elements without output
+        nComponents = len(field.componentLabels)
+        shape = 0
+        if nComponents > 1:
+            shape = (0, nComponents)
+        return (numpy.zeros(0, dtype=numpy.int32), numpy.zeros(0, dtype=numpy.int32),
+                numpy.zeros(shape, dtype=numpy.float32), numpy.zeros(0, dtype=numpy.int16))
+    el = numpy.concatenate([b.elementLabels for b in blocks])
+    ip = numpy.concatenate([b.integrationPoints for b in blocks])
+    data = numpy.concatenate([numpy.asarray(b.data)\
+                              .reshape(len(b.elementLabels), -1) for b in blocks])
+    if data.shape[1] == 1:
+        data = data[:,0]
+    inst = numpy.concatenate([numpy.repeat(numpy.int16(instanceCode(instanceName(b.instance))),
+                                           len(b.elementLabels)) for b in blocks])
+    return el, ip, data, inst
+
+#=================================================================
+# instanceCode
+# Small integer for each part instance name, the same for every ODB opened
+# by this process, so that rows from different ODBs can be matched
+
+instanceCodes = {}
+
+def instanceCode(name):
+    if name not in instanceCodes:
+        instanceCodes[name] = len(instanceCodes)
+    return instanceCodes[name]
+
+def instanceName(instance):
+    if instance is None:
+        return ''
+    return instance.name
+
+#=================================================================
+# labelKeys
+# One integer key per row from instance code, element label and integration
+# point, for matching rows between fields, frames and ODBs
+
+def labelKeys(inst, el, ip):
+    return (inst.astype(numpy.int64) << 48) | (el.astype(numpy.int64) << 16) |\
+           ip.astype(numpy.int64)
+
+#=================================================================
+# LabelIndex
+# Sorted index of the (instance, element, integration point) keys of the
+# reference field. Data from any other field is matched to the reference
+# rows through the index, rather than assuming both are in the same order.
+
+class LabelIndex:
+
+    def __init__(self, keys):
+        self.keys = keys
+        self.order = numpy.argsort(keys, kind='mergesort')
+        self.sortedKeys = keys[self.order]
+        if numpy.any(self.sortedKeys[1:] == self.sortedKeys[:-1]):
+            raise ValueError('Element and integration point labels are not '
+                             'unique. Section point results are not supported.')
+
+    # Returns data rearranged to the reference rows, a boolean array of the
+    # reference rows that were found, and the number of rows of data that
+    # are not in the reference.
+    def align(self, keys, data):
+        n = len(self.keys)
+        if numpy.array_equal(keys, self.keys):
+            return data, numpy.ones(n, dtype=bool), 0
+        pos = numpy.searchsorted(self.sortedKeys, keys)
+        pos[pos == n] = 0
+        match = self.sortedKeys[pos] == keys
+        rows = self.order[pos[match]]
+        aligned = numpy.zeros((n,) + data.shape[1:], dtype=data.dtype)
+        aligned[rows] = data[match]
+        found = numpy.zeros(n, dtype=bool)
+        found[rows] = True
+        return aligned, found, int(len(keys) - numpy.sum(match))
+
+#=================================================================
+# fullTensor
+# Arrange tensor components as (11, 22, 33, 12, 13, 23) columns, filling
+# components that are not output (plane stress, shells) with zero.
+# shearFactor converts engineering shear strain to tensor shear strain.
+
+tensorComponents = ('11', '22', '33', '12', '13', '23')
+
+def fullTensor(data, componentLabels, shearFactor=1.0):
+    # .016 stored component by component, so each component is contiguous
+    t = numpy.zeros((6, len(data)))
+    for j, label in enumerate(componentLabels):
+        t[tensorComponents.index(label[-2:])] = data[:,j]
+    t[3:] *= shearFactor
+    return t.T
+
+#=================================================================
+# principalValues
+# Minimum and maximum principal values of symmetric 3x3 tensors, from the
+# closed form (trigonometric) solution of the characteristic equation, in
+# double precision, for -cycle full and the frame by frame search of its
+# peaks and valleys. These agree with numpy.linalg.eigvalsh to about 1e-14 of
+# the largest principal value of the tensor, or 2e-8 where two principal
+# values are equal (e.g. uniaxial stress), as the closed form loses half its
+# digits there; either way they agree with the single precision principal
+# values of Abaqus to about 1e-7 of the largest.
+
+def principalValues(t):
+    a11, a22, a33, a12, a13, a23 = [t[:,j] for j in range(6)]
+    q = (a11 + a22 + a33)/3.0
+    b11 = a11 - q
+    b22 = a22 - q
+    b33 = a33 - q
+    p = numpy.sqrt((b11*b11 + b22*b22 + b33*b33 +
+                    2.0*(a12*a12 + a13*a13 + a23*a23))/6.0)
+    detB = b11*(b22*b33 - a23*a23) - a12*(a12*b33 - a23*a13) +\
+           a13*(a12*a23 - b22*a13)
+    r = 0.5*detB/numpy.where(p > 0, p, 1.0)**3
+    phi = numpy.arccos(numpy.clip(r, -1.0, 1.0))/3.0
+    pMax = q + 2.0*p*numpy.cos(phi)
+    pMin = q + 2.0*p*numpy.cos(phi + 2.0*numpy.pi/3.0)
+    return pMin, pMax
+
+#=================================================================
+# cycleInvariants
+# Mean and amplitude tensors of a cycle, 0.5*(load + unload) and
+# 0.5*(load - unload), and their principal values, from the component arrays
+# of the two states (the peak and valley of -cycle full), in one pass. Each tensor is
+# assembled component by component in a (6, n) array, so that components are
+# contiguous, without building full load and unload tensors first. Returns
+# the maximum principal value of the mean, and the minimum and maximum
+# principal values of the amplitude (None where not wanted).
+
+def cycleInvariants(load, unload, componentLabels, shearFactor=1.0,
+                    mean=True, amp=True):
+    n = len(load)
+    meanT = ampT = None
+    if mean:
+        meanT = numpy.zeros((6, n))
+    if amp:
+        ampT = numpy.zeros((6, n))
+    for j, label in enumerate(componentLabels):
+        k = tensorComponents.index(label[-2:])
+        factor = 0.5
+        if k >= 3:
+            factor = 0.5*shearFactor
+        # sums in double precision, whatever the precision of the odb
+        if mean:
+            meanT[k] = load[:,j]
+            meanT[k] += unload[:,j]
+            meanT[k] *= factor
+        if amp:
+            ampT[k] = load[:,j]
+            ampT[k] -= unload[:,j]
+            ampT[k] *= factor
+    meanMax = ampMin = ampMax = None
+    if mean:
+        meanMax = principalValues(meanT.T)[1]
+    if amp:
+        ampMin, ampMax = principalValues(ampT.T)
+    return meanMax, ampMin, ampMax
+
+#=================================================================
+# absMaxPrincipal
+# Signed principal value with the largest magnitude
+
+def absMaxPrincipal(pMin, pMax):
+    return numpy.where(numpy.abs(pMax) > numpy.abs(pMin), pMax, pMin)
+
+#=================================================================
+# columnDefinitions
+# Name and description of each column of the results file, in order
+
+columnDefinitions = [
+    ('el',     'element number'),
+    ('ip',     'integration point'),
+    ('cycEM',  'maximum principal cyclic mean strain'),
+    ('cycEA',  'absolute maximum principal cyclic strain amplitude'),
+    ('cycTau', 'cyclic maximum shear strain'),
+    ('cycSM',  'maximum principal cyclic mean stress'),
+    ('cycSA',  'absolute maximum principal cyclic stress amplitude'),
+    ('preE',   'pre-strain (strain conditioning, e.g. strain during crimping)'),
+    ('preS',   'pre-stress (stress conditioning, e.g. stress during crimping)'),
+    ('preP',   'hydrostatic pressure during pre-conditioning (compression positive, tension negative)'),
+    ('preM',   'volume fraction martensite during pre-conditioning'),
+    ('preV',   'integration point volume during pre-conditioning'),
+    ('ldE',    'maximum principal strain during loading frame of fatigue cycle'),
+    ('ldTau',  'maximum shear strain during loading frame of fatigue cycle'),
+    ('ldS',    'maximum principal stress during loading frame of fatigue cycle'),
+    ('ldP',    'hydrostatic pressure during loading frame of fatigue cycle'),
+    ('ldM',    'volume fraction martensite during loading frame of fatigue cycle'),
+    ('ldV',    'integration point volume during loading frame of fatigue cycle'),
+    ('ulE',    'maximum principal strain during unloading frame of fatigue cycle'),
+    ('ulTau',  'maximum shear strain during unloading frame of fatigue cycle'),
+    ('ulS',    'maximum principal stress during unloading frame of fatigue cycle'),
+    ('ulP',    'hydrostatic pressure during unloading frame of fatigue cycle'),
+    ('ulM',    'volume fraction martensite during unloading frame of fatigue cycle'),
+    ('ulV',    'integration point volume during unloading frame of fatigue cycle'),
+    ('ldS11',  'loading stress in material 1 direction (r)'),
+    ('ldS22',  'loading stress in material 2 direction (theta)'),
+    ('ldS33',  'loading stress in material 3 direction (Z)'),
+    ('ulS11',  'unloading stress in material 1 direction (r)'),
+    ('ulS22',  'unloading stress in material 2 direction (theta)'),
+    ('ulS33',  'unloading stress in material 3 direction (Z)'),
+    ('ldE11',  'loading strain in material 1 direction (r)'),
+    ('ldE22',  'loading strain in material 2 direction (theta)'),
+    ('ldE33',  'loading strain in material 3 direction (Z)'),
+    ('ulE11',  'unloading strain in material 1 direction (r)'),
+    ('ulE22',  'unloading strain in material 2 direction (theta)'),
+    ('ulE33',  'unloading strain in material 3 direction (Z)'),
+    ]
+
+#=================================================================
+# coordinateDefinitions
+# Integration point coordinate columns, written only with -xyz (or if named
+# with -columns), after the standard columns
+
+coordinateFrames = [('crimp', 'pre', 'pre-conditioning'),
+                    ('load', 'ld', 'loading frame of fatigue cycle'),
+                    ('unload', 'ul', 'unloading frame of fatigue cycle')]
+
+coordinateDefinitions = []
+for frameKey, prefix, frameDescription in coordinateFrames:
+    for c in ('1', '2', '3'):
+        coordinateDefinitions.append((prefix + 'C' + c,
+            'coordinate %s of integration point during %s' % (c, frameDescription)))
+
+#=================================================================
+# rawInputs
+# Raw arrays read from the ODB, in the order they are read, with the frame
+# each one comes from, its field output, and the invariant of the field
+# (getScalarField) or None for the components. Frames are 'crimp', 'load'
+# and 'unload', or 'mean' and 'amp', the cycle mean 0.5*(load + unload) and
+# amplitude 0.5*(load - unload) calculated by Abaqus field arithmetic.
+
+rawInputs = [
+    ('crimpLEmax',   'crimp',  'LE',    MAX_PRINCIPAL),
+    ('crimpSmax',    'crimp',  'S',     MAX_PRINCIPAL),
+    ('crimpSpress',  'crimp',  'S',     PRESS),
+    ('crimpIVOL',    'crimp',  'IVOL',  None),
+    ('crimpSDV21',   'crimp',  'SDV21', None),
+    ('loadLE',       'load',   'LE',    None),
+    ('loadLEmax',    'load',   'LE',    MAX_PRINCIPAL),
+    ('loadLEmin',    'load',   'LE',    MIN_PRINCIPAL),
+    ('loadS',        'load',   'S',     None),
+    ('loadSmax',     'load',   'S',     MAX_PRINCIPAL),
+    ('loadSpress',   'load',   'S',     PRESS),
+    ('loadIVOL',     'load',   'IVOL',  None),
+    ('loadSDV21',    'load',   'SDV21', None),
+    ('unloadLE',     'unload', 'LE',    None),
+    ('unloadLEmax',  'unload', 'LE',    MAX_PRINCIPAL),
+    ('unloadLEmin',  'unload', 'LE',    MIN_PRINCIPAL),
+    ('unloadS',      'unload', 'S',     None),
+    ('unloadSmax',   'unload', 'S',     MAX_PRINCIPAL),
+    ('unloadSpress', 'unload', 'S',     PRESS),
+    ('unloadIVOL',   'unload', 'IVOL',  None),
+    ('unloadSDV21',  'unload', 'SDV21', None),
+    ('meanLEmax',    'mean',   'LE',    MAX_PRINCIPAL),
+    ('ampLEmax',     'amp',    'LE',    MAX_PRINCIPAL),
+    ('ampLEmin',     'amp',    'LE',    MIN_PRINCIPAL),
+    ('meanSmax',     'mean',   'S',     MAX_PRINCIPAL),
+    ('ampSmax',      'amp',    'S',     MAX_PRINCIPAL),
+    ('ampSmin',      'amp',    'S',     MIN_PRINCIPAL),
+    ('crimpCOORD',   'crimp',  'COORD', None),
+    ('loadCOORD',    'load',   'COORD', None),
+    ('unloadCOORD',  'unload', 'COORD', None),
+    ]
+
+#=================================================================
+# columnInputs
+# Raw arrays needed to calculate each column
+
+columnInputs = {
+    'el':     (),
+    'ip':     (),
+    'cycEM':  ('meanLEmax',),
+    'cycEA':  ('ampLEmin', 'ampLEmax'),
+    'cycTau': ('ampLEmin', 'ampLEmax'),
+    'cycSM':  ('meanSmax',),
+    'cycSA':  ('ampSmin', 'ampSmax'),
+    'preE':   ('crimpLEmax',),
+    'preS':   ('crimpSmax',),
+    'preP':   ('crimpSpress',),
+    'preM':   ('crimpSDV21',),
+    'preV':   ('crimpIVOL',),
+    }
+for frameKey, prefix in (('load', 'ld'), ('unload', 'ul')):
+    columnInputs.update({
+        prefix + 'E':   (frameKey + 'LEmax',),
+        prefix + 'Tau': (frameKey + 'LEmin', frameKey + 'LEmax'),
+        prefix + 'S':   (frameKey + 'Smax',),
+        prefix + 'P':   (frameKey + 'Spress',),
+        prefix + 'M':   (frameKey + 'SDV21',),
+        prefix + 'V':   (frameKey + 'IVOL',),
+        })
+    for c in ('11', '22', '33'):
+        columnInputs[prefix + 'S' + c] = (frameKey + 'S',)
+        columnInputs[prefix + 'E' + c] = (frameKey + 'LE',)
+for frameKey, prefix, frameDescription in coordinateFrames:
+    for c in ('1', '2', '3'):
+        columnInputs[prefix + 'C' + c] = (frameKey + 'COORD',)
+
+#=================================================================
+# selectColumns
+# Column definitions for a list of column names, in the standard order.
+# Element and integration point labels are always included. Coordinate
+# columns of the frames in xyzFrames ('crimp', 'load' or 'unload') are added.
+
+def selectColumns(names=None, xyzFrames=None):
+    if names is None:
+        names = [name for name, description in columnDefinitions]
+    unknown = [name for name in names if name not in columnInputs]
+    if unknown:
+        raise ValueError('Unknown column(s) %s. Available columns are: %s' %
+                         (', '.join(unknown), ', '.join(
+                             [name for name, description in
+                              columnDefinitions + coordinateDefinitions])))
+    names = set(names) | set(['el', 'ip'])
+    for frameKey in xyzFrames or []:
+        prefixes = [prefix for key, prefix, d in coordinateFrames if key == frameKey]
+        if not prefixes:
+            raise ValueError('Unknown frame %s for coordinates. Use crimp, load '
+                             'or unload.' % frameKey)
+        names.update([prefixes[0] + 'C' + c for c in ('1', '2', '3')])
+    return [(name, description) for name, description in
+            columnDefinitions + coordinateDefinitions if name in names]
+
+#=================================================================
+# regionOfInterest
+# Region that field output is restricted to before any values are read:
+# the part instance, or an element set of the part instance or assembly.
+# Returns a list of regions, applied in turn with getSubset. Raises KeyError
+# if the element set does not exist.
+
+def regionOfInterest(odb, partInstance, elsetName=None):
+    regions = []
+    if partInstance != 'ASSEMBLY':
+        instance = odb.rootAssembly.instances[partInstance]
+        regions.append(instance)
+        if elsetName and elsetName in instance.elementSets.keys():
+            regions.append(instance.elementSets[elsetName])
+            return regions
+    if elsetName:
+        if elsetName not in odb.rootAssembly.elementSets.keys():
+            raise KeyError(elsetName)
+        regions.append(odb.rootAssembly.elementSets[elsetName])
+    return regions
+
+#=================================================================
+# IvolError
+# Error with a message for the user, raised where the script cannot simply
+# print the message and return
+
+class IvolError(Exception):
+    pass
+
+#=================================================================
+# checkOdb
+# Check that the step and part instance exist in an odb
+
+def checkOdb(odb, odbName, stepName, partInstance, hint=None):
+    availableSteps = odb.steps.keys()
+    if stepName not in availableSteps:
+        message = 'Error: The step %s does not exist in odb %s\n'\
+                  '\tCheck for the case in the step name.\n'\
+                  '\tIt should be one of these: %s' %(stepName, odbName, availableSteps)
+        if hint:
+            message += '\n' + hint
+        raise IvolError(message)
+
+    availablePartInstances = odb.rootAssembly.instances.keys()
+    if partInstance not in availablePartInstances and\
+        partInstance != 'ASSEMBLY':
+        raise IvolError('Error: The part instance %s does not exist in the odb %s.\n'\
+              '\tCheck for the case of the part instance name.\n'\
+              '\tIt should be one of these: %s' % (partInstance,odbName,availablePartInstances))
+
+#=================================================================
+# labelBlocks
+# Labels of field arrays as the bulk data blocks of FrameSource.labels: the
+# element labels of each run of rows of one part instance, with its instance
+# code and largest integration point
+
+def labelBlocks(el, ip, inst):
+    bounds = numpy.concatenate(([0], numpy.nonzero(inst[1:] != inst[:-1])[0] + 1,
+                                [len(el)]))
+    return [(el[a:b], inst[a], int(ip[a:b].max()))
+            for a, b in zip(bounds[:-1], bounds[1:]) if b > a]
+
+#=================================================================
+# FrameSource
+# Reads fields of one frame, restricted to the region of interest. getOdb
+# returns the open odb, and is only called when a field is not in the cache.
+# partition (see planPartitions) further restricts fields to the elements of
+# one partition of a -workers run, or one block of planBlocks. Element
+# centroids are kept in meshes, if given, for the sources of other blocks.
+
+class FrameSource:
+
+    def __init__(self, getOdb, odbName, stepName, frameIndex, partInstance,
+                 elsetName=None, cache=None, keep=False, profile=noProfile,
+                 partition=None, meshes=None):
+        self.getOdb = getOdb
+        self.odbName = odbName
+        self.stepName = stepName
+        self.frameIndex = frameIndex
+        self.partInstance = partInstance
+        self.elsetName = elsetName
+        self.cache = cache
+        self.keep = keep
+        self.profile = profile
+        self.partition = partition
+        self.meshes = meshes
+        self.fields = {}
+        self.frame = None
+        self.regions = None
+        self.partitionKeys = None
+        self.digest = None
+
+    # Returns element labels, integration points, data, instance codes and
+    # component labels of a field, as from fieldArrays, or of its invariant
+    # (e.g. MAX_PRINCIPAL) if given. With keep=True, fields are kept in
+    # memory for the next read.
+    def read(self, fieldName, invariant=None):
+        name = fieldName
+        if invariant is not None:
+            name = (fieldName, str(invariant))
+        if name in self.fields:
+            return self.fields[name]
+        if self.cache is not None:
+            cacheKey = self.cache.key(self.odbName, self.stepName, self.frameIndex,
+                                      self.partInstance, self.regionName(), name)
+            started = self.profile.start()
+            cached = self.cache.load(cacheKey)
+            if cached is not None:
+                self.profile.stop('cacheLoad', started, len(cached[0]))
+                if self.keep:
+                    self.fields[name] = cached
+                return cached
+        field = self.field(fieldName)
+        started = self.profile.start()
+        if invariant is not None:
+            field = field.getScalarField(invariant=invariant)
+        result = self.arrays(field)
+        self.profile.stop('readField', started, len(result[0]))
+        if self.cache is not None:
+            started = self.profile.start()
+            self.cache.save(cacheKey, *result)
+            self.profile.stop('cacheSave', started, len(result[0]))
+        if self.keep:
+            self.fields[name] = result
+        return result
+
+    # Element labels of each bulk data block of a field, without its data,
+    # with the instance code and largest integration point of the block, for
+    # planBlocks and planPartitions. Labels of a field in memory or in the
+    # cache are not read again; labels read are cached.
+    def labels(self, fieldName):
+        name = (fieldName, 'labels')
+        cached = self.fields.get(fieldName)
+        if cached is None and self.cache is not None:
+            cacheKey = self.cache.key(self.odbName, self.stepName, self.frameIndex,
+                                      self.partInstance, self.regionName(), name)
+            started = self.profile.start()
+            cached = self.cache.load(cacheKey)
+            if cached is not None:
+                self.profile.stop('cacheLoad', started, len(cached[0]))
+        if cached is not None:
+            el, ip, data, inst, componentLabels = cached
+            return labelBlocks(el, ip, inst)
+        field = self.field(fieldName)
+        started = self.profile.start()
+        # only the labels are kept, so that the data of the blocks is released
+        blocks = [(numpy.asarray(b.elementLabels), numpy.asarray(b.integrationPoints),
+                   instanceCode(instanceName(b.instance))) for b in field.bulkDataBlocks]
+        result = [(el, code, int(ip.max())) for el, ip, code in blocks if len(el)]
+        self.profile.stop('readLabels', started, sum([len(el) for el, c, m in result]))
+        if self.cache is not None:
+            started = self.profile.start()
+            el = numpy.concatenate([el for el, ip, code in blocks] +
+                                   [numpy.zeros(0, dtype=numpy.int32)])
+            ip = numpy.concatenate([ip for el, ip, code in blocks] +
+                                   [numpy.zeros(0, dtype=numpy.int32)])
+            inst = numpy.concatenate([numpy.repeat(numpy.int16(code), len(el))
+                                      for el, ip, code in blocks] +
+                                     [numpy.zeros(0, dtype=numpy.int16)])
+            self.cache.save(cacheKey, el, ip, numpy.zeros(0, dtype=numpy.float32), inst, ())
+            self.profile.stop('cacheSave', started, len(el))
+        return result
+
+    # Element set, and the checksum of the element labels of the partition,
+    # for cache keys
+    def regionName(self):
+        if self.partition is None:
+            return self.elsetName
+        if self.digest is None:
+            self.digest = partitionDigest(self.partition)
+        return (self.elsetName, self.digest)
+
+    # The field output of the frame, restricted to the region of interest
+    def field(self, fieldName):
+        if self.frame is None:
+            odb = self.getOdb()
+            started = self.profile.start()
+            try:
+                self.regions = regionOfInterest(odb, self.partInstance, self.elsetName)
+            except KeyError:
+                raise IvolError('Error: The element set %s does not exist in part instance %s\n'\
+                      '\tor the assembly of odb %s.\n'\
+                      '\tCheck for the case of the element set name.' % (self.elsetName,self.partInstance,self.odbName))
+            if self.partition is not None:
+                region = partitionRegion(odb, self.odbName, self.partInstance, self.partition)
+                if region is None:
+                    # rows outside the partition are dropped once read
+                    self.partitionKeys = partitionKeys(self.partition)
+                else:
+                    self.regions.append(region)
+            self.frame = odb.steps[self.stepName].frames[self.frameIndex]
+        else:
+            started = self.profile.start()
+        field = self.frame.fieldOutputs[fieldName]
+        for region in self.regions:
+            field = field.getSubset(region=region)
+        self.profile.stop('subset', started)
+        return field
+
+    # Arrays of a field from field(), as read()
+    def arrays(self, field):
+        el, ip, data, inst = fieldArrays(field)
+        if self.partitionKeys is not None:
+            keep = numpy.in1d(labelKeys(inst, el, numpy.zeros_like(el)), self.partitionKeys)
+            el, ip, data, inst = el[keep], ip[keep], data[keep], inst[keep]
+        return (el, ip, data, inst, tuple(field.componentLabels))
+
+    # Element labels, undeformed centroids and instance codes of the elements
+    # of the part instance, for coordinates when COORD is not in the odb
+    def centroids(self):
+        meshKey = (self.odbName, self.partInstance)
+        if self.meshes is not None and meshKey in self.meshes:
+            return self.meshes[meshKey]
+        started = self.profile.start()
+        result = elementCentroids(self.getOdb(), self.partInstance)
+        self.profile.stop('centroids', started, len(result[0]))
+        if self.meshes is not None:
+            self.meshes[meshKey] = result
+        return result
+
+#=================================================================
+# CycleSource
+# Reads invariants of the cycle mean, 0.5*(load + unload), or amplitude,
+# 0.5*(load - unload), of a field, from the FrameSources of the load and
+# unload frames. The mean and amplitude are calculated by Abaqus field
+# arithmetic, in the precision of the odb, as by ivolResults.004.py before
+# .005, so that their principal values are the same. Fields are cached with
+# those of the load frame, if it has a cache.
+
+class CycleSource:
+
+    def __init__(self, load, unload, cycleKey):
+        self.load = load
+        self.unload = unload
+        self.cycleKey = cycleKey
+        self.profile = load.profile
+
+    def read(self, fieldName, invariant=None):
+        load = self.load
+        cache = load.cache
+        if cache is not None:
+            cacheKey = cache.key(load.odbName, load.stepName,
+                                 (self.cycleKey, load.frameIndex, self.unload.frameIndex),
+                                 load.partInstance, load.regionName(),
+                                 (fieldName, str(invariant)))
+            started = self.profile.start()
+            cached = cache.load(cacheKey)
+            if cached is not None:
+                self.profile.stop('cacheLoad', started, len(cached[0]))
+                return cached
+        loadField = load.field(fieldName)
+        unloadField = self.unload.field(fieldName)
+        started = self.profile.start()
+        if self.cycleKey == 'mean':
+            field = 0.5*(loadField + unloadField)
+        else:
+            field = 0.5*(loadField - unloadField)
+        result = load.arrays(field.getScalarField(invariant=invariant))
+        self.profile.stop('cycleField', started, len(result[0]))
+        if cache is not None:
+            started = self.profile.start()
+            cache.save(cacheKey, *result)
+            self.profile.stop('cacheSave', started, len(result[0]))
+        return result
+
+#=================================================================
+# elementCentroids
+# Element labels, centroids (mean of the node coordinates, in the reference
+# configuration) and instance codes of every element of the part instance,
+# or of every instance for ASSEMBLY. Elements are grouped by number of nodes
+# so that each group is averaged as one array.
+
+def elementCentroids(odb, partInstance):
+    if partInstance == 'ASSEMBLY':
+        instances = odb.rootAssembly.instances.values()
+    else:
+        instances = [odb.rootAssembly.instances[partInstance]]
+    els, centroids, insts = [], [], []
+    for instance in instances:
+        nodes = instance.nodes
+        if len(nodes) == 0:
+            continue
+        nodeLabels = numpy.array([node.label for node in nodes])
+        xyz = numpy.zeros((len(nodes), 3))
+        coordinates = numpy.array([node.coordinates for node in nodes], dtype=numpy.float64)
+        xyz[:, :coordinates.shape[1]] = coordinates
+        order = numpy.argsort(nodeLabels)
+        nodeLabels = nodeLabels[order]
+        xyz = xyz[order]
+        groups = {}
+        for element in instance.elements:
+            groups.setdefault(len(element.connectivity), []).append(element)
+        for nNodes, elements in groups.items():
+            connectivity = numpy.array([element.connectivity for element in elements])
+            rows = numpy.searchsorted(nodeLabels, connectivity)
+            els.append(numpy.array([element.label for element in elements], dtype=numpy.int32))
+            centroids.append(xyz[rows].mean(axis=1))
+            insts.append(numpy.repeat(numpy.int16(instanceCode(instance.name)),
+                                      len(elements)))
+    if not els:
+        return (numpy.zeros(0, dtype=numpy.int32), numpy.zeros((0, 3)),
+                numpy.zeros(0, dtype=numpy.int16))
+    return numpy.concatenate(els), numpy.concatenate(centroids), numpy.concatenate(insts)
+
+#=================================================================
+# FieldCache
+# Folder of field arrays already read from an odb, one .npz file per field,
+# keyed by odb path, size and modification time, step, frame, part instance,
+# element set (with a checksum of the element labels of a partition) and
+# field name. Files are evicted least recently used first
+# once the folder is larger than maxBytes.
+
+class FieldCache:
+
+    def __init__(self, cacheDir, maxBytes):
+        self.cacheDir = cacheDir
+        self.maxBytes = maxBytes
+        if not os.path.isdir(cacheDir):
+            os.makedirs(cacheDir)
+
+    def key(self, odbName, stepName, frameIndex, partInstance, elsetName, fieldName):
+        path = os.path.abspath(odbName)
+        stat = os.stat(path)
+        ident = repr((path, stat.st_size, stat.st_mtime, stepName, frameIndex,
+                      partInstance, elsetName, fieldName))
+        return hashlib.sha1(ident.encode('utf-8')).hexdigest()
+
+    def load(self, key):
+        path = os.path.join(self.cacheDir, key + '.npz')
+        if not os.path.isfile(path):
+            return None
+        try:
+            npz = numpy.load(path)
+            codes = numpy.array([instanceCode(str(name)) for name in npz['instNames']],
+                                dtype=numpy.int16)
+            result = (npz['el'], npz['ip'], npz['data'], codes[npz['inst']],
+                      tuple([str(label) for label in npz['componentLabels']]))
+            npz.close()
+        except Exception:
+            # unreadable (e.g. partly written) files are read from the odb again
+            return None
+        # mark as most recently used
+        os.utime(path, None)
+        return result
+
+    def save(self, key, el, ip, data, inst, componentLabels):
+        codes = numpy.unique(inst)
+        names = dict([(code, name) for name, code in instanceCodes.items()])
+        path = os.path.join(self.cacheDir, key + '.npz')
+        tmp = os.path.join(self.cacheDir, key + '.tmp.npz')
+        numpy.savez(tmp, el=el, ip=ip, data=data,
+                    inst=numpy.searchsorted(codes, inst).astype(numpy.int16),
+                    instNames=numpy.array([names[code] for code in codes], dtype=str),
+                    componentLabels=numpy.array(componentLabels, dtype=str))
+        if os.path.isfile(path):
+            os.remove(path)
+        os.rename(tmp, path)
+        self.evict()
+
+    def evict(self):
+        files = []
+        for name in os.listdir(self.cacheDir):
+            if name.endswith('.npz') and not name.endswith('.tmp.npz'):
+                path = os.path.join(self.cacheDir, name)
+                stat = os.stat(path)
+                files.append((stat.st_mtime, stat.st_size, path))
+        files.sort()
+        total = sum([size for mtime, size, path in files])
+        for mtime, size, path in files:
+            if total <= self.maxBytes:
+                break
+            os.remove(path)
+            total -= size
+
+#=================================================================
+# readRaw
+# Read only the raw arrays needed for the selected columns. frameSources maps
+# each frame key ('crimp', 'load', 'unload') to a FrameSource; frames are only
+# looked up if one of their fields is needed. The cycle mean and amplitude
+# are read through CycleSources of the load and unload frames.
+# Rows of every field are matched to the rows of the first field read by
+# element and integration point labels. Rows missing from any field are
+# reported and excluded.
+# If cycleSources (a FrameSource for every frame of the cycle step) is given,
+# cycle columns are calculated from the peak and valley state of each
+# integration point over all frames, rather than the load and unload frames.
+# Tensors of the load and unload frames already read for their own columns
+# are not read again by the scan.
+# Warnings in warned, if given, are not printed again, and those printed are
+# added to it, so that the blocks of one run do not repeat them.
+
+def readRaw(frameSources, names, cycleSources=None, profile=noProfile, warned=None):
+    needed = set()
+    scan = []
+    for name in names:
+        if cycleSources is not None and name.startswith('cyc'):
+            # .012 full cycle: scan every frame for this field instead
+            fieldName = [f for k, frameKey, f, invariant in rawInputs
+                         if k == columnInputs[name][0]][0]
+            if fieldName not in scan:
+                scan.append(fieldName)
+        else:
+            needed.update(columnInputs[name])
+    if not [key for key in needed if not key.endswith('COORD')] and not scan:
+        # labels only (or coordinates, which may be element centroids that
+        # cannot be the reference); read the smallest field
+        needed.add('crimpIVOL')
+
+    raw = {}
+    state = {}
+    sources = dict(frameSources)
+    for cycleKey in ('mean', 'amp'):
+        if cycleKey not in sources:
+            sources[cycleKey] = CycleSource(frameSources['load'], frameSources['unload'],
+                                            cycleKey)
+
+    # match rows of a field to the reference (first) field read
+    def align(key, fieldName, result):
+        started = profile.start()
+        el, ip, data, inst, componentLabels = result
+        keys = labelKeys(inst, el, ip)
+        if 'index' not in state:
+            raw['el'], raw['ip'], raw['inst'] = el, ip, inst
+            state['reference'] = key
+            state['index'] = LabelIndex(keys)
+            state['present'] = numpy.ones(len(keys), dtype=bool)
+        data, found, extra = state['index'].align(keys, data)
+        if not found.all():
+            print 'Warning: %i integration points of %s are missing from %s '\
+                  'and are excluded.' % (len(found) - numpy.sum(found), state['reference'], key)
+            state['present'] &= found
+        if extra:
+            print 'Warning: %i integration points of %s are not in %s '\
+                  'and are ignored.' % (extra, key, state['reference'])
+        if fieldName in ('LE', 'S') and componentLabels and 'labels' + fieldName not in raw:
+            raw['labels' + fieldName] = componentLabels
+        profile.stop('alignRows', started, len(keys))
+        return data
+
+    # .019 coordinates are read last, from COORD at the integration points if
+    # it is in the odb, otherwise from the element centroids
+    tensors = {}
+    for key, frameKey, fieldName, invariant in rawInputs:
+        if key not in needed:
+            continue
+        if fieldName == 'COORD':
+            raw[key] = readCoordinates(key, sources[frameKey], align, raw, state, warned)
+        else:
+            raw[key] = align(key, fieldName, sources[frameKey].read(fieldName, invariant))
+            if fieldName in scan and invariant is None and frameKey in ('load', 'unload'):
+                # frames of the cycle step, by index from 0, for the scan
+                frameIndex = sources[frameKey].frameIndex % len(cycleSources)
+                tensors[(frameIndex, fieldName)] = raw[key]
+
+    # .012 keep the state (tensor components) of each integration point at
+    # the frames with the highest (peak) and lowest (valley) maximum principal
+    # value, reading one frame at a time
+    for fieldName in scan:
+        peak = None
+        for source in cycleSources:
+            key = '%s frame %i' % (fieldName, source.frameIndex)
+            data = tensors.get((source.frameIndex, fieldName))
+            if data is None:
+                data = align(key, fieldName, source.read(fieldName))
+                source.frame = None
+            started = profile.start()
+            if fieldName == 'LE':
+                pMax = principalValues(fullTensor(data, raw['labelsLE'], 0.5))[1]
+            else:
+                pMax = principalValues(fullTensor(data, raw['labelsS']))[1]
+            if peak is None:
+                peak, peakValue = data.copy(), pMax
+                valley, valleyValue = data.copy(), pMax.copy()
+                profile.stop('cycleExtremes', started, len(data))
+                continue
+            up = pMax > peakValue
+            peak[up] = data[up]
+            peakValue[up] = pMax[up]
+            down = pMax < valleyValue
+            valley[down] = data[down]
+            valleyValue[down] = pMax[down]
+            profile.stop('cycleExtremes', started, len(data))
+            del data, pMax, up, down
+        raw['peak' + fieldName] = peak
+        raw['valley' + fieldName] = valley
+
+    if not state['present'].all():
+        started = profile.start()
+        for key in raw.keys():
+            if not key.startswith('labels'):
+                raw[key] = raw[key][state['present']]
+        profile.stop('alignRows', started)
+    return raw
+
+#=================================================================
+# readCoordinates
+# Coordinates (3 columns) of the reference rows of readRaw, from COORD field
+# output of the frame, or if the frame has no COORD output, from the
+# undeformed centroid of the element of each integration point.
+
+def readCoordinates(key, source, align, raw, state, warned=None):
+    try:
+        el, ip, data, inst, componentLabels = source.read('COORD')
+    except KeyError:
+        data = None
+    if data is not None:
+        xyz = numpy.zeros((len(el), 3), dtype=data.dtype)
+        xyz[:, :data.shape[1]] = data.reshape(len(el), -1)
+        return align(key, 'COORD', (el, ip, xyz, inst, componentLabels))
+
+    if 'centroids' not in state:
+        warning = 'Warning: COORD is not in the field output of %s; coordinates are '\
+                  'element centroids\n\tin the reference configuration.' % (key[:-5])
+        if warned is None or warning not in warned:
+            print warning
+            if warned is not None:
+                warned.add(warning)
+        el, centroids, inst = source.centroids()
+        state['centroids'] = (LabelIndex(labelKeys(inst, el, numpy.zeros_like(el))),
+                              centroids)
+    index, centroids = state['centroids']
+    keys = labelKeys(raw['inst'], raw['el'], numpy.zeros_like(raw['el']))
+    pos = numpy.searchsorted(index.sortedKeys, keys)
+    pos[pos == len(index.sortedKeys)] = 0
+    found = index.sortedKeys[pos] == keys
+    if not found.all():
+        print 'Warning: %i integration points of %s have no element in the mesh '\
+              'and are excluded.' % (len(found) - numpy.sum(found), state['reference'])
+        state['present'] &= found
+    return centroids[index.order[pos]]
+
+#=================================================================
+# deriveBlock
+# Calculate the named results columns for rows start:stop of the raw field
+# arrays read by readRaw. Returns a dictionary of column arrays.
+
+def deriveBlock(raw, start, stop, names):
+    b = slice(start, stop)
+    want = set(names)
+    col = {}
+    col['el'] = raw['el'][b]
+    col['ip'] = raw['ip'][b]
+
+    # principal values and pressure are those of Abaqus, in the precision of
+    # the odb; shear is calculated from them in double precision, as .004 did
+    def shear(key):
+        return numpy.abs(raw[key + 'max'][b].astype(numpy.float64) -
+                         raw[key + 'min'][b].astype(numpy.float64))/2
+
+    #####
+    ##### CRIMP (prestrain) frame results
+    #####
+
+    if 'preE' in want:
+        col['preE'] = raw['crimpLEmax'][b]
+    if 'preS' in want:
+        col['preS'] = raw['crimpSmax'][b]
+    if 'preP' in want:
+        col['preP'] = raw['crimpSpress'][b]
+    if 'preM' in want:
+        col['preM'] = raw['crimpSDV21'][b]
+    if 'preV' in want:
+        col['preV'] = raw['crimpIVOL'][b]
+
+    #####
+    ##### LOAD (fatigue+) and UNLOAD (fatigue-) frame results
+    #####
+
+    # .002 max and min principal strains, shear
+    # .003 add E11, E22, E33 and S11, S22, S33
+    for frameKey, prefix in (('load', 'ld'), ('unload', 'ul')):
+        if prefix + 'E' in want:
+            col[prefix + 'E'] = raw[frameKey + 'LEmax'][b]
+        if prefix + 'Tau' in want:
+            col[prefix + 'Tau'] = shear(frameKey + 'LE')
+        if prefix + 'S' in want:
+            col[prefix + 'S'] = raw[frameKey + 'Smax'][b]
+        if prefix + 'P' in want:
+            col[prefix + 'P'] = raw[frameKey + 'Spress'][b]
+        if prefix + 'M' in want:
+            col[prefix + 'M'] = raw[frameKey + 'SDV21'][b]
+        if prefix + 'V' in want:
+            col[prefix + 'V'] = raw[frameKey + 'IVOL'][b]
+        for j, c in enumerate(('11', '22', '33')):
+            if prefix + 'S' + c in want:
+                col[prefix + 'S' + c] = raw[frameKey + 'S'][b,j]
+            if prefix + 'E' + c in want:
+                if prefix == 'ul':
+                    # .004 and earlier report E11 in all three unloading strain
+                    # columns; preserved so results remain comparable
+                    col[prefix + 'E' + c] = raw[frameKey + 'LE'][b,0]
+                else:
+                    col[prefix + 'E' + c] = raw[frameKey + 'LE'][b,j]
+
+    # .019 integration point coordinates
+    for frameKey, prefix, frameDescription in coordinateFrames:
+        for j, c in enumerate(('1', '2', '3')):
+            if prefix + 'C' + c in want:
+                col[prefix + 'C' + c] = raw[frameKey + 'COORD'][b,j]
+
+    #####
+    ##### CYCLE results
+    #####
+
+    # tensor mean and amplitude values of the load and unload frames, from
+    # Abaqus field arithmetic (see CycleSource)
+    # .012 from the peak and valley states in full cycle mode, calculated by
+    # the script in double precision
+    # .016 mean and amplitude tensors and their principal values in one pass
+    if 'peakLE' in raw:
+        if want & set(['cycEM', 'cycEA', 'cycTau']):
+            amp = bool(want & set(['cycEA', 'cycTau']))
+            cycEM, cycE1, cycE3 = cycleInvariants(
+                raw['peakLE'][b], raw['valleyLE'][b],
+                raw['labelsLE'], 0.5, mean='cycEM' in want, amp=amp)
+            if 'cycEM' in want:
+                col['cycEM'] = cycEM
+            if amp:
+                # strain amplitude (signed absolute maximum) and .002 cyclic shear
+                col['cycEA'] = absMaxPrincipal(cycE1, cycE3)
+                col['cycTau'] = numpy.abs(cycE3 - cycE1)/2
+    else:
+        if 'cycEM' in want:
+            col['cycEM'] = raw['meanLEmax'][b]
+        if want & set(['cycEA', 'cycTau']):
+            col['cycEA'] = absMaxPrincipal(raw['ampLEmin'][b], raw['ampLEmax'][b])
+            col['cycTau'] = shear('ampLE')
+
+    if 'peakS' in raw:
+        if want & set(['cycSM', 'cycSA']):
+            cycSM, cycS1, cycS3 = cycleInvariants(
+                raw['peakS'][b], raw['valleyS'][b],
+                raw['labelsS'], mean='cycSM' in want, amp='cycSA' in want)
+            if 'cycSM' in want:
+                col['cycSM'] = cycSM
+            if 'cycSA' in want:
+                col['cycSA'] = absMaxPrincipal(cycS1, cycS3)
+    else:
+        if 'cycSM' in want:
+            col['cycSM'] = raw['meanSmax'][b]
+        if 'cycSA' in want:
+            col['cycSA'] = absMaxPrincipal(raw['ampSmin'][b], raw['ampSmax'][b])
+
+    return col
+
+#=================================================================
+# updateSummary
+# Accumulate total volume, maximum mean strain and (signed) maximum
+# absolute strain amplitude over a block of results. Totals of columns
+# that were not selected stay None.
+
+def newSummary(nRows, names):
+    summary = {'nRows': nRows, 'vTotal': None, 'cycEMmax': None, 'cycEAmax': None}
+    for key, name in (('vTotal', 'preV'), ('cycEMmax', 'cycEM'), ('cycEAmax', 'cycEA')):
+        if name in names:
+            summary[key] = 0.0
+    return summary
+
+def updateSummary(summary, col):
+    if len(col['el']) == 0:
+        return
+    # columns derived only for the volume summary are not in the summary
+    if summary['vTotal'] is not None:
+        # added in row order, as by .004, rather than pairwise
+        volumes = numpy.concatenate(([summary['vTotal']], col['preV']))
+        summary['vTotal'] = float(numpy.add.accumulate(volumes)[-1])
+    if summary['cycEMmax'] is not None:
+        summary['cycEMmax'] = max(summary['cycEMmax'], float(col['cycEM'].max()))
+    if summary['cycEAmax'] is not None:
+        cycEA = col['cycEA']
+        iMax = numpy.argmax(numpy.abs(cycEA))
+        if abs(cycEA[iMax]) > abs(summary['cycEAmax']):
+            summary['cycEAmax'] = float(cycEA[iMax])
+
+#=================================================================
+# writeBlock
+# Format a block of rows with a single string operation and write it
+
+def writeBlock(outFile, rowFormat, columns):
+    n = len(columns[0])
+    if n == 0:
+        return
+    values = numpy.column_stack(columns).ravel().tolist()
+    outFile.write((rowFormat*n) % tuple(values))
+
+#=================================================================
+# columnFormat
+# Text format of a column: integers for labels, 6 significant digits otherwise
+
+def columnFormat(name):
+    if name in ('el', 'ip', 'nIp'):
+        return '%i'
+    return '%G'
+
+#=================================================================
+# summaryHeader
+# Summary information written at the top of the results file
+
+def summaryHeader(odbName, oldOdbLabel, summary):
+    headerString = ''
+    headerString += 'Results from ivolResults.py\n'
+    headerString += '===========================\n'
+    headerString += 'Output database:                        odb      = %s\n' % odbName
+    headerString += 'Crimping (prestrain) output database:   oldOdb   = %s\n' % oldOdbLabel
+    headerString += 'Number of integration points:           nRows    = %i\n' % summary['nRows']
+    headerString += 'Total volume:                           vTotal   = %s\n' % summaryValue(summary['vTotal'])
+    headerString += 'Maximum mean strain:                    cycEMmax = %s\n' % summaryValue(summary['cycEMmax'])
+    headerString += 'Maximum strain amplitude (abs):         cycEAmax = %s\n' % summaryValue(summary['cycEAmax'])
+    if 'elements' in summary:
+        headerString += 'Rows written (one per element):         elements = %i\n' % summary['elements']
+    if 'topK' in summary:
+        headerString += 'Rows written (largest only):            topK     = %i\n' % summary['topK']
+        headerString += 'Rows ranked by absolute value of:       rankBy   = %s\n' % summary['rankBy']
+    return headerString
+
+def summaryValue(value):
+    if value is None:
+        return 'NA'
+    return '%G' % value
+
+#=================================================================
+# columnHeader
+# Description of each column, followed by the line of column names
+
+def columnHeader(columns):
+    divider = '-----------------------------------------------------------------------------------------------\n'
+    columnDescription = divider
+    for name, description in columns:
+        columnDescription += '%-6s = %s\n' % (name, description)
+    columnDescription += divider
+    names = [name for name, description in columns]
+    if names == standardNames:
+        return columnDescription + standardColumnLine
+    return columnDescription + ', '.join(names) + '\n'
+
+#=================================================================
+# standardColumnLine, standardRowFormat
+# Line of column names and row format of the original script, used when all
+# of the standard columns are written, so that these files are byte for
+# byte those of the original script. Some commas are not followed by a space.
+
+standardNames = [name for name, description in columnDefinitions]
+
+standardColumnLine = 'el, ip, cycEM, cycEA, cycTau, cycSM, cycSA, preE, preS, preP, preM, preV, ldE, ldTau, ldS, ldP, ldM, ldV, ulE,' \
+                     'ulTau, ulS, ulP, ulM, ulV,'\
+                     'ldS11, ldS22, ldS33, ulS11, ulS22, ulS33,' \
+                     'ldE11, ldE22, ldE33, ulE11, ulE22, ulE33\n'
+
+standardRowFormat = '%i, %i,'\
+                    '%G, %G, %G, %G, %G, '\
+                    '%G, %G, %G, %G, %G, '\
+                    '%G, %G, %G, %G, %G, %G, '\
+                    '%G, %G, %G, %G, %G, %G, '\
+                    '%G, %G, %G, %G, %G, %G, '\
+                    '%G, %G, %G, %G, %G, %G\n'
+
+#=================================================================
+# CsvWriter
+# Text results file. Rows are written to a temporary file as each block is
+# completed, and copied below the summary header once the totals are known.
+# If bodyFiles is given, the rows are already formatted in those files (by
+# the workers of a -workers run), and are copied in turn instead.
+
+class CsvWriter:
+
+    profileName = 'writeCsv'
+
+    def __init__(self, outputFile, columns, nRows, bodyFiles=None):
+        self.outputFile = outputFile
+        self.columns = columns
+        self.names = [name for name, description in columns]
+        self.rowFormat = ', '.join([columnFormat(name) for name in self.names]) + '\n'
+        if self.names == standardNames:
+            self.rowFormat = standardRowFormat
+        self.bodyFile = outputFile + '.tmp'
+        self.bodyFiles = bodyFiles
+        self.body = None
+        if bodyFiles is None:
+            self.body = open(self.bodyFile,'w')
+            self.bodyFiles = [self.bodyFile]
+
+    def writeBlock(self, col):
+        if self.body is not None:
+            writeBlock(self.body, self.rowFormat, [col[name] for name in self.names])
+
+    def close(self, headerString, metadata):
+        if self.body is not None:
+            self.body.close()
+        file1 = open(self.outputFile,'w')
+        file1.write(headerString)
+        file1.write(columnHeader(self.columns))
+        for bodyFile in self.bodyFiles:
+            file2 = open(bodyFile,'r')
+            shutil.copyfileobj(file2, file1)
+            file2.close()
+        file1.close()
+        if self.body is not None:
+            os.remove(self.bodyFile)
+        return self.outputFile
+
+# rows only, without the header, for the parts of a -workers run
+class CsvBodyWriter(CsvWriter):
+
+    def close(self, headerString, metadata):
+        self.body.close()
+        if os.path.isfile(self.outputFile):
+            os.remove(self.outputFile)
+        os.rename(self.bodyFile, self.outputFile)
+        return self.outputFile
+
+def bodyName(outputFile):
+    return binaryName(outputFile) + '.body.csv'
+
+#=================================================================
+# NpyWriter
+# Columnar binary results: a folder with one .npy array per column, which
+# can be loaded with numpy.load(..., mmap_mode='r') without parsing, and
+# summary.json with the summary and column definitions as metadata. Arrays
+# are created for nRows rows; if more or fewer rows are written (e.g. rows
+# missing from a field of one block), they are copied to arrays of the
+# right length.
+
+class NpyWriter:
+
+    profileName = 'writeNpy'
+
+    def __init__(self, outputDir, columns, nRows):
+        self.outputDir = outputDir
+        self.columns = columns
+        self.nRows = nRows
+        self.arrays = {}
+        self.row = 0
+        if not os.path.isdir(outputDir):
+            os.makedirs(outputDir)
+
+    def openColumn(self, name, dtype):
+        self.arrays[name] = numpy.lib.format.open_memmap(
+            os.path.join(self.outputDir, name + '.npy'), mode='w+',
+            dtype=dtype, shape=(self.nRows,))
+
+    def writeBlock(self, col):
+        n = len(col['el'])
+        if self.row + n > self.nRows:
+            self.resize(max(self.row + n, 2*self.nRows))
+        for name, description in self.columns:
+            if name not in self.arrays:
+                self.openColumn(name, col[name].dtype)
+            self.arrays[name][self.row:self.row+n] = col[name]
+        self.row += n
+
+    def resize(self, nRows):
+        for name in self.arrays.keys():
+            path = os.path.join(self.outputDir, name + '.npy')
+            old = self.arrays.pop(name)
+            new = numpy.lib.format.open_memmap(path + '.tmp', mode='w+',
+                                               dtype=old.dtype, shape=(nRows,))
+            n = min(self.row, nRows)
+            new[:n] = old[:n]
+            new.flush()
+            # memory maps are closed before the files are replaced
+            del old, new
+            os.remove(path)
+            os.rename(path + '.tmp', path)
+            self.arrays[name] = numpy.load(path, mmap_mode='r+')
+        self.nRows = nRows
+
+    def close(self, headerString, metadata):
+        if self.row != self.nRows:
+            self.resize(self.row)
+        metadata = dict(metadata)
+        metadata['columns'] = []
+        for name, description in self.columns:
+            if name not in self.arrays:
+                self.openColumn(name, numpy.float64)
+            metadata['columns'].append({'name': name,
+                                        'description': description,
+                                        'dtype': self.arrays[name].dtype.str})
+            self.arrays[name].flush()
+        self.arrays = {}
+        file1 = open(os.path.join(self.outputDir, 'summary.json'),'w')
+        json.dump(metadata, file1, indent=2, sort_keys=True)
+        file1.close()
+        return self.outputDir
+
+#=================================================================
+# VolumeSummary
+# Volume weighted reductions of the results, accumulated one block at a
+# time as they are derived, as calculated by postprocessFEA.R from the
+# results file: total and transformed (martensite) volumes, maximum cyclic
+# values, exceedance curves (volume with strain or stress amplitude at or
+# above each threshold) and 2-D histograms of volume over (cycEM, cycEA) and
+# (cycSM, cycSA). Volumes are multiplied by the symmetry factor.
+# As in postprocessFEA.R, amplitudes are taken as absolute values, and set to
+# zero where the point is in hydrostatic compression for most of the cycle:
+# max(ldP, ulP) - |ldP - ulP|/10 > 0 (cyc.Tension.90pctl). Histograms and
+# exceedance curves are weighted by ldV.
+
+volumeColumns = ['cycEM', 'cycEA', 'cycSM', 'cycSA', 'preM', 'preV',
+                 'ldP', 'ldM', 'ldV', 'ulP', 'ulM', 'ulV']
+
+# bin edges; EA thresholds as postprocessFEA.R
+volumeBins = {
+    'EA': numpy.linspace(0.0, 0.03, 31),
+    'EM': numpy.linspace(-0.02, 0.08, 41),
+    'SA': numpy.linspace(0.0, 800.0, 41),
+    'SM': numpy.linspace(-400.0, 1200.0, 41),
+    }
+
+class VolumeSummary:
+
+    def __init__(self, symmetry=1.0):
+        self.symmetry = float(symmetry)
+        self.volumes = {'vTotal': 0.0, 'vTension': 0.0,
+                        'vXpre': 0.0, 'vXld': 0.0, 'vXul': 0.0}
+        self.maxima = {'EA': 0.0, 'EM': None, 'SA': 0.0, 'SM': None}
+        self.exceedance = {}
+        for name in ('EA', 'SA'):
+            self.exceedance[name] = numpy.zeros(len(volumeBins[name]))
+        self.histograms = {}
+        for x, y in (('EM', 'EA'), ('SM', 'SA')):
+            self.histograms[x + '-' + y] = [x, y, numpy.zeros((len(volumeBins[x]) - 1,
+                                                               len(volumeBins[y]) - 1)), 0.0]
+
+    def update(self, col):
+        if len(col['el']) == 0:
+            return
+        # sums in double precision, whatever the precision of the odb
+        s = self.symmetry
+        ldV = col['ldV'].astype(numpy.float64)*s
+        self.volumes['vTotal'] += float(numpy.sum(col['ulV'], dtype=numpy.float64))*s
+        for key, m, v in (('vXpre', 'preM', 'preV'), ('vXld', 'ldM', 'ldV'),
+                          ('vXul', 'ulM', 'ulV')):
+            self.volumes[key] += float(numpy.dot(col[m].astype(numpy.float64), col[v]))*s
+
+        ldP = col['ldP']
+        ulP = col['ulP']
+        tension = numpy.maximum(ldP, ulP) - numpy.abs(ldP - ulP)/10 <= 0
+        self.volumes['vTension'] += float(numpy.sum(ldV[tension]))
+        values = {'EM': col['cycEM'], 'SM': col['cycSM'],
+                  'EA': numpy.where(tension, numpy.abs(col['cycEA']), 0.0),
+                  'SA': numpy.where(tension, numpy.abs(col['cycSA']), 0.0)}
+
+        for name in self.maxima:
+            if tension.any():
+                value = float(values[name][tension].max())
+                if self.maxima[name] is None or value > self.maxima[name]:
+                    self.maxima[name] = value
+
+        # volume in [threshold k, threshold k+1), summed from the top at the end
+        for name in self.exceedance:
+            thresholds = volumeBins[name]
+            k = numpy.searchsorted(thresholds, values[name], side='right') - 1
+            self.exceedance[name] += numpy.bincount(k, weights=ldV,
+                                                    minlength=len(thresholds))
+
+        for histogram in self.histograms.values():
+            x, y, volume, outside = histogram
+            counts = numpy.histogram2d(values[x], values[y], weights=ldV,
+                                       bins=[volumeBins[x], volumeBins[y]])[0]
+            histogram[2] += counts
+            histogram[3] += float(ldV.sum() - counts.sum())
+
+    def result(self):
+        result = {'symmetry': self.symmetry,
+                  'tension': 'max(ldP, ulP) - |ldP - ulP|/10 <= 0',
+                  'vTotal': self.volumes['vTotal'],
+                  'vTension': self.volumes['vTension'],
+                  'vX': {'pre': self.volumes['vXpre'],
+                         'ld': self.volumes['vXld'],
+                         'ul': self.volumes['vXul'],
+                         'delta': abs(self.volumes['vXld'] - self.volumes['vXul'])},
+                  'max': dict(self.maxima),
+                  'exceedance': {},
+                  'histograms': {}}
+        for name, volume in self.exceedance.items():
+            result['exceedance'][name] = {
+                'threshold': volumeBins[name].tolist(),
+                'volume': numpy.cumsum(volume[::-1])[::-1].tolist()}
+        for key, (x, y, volume, outside) in self.histograms.items():
+            result['histograms'][key] = {
+                'x': 'cyc' + x, 'y': 'cyc' + y,
+                'xEdges': volumeBins[x].tolist(),
+                'yEdges': volumeBins[y].tolist(),
+                'volume': volume.tolist(),
+                'outside': outside}
+        return result
+
+    def write(self, volumesFile, metadata):
+        result = dict(metadata)
+        result.update(self.result())
+        file1 = open(volumesFile,'w')
+        json.dump(result, file1, sort_keys=True)
+        file1.close()
+        return volumesFile
+
+def volumesName(outputFile):
+    return binaryName(outputFile) + '.volumes.json'
+
+#=================================================================
+# TopRows
+# The k rows with the largest absolute value of column rankBy, kept while
+# blocks of results are derived. Once k rows are kept, only rows of a new
+# block above the smallest kept value are considered, so each block is
+# reduced to a few candidates before sorting.
+
+rankColumns = ('cycEA', 'cycSA', 'cycTau')
+
+class TopRows:
+
+    def __init__(self, k, rankBy):
+        self.k = k
+        self.rankBy = rankBy
+        self.rows = None
+        self.threshold = None
+
+    def update(self, col):
+        score = numpy.abs(col[self.rankBy])
+        if self.threshold is not None:
+            candidates = numpy.nonzero(score > self.threshold)[0]
+            if len(candidates) == 0:
+                return
+            col = dict([(name, values[candidates]) for name, values in col.items()])
+            score = score[candidates]
+        if self.rows is not None:
+            col = dict([(name, numpy.concatenate((self.rows[name], col[name])))
+                        for name in self.rows])
+            score = numpy.abs(col[self.rankBy])
+        # stable, so ties keep the order of the odb
+        keep = numpy.argsort(-score, kind='mergesort')[:self.k]
+        self.rows = dict([(name, values[keep]) for name, values in col.items()])
+        if len(keep) == self.k:
+            self.threshold = score[keep[-1]]
+
+    # kept rows, largest first
+    def result(self):
+        return self.rows
+
+#=================================================================
+# newPointGrid
+# Voxel grid index of integration point coordinates, from PointGrid of
+# ivolRead.py in the folder of this script
+
+def newPointGrid(xyz):
+    scriptDir = os.path.dirname(os.path.abspath(__file__))
+    if scriptDir not in sys.path:
+        sys.path.insert(0, scriptDir)
+    from ivolRead import PointGrid
+    return PointGrid(xyz)
+
+def gridName(outputFile):
+    return binaryName(outputFile) + '.grid.npz'
+
+#=================================================================
+# storageTypes
+# Column types written with "-storage compact": single precision results,
+# and the smallest unsigned integers holding the largest element label and
+# integration point. None for "-storage full", where results are written
+# as calculated: double precision for principal values, single precision
+# for values copied from the odb, and 32 bit labels.
+
+def storageTypes(opts, elMax, ipMax):
+    if opts['storage'] != 'compact':
+        return None
+    dtypes = {'el': unsignedType(elMax), 'ip': unsignedType(ipMax), 'nIp': numpy.int32}
+    for name, description in columnDefinitions + coordinateDefinitions +\
+                             elementColumnDefinitions:
+        if name not in dtypes:
+            dtypes[name] = numpy.float32
+    return dtypes
+
+def unsignedType(maxValue):
+    for dtype in (numpy.uint8, numpy.uint16, numpy.uint32):
+        if maxValue <= numpy.iinfo(dtype).max:
+            return dtype
+    return numpy.int64
+
+#=================================================================
+# ElementAggregate
+# Reduce blocks of integration point results to one row per element, for
+# "-aggregate element", with grouped reductions (numpy reduceat) over runs
+# of rows of the same element. The integration points of an element are
+# consecutive in the odb; a new element starts where the element label
+# changes or the integration point number does not increase. The last
+# element of a block may continue in the next block, so its rows are kept
+# and reduced with the next block.
+
+elementColumnDefinitions = [
+    ('el',       'element number'),
+    ('nIp',      'number of integration points'),
+    ('cycEA',    'volume weighted (ldV) mean of absolute cyclic strain amplitude'),
+    ('cycEAmax', 'absolute maximum cyclic strain amplitude (signed)'),
+    ('cycSA',    'absolute maximum cyclic stress amplitude (signed)'),
+    ('preV',     'element volume during pre-conditioning'),
+    ('ldV',      'element volume during loading frame of fatigue cycle'),
+    ('ulV',      'element volume during unloading frame of fatigue cycle'),
+    ('preM',     'volume fraction martensite during pre-conditioning'),
+    ('ldM',      'volume fraction martensite during loading frame of fatigue cycle'),
+    ('ulM',      'volume fraction martensite during unloading frame of fatigue cycle'),
+    ]
+
+# integration point columns reduced; cycEM is only for the summary
+aggregateInputs = ['cycEM', 'cycEA', 'cycSA', 'preM', 'preV', 'ldM', 'ldV', 'ulM', 'ulV']
+
+class ElementAggregate:
+
+    def __init__(self):
+        self.carry = None
+
+    # element rows of the elements completed by a block
+    def update(self, col):
+        if self.carry is not None:
+            col = dict([(name, numpy.concatenate((self.carry[name], col[name])))
+                        for name in self.carry])
+        starts = elementStarts(col['el'], col['ip'])
+        if len(starts) == 0:
+            self.carry = None
+            return self.reduce(col, starts)
+        last = starts[-1]
+        self.carry = dict([(name, values[last:]) for name, values in col.items()])
+        return self.reduce(dict([(name, values[:last]) for name, values in col.items()]),
+                           starts[:-1])
+
+    # row of the last element
+    def finish(self):
+        col = self.carry
+        self.carry = None
+        if col is None:
+            return None
+        return self.reduce(col, elementStarts(col['el'], col['ip']))
+
+    def reduce(self, col, starts):
+        n = len(starts)
+        if n == 0:
+            result = dict([(name, numpy.zeros(0)) for name, description in
+                           elementColumnDefinitions])
+            result['el'] = col['el'][:0]
+            result['nIp'] = numpy.zeros(0, dtype=numpy.int32)
+            return result
+        nRows = len(col['el'])
+        # sums in double precision, whatever the precision of the odb
+        def sum(values):
+            return numpy.add.reduceat(numpy.asarray(values, dtype=numpy.float64), starts)
+        result = {'el': col['el'][starts],
+                  'nIp': numpy.diff(numpy.append(starts, nRows)).astype(numpy.int32)}
+        for frame in ('pre', 'ld', 'ul'):
+            volume = sum(col[frame + 'V'])
+            result[frame + 'V'] = volume
+            result[frame + 'M'] = weightedMean(sum(col[frame + 'M']*col[frame + 'V'].astype(
+                numpy.float64)), volume, sum(col[frame + 'M']), result['nIp'])
+        result['cycEA'] = weightedMean(sum(numpy.abs(col['cycEA'])*col['ldV'].astype(
+            numpy.float64)), result['ldV'], sum(numpy.abs(col['cycEA'])), result['nIp'])
+        for name, values in (('cycEAmax', col['cycEA']), ('cycSA', col['cycSA'])):
+            result[name] = absMaxPrincipal(numpy.minimum.reduceat(values, starts),
+                                           numpy.maximum.reduceat(values, starts))
+        return result
+
+# first row of each element in rows of integration points
+def elementStarts(el, ip):
+    if len(el) == 0:
+        return numpy.zeros(0, dtype=numpy.intp)
+    new = numpy.ones(len(el), dtype=bool)
+    new[1:] = (el[1:] != el[:-1]) | (ip[1:] <= ip[:-1])
+    return numpy.nonzero(new)[0]
+
+# weighted mean, or the plain mean of elements without volume
+def weightedMean(weightedSum, weights, plainSum, counts):
+    mean = plainSum/counts
+    positive = weights > 0
+    mean[positive] = weightedSum[positive]/weights[positive]
+    return mean
+
+#=================================================================
+# outputColumns
+# Definitions of the columns written: those selected with -columns and
+# -xyz, or the element columns with -aggregate element
+
+def outputColumns(opts):
+    if opts['aggregate']:
+        return list(elementColumnDefinitions)
+    return selectColumns(opts['columns'], opts['xyz'])
+
+#=================================================================
+# derivedColumns
+# Names of the columns to derive: those selected for output, and those
+# needed for the volume summary or to rank rows. With -aggregate element,
+# the integration point columns reduced to the element columns.
+
+def derivedColumns(columnNames, opts):
+    names = list(columnNames)
+    if opts['aggregate']:
+        names = ['el', 'ip'] + aggregateInputs
+    if opts['volumes']:
+        names += [name for name in volumeColumns if name not in names]
+    if opts['topK'] and opts['rankBy'] not in names:
+        names.append(opts['rankBy'])
+    return names
+
+#=================================================================
+# binaryName
+# Folder name for binary results, from the name of the CSV results file
+
+def binaryName(outputFile):
+    if outputFile.endswith('.csv'):
+        return outputFile[:-4]
+    return outputFile + '.d'
 
 #=================================================================
 # outputToText
 # Extract field output data from odb and write it to a text file
 
-def outputToText(paramList):
+defaultOptions = {
+    'blockSize': 50000,
+    'format': 'csv',
+    'columns': None,
+    'elset': None,
+    'cache': None,
+    'maxCache': 2048,
+    'cycle': 'ends',
+    'overwrite': True,
+    'profile': False,
+    'volumes': False,
+    'symmetry': 1.0,
+    'topK': None,
+    'rankBy': 'cycEA',
+    'update': False,
+    'storage': 'full',
+    'aggregate': None,
+    'gumbel': None,
+    'xyz': None,
+    'workers': 1,
+    'splitSets': None,
+    # set by -workers runs for each worker and for the merge
+    'partition': None,
+    'csvBody': None,
+    'csvBodies': None,
+    }
+
+def outputToText(paramList, options=None):
 
     odbName = paramList[0]
     oldOdbName = paramList[1]
@@ -99,381 +2020,977 @@ def outputToText(paramList):
     crimpStepName = paramList[3]
     lastStepName = paramList[4]
     outputFile = paramList[5]
-    
+
+    opts = dict(defaultOptions)
+    if options:
+        opts.update(options)
+    outputFormat = opts['format']
+    elsetName = opts['elset']
+    cycleMode = opts['cycle']
+    if outputFormat not in ('csv', 'npy', 'both'):
+        print 'Error: Unknown output format %s. Use csv, npy or both.' %(outputFormat)
+        return
+    if cycleMode not in ('ends', 'full'):
+        print 'Error: Unknown cycle mode %s. Use ends or full.' %(cycleMode)
+        return
+    if opts['storage'] not in ('full', 'compact'):
+        print 'Error: Unknown storage %s. Use full or compact.' %(opts['storage'])
+        return
+    if opts['topK'] is not None and (opts['topK'] < 1 or opts['rankBy'] not in rankColumns):
+        print 'Error: -topK must be at least 1, and -rankBy one of %s.' %(', '.join(rankColumns))
+        return
+    if opts['aggregate'] not in (None, 'element'):
+        print 'Error: Unknown aggregate %s. Use element.' %(opts['aggregate'])
+        return
+    if opts['aggregate'] and (opts['columns'] or opts['topK'] or opts['xyz']):
+        print 'Error: -aggregate element writes its own columns, and cannot be used '\
+              'with -columns, -topK or -xyz.'
+        return
+    try:
+        columns = outputColumns(opts)
+    except ValueError, e:
+        print 'Error: %s' %(e)
+        return
+    columnNames = [name for name, description in columns]
+
+    # .024 reference to the inclusion parameters the results are used with
+    gumbel = None
+    if opts['gumbel']:
+        try:
+            gumbel = gumbelReference(opts['gumbel'], outputFile)
+        except (IOError, ValueError), e:
+            print 'Error: Unable to read the inclusion parameters %s. %s' %(opts['gumbel'], e)
+            return
+
+    # .021 runs whose results are up to date are skipped without opening the odb
+    manifest = Manifest(manifestName(outputFile), manifestKey(paramList, opts))
+    if gumbel is not None:
+        # not in the CSV header, whose length readers may rely on
+        manifest.data['gumbel'] = gumbel
+    if opts['update']:
+        written = manifest.upToDate()
+        if written is not None:
+            print 'The results in %s are up to date, and are not extracted again.\n'\
+                  %(', '.join(written))
+            return written
+
+    # .015 phases are only timed with -profile
+    profile = noProfile
+    if opts['profile']:
+        profile = Profile()
+
+    started = profile.start()
     try: 
 	odb=openOdb(odbName,readOnly = TRUE)
     except:
         print 'Error: Unable to open the specified odb %s.' %(odbName)
 	print 'Verify that Abaqus version running this script matches ODB.'
         return
+    profile.stop('openOdb', started, 1)
 
     if oldOdbName != None:
-        try:
-            crimpOdb=openOdb(oldOdbName,readOnly = TRUE)
-        except:
-            print 'Error: Unable to open the specified old ODB %s\n'%(oldOdbName)
-            return
+        crimpOdbName=oldOdbName
     else:
         crimpOdbName=odbName
-        crimpOdb=odb
 
+    # .011 the crimp ODB is opened and checked only when a crimp field is
+    # read, so it is not opened at all if every crimp field is in the cache
+    openOdbs = [odb]
+    def getCrimpOdb():
+        if len(openOdbs) == 1:
+            if oldOdbName == None:
+                crimpOdb = odb
+            else:
+                started = profile.start()
+                try:
+                    crimpOdb=openOdb(oldOdbName,readOnly = TRUE)
+                except:
+                    raise IvolError('Error: Unable to open the specified old ODB %s\n'%(oldOdbName))
+                profile.stop('openOdb', started, 1)
+            openOdbs.append(crimpOdb)
+            checkOdb(crimpOdb, crimpOdbName, crimpStepName, partInstance,
+                     'If the crimp results are in a different ODB, use the -oldOdb option.')
+        return openOdbs[1]
 
-    availableSteps = crimpOdb.steps.keys()
-    if crimpStepName not in availableSteps:
-        print 'Error: The step %s does not exist in odb %s\n'\
-              '\tCheck for the case in the step name.\n'\
-              '\tIt should be one of these: %s' %(crimpStepName, crimpOdbName,availableSteps)
-        print 'If the crimp results are in a different ODB, use the -oldOld option.'
-        odb.close()
-        crimpOdb.close()
-        exit(0)
-
-    availableSteps = odb.steps.keys()
-    if lastStepName not in availableSteps:
-        print 'Error: The step %s does not exist in odb %s\n'\
-              '\tCheck for the case in the step name.\n'\
-              '\tIt should be one of these: %s' %(lastStepName, odbName, availableSteps)
+    try:
+        # .013 lastStepName may be a list or pattern of several steps
+        stepNames = matchSteps(odb, odbName, lastStepName)
+        for stepName in stepNames:
+            checkOdb(odb, odbName, stepName, partInstance)
+    except IvolError, e:
+        print e
         odb.close()
-        crimpOdb.close()
-        return
-    
-    availablePartInstances = odb.rootAssembly.instances.keys()
-    if partInstance not in availablePartInstances and\
-        partInstance != 'ASSEMBLY':
-        print 'Error: The part instance %s does not exist in the odb %s.\n'\
-              '\tCheck for the case of the part instance name.\n'\
-              '\tIt should be one of these: %s' % (partInstance,odbName,availablePartInstances)
         return
 
-    availablePartInstances = crimpOdb.rootAssembly.instances.keys()
-    if partInstance not in availablePartInstances and\
-       partInstance != 'ASSEMBLY':
-        print 'Error: The part instance %s does not exist in the odb %s.\n'\
-              '\tCheck for the case of the part instance name.\n'\
-              '\tIt should be one of these: %s' % (partInstance,crimpOdbName,availablePartInstances)
-        return
-    
-    # define frames of interest
-    crimpFrame = crimpOdb.steps[crimpStepName].frames[-1]
-    loadFrame = odb.steps[lastStepName].frames[0]
-    unloadFrame = odb.steps[lastStepName].frames[-1]
-
-    # tensors for crimping frame
-    crimpLE = crimpOdb.steps[crimpStepName].frames[-1].fieldOutputs['LE'].values
-    crimpS = crimpOdb.steps[crimpStepName].frames[-1].fieldOutputs['S'].values
-
-    # tensors for loading and unloading frame of cycle
-    loadFieldLE = odb.steps[lastStepName].frames[0].fieldOutputs['LE']
-    loadFieldS = odb.steps[lastStepName].frames[0].fieldOutputs['S']
-    unloadFieldLE = odb.steps[lastStepName].frames[-1].fieldOutputs['LE']
-    unloadFieldS = odb.steps[lastStepName].frames[-1].fieldOutputs['S']
-
-    # calculate tensor mean and amplitude values
-    meanLE = 0.5*(loadFieldLE+unloadFieldLE)
-    ampLE = 0.5*(loadFieldLE-unloadFieldLE)
-    meanS = 0.5*(loadFieldS+unloadFieldS)
-    ampS = 0.5*(loadFieldS-unloadFieldS)
-
-    # calculate volume at each frame of interest
-    crimpIVOL = crimpFrame.fieldOutputs['IVOL'].values
-    loadIVOL = loadFrame.fieldOutputs['IVOL'].values
-    unloadIVOL = unloadFrame.fieldOutputs['IVOL'].values
-
-    # calculate martensite volume percent transformation
-    crimpSDV21 = crimpFrame.fieldOutputs['SDV21'].values
-    loadSDV21 = loadFrame.fieldOutputs['SDV21'].values
-    unloadSDV21 = unloadFrame.fieldOutputs['SDV21'].values
-
-    nRows = len(crimpLE)
-    vTotal = 0
-    cycEAmax = 0
-    cycEMmax = 0
+    cache = None
+    if opts['cache']:
+        cache = FieldCache(opts['cache'], int(opts['maxCache']*1024*1024))
 
-    #####
-    ##### CRIMP (prestrain) frame results
-    #####
+    # define frames of interest
+    # .009 restricted to the part instance and element set
+    # .013 crimp frame fields are kept in memory and read only once for all steps
+    meshes = {}
+    crimpSource = FrameSource(getCrimpOdb, crimpOdbName, crimpStepName, -1,
+                              partInstance, elsetName, cache,
+                              keep=len(stepNames) > 1, profile=profile,
+                              partition=opts['partition'], meshes=meshes)
 
-    # store element labels and crimp strains
-    el = []
-    ip = []
-    preE =[]
-    for v in crimpLE:
-        el.append(v.elementLabel)
-        ip.append(v.integrationPoint)
-        preE.append(v.maxPrincipal)
-
-    # store crimp stress
-    preS = []
-    preP = []
-    for v in crimpS:
-        preS.append(v.maxPrincipal)
-        preP.append(v.press)
-
-    # store crimp IVOL
-    preV = []
-    for v in crimpIVOL:
-        preV.append(v.data)
-        vTotal = vTotal + v.data
-
-    # store crimp volume fraction martensite
-    preM = []
-    for v in crimpSDV21:
-        preM.append(v.data)
+    if oldOdbName == None:
+        oldOdbLabel = odbName
+    else:
+        oldOdbLabel = oldOdbName
 
-    #####
-    ##### LOAD (fatigue+) frame results
-    #####
+    # .014 files written are returned, or None if any step failed
+    written = []
+
+    # steps whose results exist are skipped; with -update, steps whose
+    # results are up to date are skipped, and others replaced
+    runSteps = []
+    for stepName in stepNames:
+        if opts['update']:
+            current = manifest.current(stepName)
+            if current is not None:
+                print 'The results in %s are up to date, and are skipped.\n' %(
+                    ', '.join(current))
+                written.extend(current)
+                continue
+        elif len(stepNames) > 1 and not opts['overwrite'] and\
+             os.path.exists(stepOutputName(outputFile, stepName)):
+            print 'The file %s already exists, and is skipped. Use -overwrite yes\n'\
+                  'to replace it.\n' %(stepOutputName(outputFile, stepName))
+            continue
+        runSteps.append(stepName)
+
+    # .020 partitions of the model extracted by a pool of worker processes
+    if runSteps and (opts['workers'] > 1 or opts['splitSets']):
+        try:
+            if opts['splitSets']:
+                partitions = setPartitions(opts['splitSets'])
+            else:
+                labelBlocks = crimpSource.labels('IVOL')
+                started = profile.start()
+                partitions = planPartitions(labelBlocks, opts['workers'])
+                profile.stop('planPartitions', started, len(partitions))
+                del labelBlocks
+        except IvolError, e:
+            print e
+            runSteps = []
+            written = None
+        # workers open the odbs themselves
+        for o in openOdbs:
+            try:
+                o.close()
+            except:
+                pass
+        del openOdbs[:]
+        if written is not None:
+            metadata = {'script': 'ivolResults%s.py' % scriptVersion,
+                        'odb': odbName,
+                        'oldOdb': oldOdbLabel,
+                        'partInstance': partInstance,
+                        'crimpStepName': crimpStepName,
+                        'cycle': cycleMode}
+            if gumbel is not None:
+                metadata['gumbel'] = gumbel
+            files = outputPartitioned(paramList, opts, runSteps, partitions,
+                                      metadata, manifest, profile)
+            if files is None:
+                written = None
+            else:
+                written.extend(files)
+            runSteps = []
 
-    # store load frame strain
-    ldE = []
-    for v in loadFieldLE.values:
-        ldE.append(v.maxPrincipal)
-
-    # store load frame stress
-    # .003 add S11, S22, S33
-    ldS = []
-    ldP = []
-    ldS11 = []
-    ldS22 = []
-    ldS33 = []
-    for v in loadFieldS.values:
-        ldS.append(v.maxPrincipal)
-        ldP.append(v.press)
-        ldS11.append(v.data[0]) #S11
-        ldS22.append(v.data[1]) #S22
-        ldS33.append(v.data[2]) #S33
-
-    # store IVOL for loading frame
-    ldV = []
-    for v in loadIVOL:
-        ldV.append(v.data)
+    # fields are read one block of about blockSize integration points at a
+    # time, planned from the labels of IVOL of the crimp frame
+    if runSteps:
+        try:
+            labelBlocks = crimpSource.labels('IVOL')
+        except IvolError, e:
+            print e
+            runSteps = []
+            written = None
+    if runSteps:
+        started = profile.start()
+        blocks, plan = planBlocks(labelBlocks, opts['blockSize'], opts['partition'])
+        del labelBlocks
+        if len(blocks) > 1 and partitionRegion(odb, odbName, partInstance, blocks[0]) is None:
+            # without element sets, every block would read the whole region
+            blocks = [opts['partition']]
+        profile.stop('planBlocks', started, plan['nRows'])
+        if len(blocks) == 1:
+            crimpSources = [crimpSource]
+        else:
+            crimpSources = [FrameSource(getCrimpOdb, crimpOdbName, crimpStepName, -1,
+                                        partInstance, elsetName, cache,
+                                        keep=len(stepNames) > 1, profile=profile,
+                                        partition=block, meshes=meshes)
+                            for block in blocks]
+
+    for stepName in runSteps:
+        stepOutputFile = outputFile
+        if len(stepNames) > 1:
+            stepOutputFile = stepOutputName(outputFile, stepName)
+        nFrames = len(odb.steps[stepName].frames)
+
+        def sources(i, block, stepName=stepName, nFrames=nFrames):
+            frameSources = {
+                'crimp':  crimpSources[i],
+                'load':   FrameSource(lambda: odb, odbName, stepName, 0,
+                                      partInstance, elsetName, profile=profile,
+                                      partition=block, meshes=meshes),
+                'unload': FrameSource(lambda: odb, odbName, stepName, -1,
+                                      partInstance, elsetName, profile=profile,
+                                      partition=block, meshes=meshes)}
+            # .012 full cycle mode reads every frame of the cycle step
+            cycleSources = None
+            if cycleMode == 'full':
+                cycleSources = [FrameSource(lambda: odb, odbName, stepName, j,
+                                            partInstance, elsetName, profile=profile,
+                                            partition=block, meshes=meshes)
+                                for j in range(nFrames)]
+            return frameSources, cycleSources
 
-    # .002 max and min principal strains, shear
-    # .003 add E11, E22, E33
-    ldE1 = []
-    ldE3 = []
-    ldTau = []
-    ldE11 = []
-    ldE22 = []
-    ldE33 = []
-    for v in loadFieldLE.values:
-        minPrincipalStrain = v.minPrincipal
-        maxPrincipalStrain = v.maxPrincipal
-        maxTau = abs(maxPrincipalStrain - minPrincipalStrain)/2
-        ldE1.append(v.minPrincipal)
-        ldE3.append(v.maxPrincipal)
-        ldTau.append(maxTau)
-        ldE11.append(v.data[0]) #E11
-        ldE22.append(v.data[1]) #E22
-        ldE33.append(v.data[2]) #E33
-
-    # store volume fraction martensite for loading frame
-    ldM = []
-    for v in loadSDV21:
-        ldM.append(v.data)
+        try:
+            # .005 read each field once as contiguous arrays from its bulk data
+            # blocks, rather than one FieldValue object at a time
+            # .008 only fields needed for the selected columns are read
+            raws = readBlocks(blocks, sources, derivedColumns(columnNames, opts), profile)
+        except IvolError, e:
+            print e
+            written = None
+            break
+
+        metadata = {'script': 'ivolResults%s.py' % scriptVersion,
+                    'odb': odbName,
+                    'oldOdb': oldOdbLabel,
+                    'partInstance': partInstance,
+                    'crimpStepName': crimpStepName,
+                    'lastStepName': stepName,
+                    'cycle': cycleMode}
+        if gumbel is not None:
+            metadata['gumbel'] = gumbel
+        summary, files = writeResults(raws, plan, columns, stepOutputFile, opts, metadata,
+                                      profile)
+        written.extend(files)
+        manifest.record(stepName, files)
+        del raws
+
+    started = profile.start()
+    for o in openOdbs:
+        try:
+            o.close()
+        except:
+            pass
+    profile.stop('closeOdb', started)
+
+    if written is not None:
+        manifest.complete(stepNames)
+
+    if opts['profile']:
+        print(profile.table())
+        # partitions are reported by name, without their element labels
+        reportOptions = dict(opts)
+        if opts['partition'] is not None:
+            reportOptions['partition'] = opts['partition']['name']
+        profileFile = profile.write(profileName(outputFile), {
+            'script': 'ivolResults%s.py' % scriptVersion,
+            'odb': odbName,
+            'oldOdb': oldOdbLabel,
+            'partInstance': partInstance,
+            'crimpStepName': crimpStepName,
+            'lastStepName': stepNames,
+            'options': reportOptions})
+        print 'Profile written to the file: %s\n' %(profileFile)
+    return written
 
-    #####
-    ##### UNLOAD (fatigue-) frame results
-    #####
+#=================================================================
+# writeResults
+# Derive results from the raw field arrays of each block of planBlocks in
+# turn (see readBlocks) and write them, at most blockSize integration points
+# at a time. plan holds the numbers of integration points and elements of
+# the blocks, and their largest labels. metadata holds the odb names and
+# steps, and is written with the summary to binary results. Returns the
+# summary, and the names of the files written.
+
+def writeResults(raws, plan, columns, outputFile, opts, metadata, profile=noProfile):
+    blockSize = opts['blockSize']
+    derivedNames = derivedColumns([name for name, description in columns], opts)
+
+    def blocks():
+        for raw in raws:
+            nRows = len(raw['el'])
+            for start in range(0, nRows, blockSize):
+                started = profile.start()
+                col = deriveBlock(raw, start, min(start + blockSize, nRows), derivedNames)
+                profile.stop('derive', started, len(col['el']))
+                yield col
+            # the arrays of a block are released before the next is read
+            del raw
+
+    return writeBlocks(blocks(), plan['nRows'], columns, outputFile, opts, metadata,
+                       profile, storageTypes(opts, plan['elMax'], plan['ipMax']),
+                       plan['nElements'])
 
-    # store unload frame strain
-    ulE = []
-    for v in unloadFieldLE.values:
-        ulE.append(v.maxPrincipal)
-
-    # store unload frame stress
-    # .003 add S11, S22, S33
-    ulS = []
-    ulP = []
-    ulS11 = []
-    ulS22 = []
-    ulS33 = []
-    for v in unloadFieldS.values:
-        ulS.append(v.maxPrincipal)
-        ulP.append(v.press)
-        ulS11.append(v.data[0]) #S11
-        ulS22.append(v.data[1]) #S22
-        ulS33.append(v.data[2]) #S33
-
-    # store IVOL for unloading frame
-    ulV = []
-    for v in unloadIVOL:
-        ulV.append(v.data)
-
-    # store volume fraction martensite for unloading frame
-    ulM = []
-    for v in unloadSDV21:
-        ulM.append(v.data)
+#=================================================================
+# readBlocks
+# Raw arrays of readRaw for each block of planBlocks in turn, read through
+# the FrameSources returned by sources(i, block) for block i: a dictionary
+# of frame sources, and the cycle sources of -cycle full (or None). The
+# first block is read at once, so that errors (e.g. a missing element set)
+# are raised before any results are written.
+
+def readBlocks(blocks, sources, names, profile=noProfile):
+    warned = set()
+    def read(i):
+        frameSources, cycleSources = sources(i, blocks[i])
+        return readRaw(frameSources, names, cycleSources, profile, warned)
+    first = [read(0)]
+    def rest():
+        yield first.pop()
+        for i in range(1, len(blocks)):
+            yield read(i)
+    return rest()
 
-    # .002 max and min principal strains, shear
-    ulE1 = []
-    ulE3 = []
-    ulTau = []
-    ulE11 = []
-    ulE22 = []
-    ulE33 = []
-    for v in unloadFieldLE.values:
-        minPrincipalStrain = v.minPrincipal
-        maxPrincipalStrain = v.maxPrincipal
-        maxTau = abs(maxPrincipalStrain - minPrincipalStrain)/2
-        ulE1.append(v.minPrincipal)
-        ulE3.append(v.maxPrincipal)
-        ulTau.append(maxTau)
-        ulE11.append(v.data[0]) #e11
-        ulE22.append(v.data[0]) #e22
-        ulE33.append(v.data[0]) #e33
+#=================================================================
+# writeBlocks
+# Write blocks of derived results (dictionaries of column arrays with at
+# least the columns of derivedColumns) holding about nRows rows in total,
+# with the summary, and the volume summary, top rows and coordinate grid if
+# requested. Columns are written with the types in dtypes (see
+# storageTypes), if given; the summaries are calculated before. With
+# -aggregate element, about nElements element rows are written instead.
+# The summary holds the numbers of rows actually written. Returns the
+# summary, and the names of the files written.
+
+def writeBlocks(blocks, nRows, columns, outputFile, opts, metadata, profile=noProfile,
+                dtypes=None, nElements=None):
+    outputFormat = opts['format']
+    columnNames = [name for name, description in columns]
+    summary = newSummary(nRows, derivedColumns(columnNames, opts))
+
+    # .023 integration points reduced to elements
+    aggregate = None
+    if opts['aggregate']:
+        aggregate = ElementAggregate()
+        summary['elements'] = nElements
+
+    # .017 volume summary accumulated from each block
+    volumes = None
+    if opts['volumes']:
+        volumes = VolumeSummary(opts['symmetry'])
+
+    # .018 only the top k rows are written
+    top = None
+    if opts['topK']:
+        top = TopRows(opts['topK'], opts['rankBy'])
+
+    # .019 coordinates of the rows written in the first -xyz frame
+    xyzNames = None
+    xyz = []
+    if opts['xyz']:
+        prefix = [p for key, p, d in coordinateFrames if key == opts['xyz'][0]][0]
+        xyzNames = [prefix + 'C' + c for c in ('1', '2', '3')]
 
     #####
-    ##### CYCLE results
+    ##### Derive and write results, one block of integration points at a time
     #####
 
-    # store mean strain, and update maximum mean strain
-    cycEM = []
-    for v in meanLE.values:
-        cycEM.append(v.maxPrincipal)
-        if v.maxPrincipal > cycEMmax:
-            cycEMmax = v.maxPrincipal
-
-    #store strain amplitude, and update maxumum strain amplitude
-    cycEA = []
-    for v in ampLE.values:
-        cycE3 = v.maxPrincipal
-        cycE1 = v.minPrincipal
-        if abs(cycE3) > abs(cycE1):
-            cycE3abs = cycE3
+    # .007 results may be written as CSV text, columnar binary arrays, or both
+    # .020 parts of a -workers run format their own CSV rows
+    def newWriters(nRows):
+        writers = []
+        if outputFormat in ('csv', 'both'):
+            writers.append(CsvWriter(outputFile, columns, nRows, opts['csvBodies']))
+        if outputFormat in ('npy', 'both'):
+            writers.append(NpyWriter(binaryName(outputFile), columns, nRows))
+        if opts['csvBody']:
+            writers.append(CsvBodyWriter(bodyName(outputFile),
+                                         selectColumns(opts['csvBody']), nRows))
+        return writers
+
+    def write(col):
+        if dtypes is not None:
+            col = dict([(name, values.astype(dtypes.get(name, values.dtype)))
+                        for name, values in col.items()])
+        for writer in writers:
+            started = profile.start()
+            writer.writeBlock(col)
+            profile.stop(writer.profileName, started, len(col['el']))
+        rowsWritten[0] += len(col['el'])
+        if xyzNames is not None:
+            xyz.append(numpy.column_stack([col[name] for name in xyzNames]))
+
+    if aggregate is not None:
+        writers = newWriters(nElements)
+    elif top is None:
+        writers = newWriters(nRows)
+    # rows read and rows written
+    summary['nRows'] = 0
+    rowsWritten = [0]
+    empty = None
+    for col in blocks:
+        if empty is None:
+            empty = dict([(name, values[:0]) for name, values in col.items()])
+        summary['nRows'] += len(col['el'])
+        updateSummary(summary, col)
+        if volumes is not None:
+            started = profile.start()
+            volumes.update(col)
+            profile.stop('volumes', started, len(col['el']))
+        if aggregate is not None:
+            started = profile.start()
+            elements = aggregate.update(col)
+            profile.stop('aggregate', started, len(col['el']))
+            write(elements)
+        elif top is not None:
+            started = profile.start()
+            top.update(col)
+            profile.stop('topK', started, len(col['el']))
         else:
-            cycE3abs = cycE1
-        cycEA.append(cycE3abs)
-        if abs(cycE3abs) > abs(cycEAmax):
-            cycEAmax = cycE3abs
-
-    # .002 cyclic shear strain
-    cycTau = []
-    for v in ampLE.values:
-        cycE3 = v.maxPrincipal
-        cycE1 = v.minPrincipal
-        tau = abs(cycE3 - cycE1)/2
-        cycTau.append(tau)
-
-    # store mean stress
-    cycSM = []
-    for v in meanS.values:
-        cycSM.append(v.maxPrincipal)
-
-    #store stress amplitude
-    cycSA = []
-    for v in ampS.values:
-        s3 = v.maxPrincipal
-        s1 = v.minPrincipal
-        if abs(s3) > abs(s1):
-            s3abs = s3
+            write(col)
+
+    if aggregate is not None:
+        elements = aggregate.finish()
+        if elements is not None:
+            write(elements)
+        summary['elements'] = rowsWritten[0]
+
+    if top is not None:
+        col = top.result()
+        if col is None:
+            col = empty
+        if col is None:
+            col = dict([(name, numpy.zeros(0)) for name in columnNames + (xyzNames or [])])
+        summary['topK'] = len(col['el'])
+        summary['rankBy'] = opts['rankBy']
+        writers = newWriters(len(col['el']))
+        write(col)
+
+    # .019 spatial index of the coordinates of the rows written
+    grid = None
+    if xyzNames is not None:
+        if xyz:
+            xyz = numpy.concatenate(xyz)
         else:
-            s3abs = s1
-        cycSA.append(s3abs)
-    
+            xyz = numpy.zeros((0, 3))
+        started = profile.start()
+        grid = newPointGrid(xyz)
+        profile.stop('grid', started, len(xyz))
+
     #####
     ##### Write output file
     #####
 
-    file1=open(outputFile,'w')
-
-    if oldOdbName == None:
-        oldOdbLabel = odbName
-    else:
-        oldOdbLabel = oldOdbName
-    
-    # write summary info at top of file 
-    headerString = ''
-    headerString += 'Results from ivolResults.py\n'
-    headerString += '===========================\n'
-    headerString += 'Output database:                        odb      = %s\n' % odbName
-    headerString += 'Crimping (prestrain) output database:   oldOdb   = %s\n' % oldOdbLabel
-    headerString += 'Number of integration points:           nRows    = %i\n' % nRows
-    headerString += 'Total volume:                           vTotal   = %G\n' % vTotal
-    headerString += 'Maximum mean strain:                    cycEMmax = %G\n' % cycEMmax
-    headerString += 'Maximum strain amplitude (abs):         cycEAmax = %G\n' % cycEAmax
-    file1.write(headerString)
+    # summary info at top of CSV file, and as metadata of binary results
+    headerString = summaryHeader(metadata['odb'], metadata['oldOdb'], summary)
+    metadata = dict(metadata)
+    metadata.update(summary)
 
     # print summary header to screen
     print('\n')
     print(headerString)
 
-    # write column descriptions to CSV file
-    columnDescription = ''
-    columnDescription += '-----------------------------------------------------------------------------------------------\n'
-    columnDescription += 'el     = element number\n'
-    columnDescription += 'ip     = integration point\n'
-    columnDescription += 'cycEM  = maximum principal cyclic mean strain\n'
-    columnDescription += 'cycEA  = absolute maximum principal cyclic strain amplitude\n'
-    columnDescription += 'cycTau = cyclic maximum shear strain\n'
-    columnDescription += 'cycSM  = maximum principal cyclic mean stress\n'
-    columnDescription += 'cycSA  = absolute maximum principal cyclic stress amplitude\n'
-    columnDescription += 'preE   = pre-strain (strain conditioning, e.g. strain during crimping)\n'
-    columnDescription += 'preS   = pre-stress (stress conditioning, e.g. stress during crimping)\n'
-    columnDescription += 'preP   = hydrostatic pressure during pre-conditioning (compression positive, tension negative)\n'
-    columnDescription += 'preM   = volume fraction martensite during pre-conditioning\n'
-    columnDescription += 'preV   = integration point volume during pre-conditioning\n'
-    columnDescription += 'ldE    = maximum principal strain during loading frame of fatigue cycle\n'
-    columnDescription += 'ldTau  = maximum shear strain during loading frame of fatigue cycle\n'
-    columnDescription += 'ldS    = maximum principal stress during loading frame of fatigue cycle\n'
-    columnDescription += 'ldP    = hydrostatic pressure during loading frame of fatigue cycle\n'
-    columnDescription += 'ldM    = volume fraction martensite during loading frame of fatigue cycle\n'
-    columnDescription += 'ldV    = integration point volume during loading frame of fatigue cycle\n'
-    columnDescription += 'ulE    = maximum principal strain during unloading frame of fatigue cycle\n'
-    columnDescription += 'ulTau  = maximum shear strain during unloading frame of fatigue cycle\n'
-    columnDescription += 'ulS    = maximum principal stress during unloading frame of fatigue cycle\n'
-    columnDescription += 'ulP    = hydrostatic pressure during unloading frame of fatigue cycle\n'
-    columnDescription += 'ulM    = volume fraction martensite during unloading frame of fatigue cycle\n'
-    columnDescription += 'ulV    = integration point volume during unloading frame of fatigue cycle\n'
-    columnDescription += 'ldS11  = loading stress in material 1 direction (r)\n'
-    columnDescription += 'ldS22  = loading stress in material 2 direction (theta)\n'
-    columnDescription += 'ldS33  = loading stress in material 3 direction (Z)\n'
-    columnDescription += 'ulS11  = unloading stress in material 1 direction (r)\n'
-    columnDescription += 'ulS22  = unloading stress in material 2 direction (theta)\n'
-    columnDescription += 'ulS33  = unloading stress in material 3 direction (Z)\n'
-    columnDescription += 'ldE11  = loading strain in material 1 direction (r)\n'
-    columnDescription += 'ldE22  = loading strain in material 2 direction (theta)\n'
-    columnDescription += 'ldE33  = loading strain in material 3 direction (Z)\n'
-    columnDescription += 'ulE11  = unloading strain in material 1 direction (r)\n'
-    columnDescription += 'ulE22  = unloading strain in material 2 direction (theta)\n'
-    columnDescription += 'ulE33  = unloading strain in material 3 direction (Z)\n'
-    columnDescription += '-----------------------------------------------------------------------------------------------\n'
-    file1.write(columnDescription)
-
-    # write column names
-    str = 'el, ip, cycEM, cycEA, cycTau, cycSM, cycSA, preE, preS, preP, preM, preV, ldE, ldTau, ldS, ldP, ldM, ldV, ulE,' \
-          'ulTau, ulS, ulP, ulM, ulV,'\
-          'ldS11, ldS22, ldS33, ulS11, ulS22, ulS33,' \
-          'ldE11, ldE22, ldE33, ulE11, ulE22, ulE33\n'
-    file1.write(str)
-
-    # write rows of data
-    for i in range(nRows):
-        str = '%i, %i,'\
-              '%G, %G, %G, %G, %G, '\
-              '%G, %G, %G, %G, %G, '\
-              '%G, %G, %G, %G, %G, %G, '\
-              '%G, %G, %G, %G, %G, %G, '\
-              '%G, %G, %G, %G, %G, %G, '\
-              '%G, %G, %G, %G, %G, %G\n' % \
-        (el[i], ip[i], \
-            cycEM[i], cycEA[i], cycTau[i], cycSM[i],  cycSA[i], \
-            preE[i],  preS[i],  preP[i],   preM[i],   preV[i], \
-            ldE[i],   ldTau[i], ldS[i],    ldP[i],    ldM[i],   ldV[i], \
-            ulE[i],   ulTau[i], ulS[i],    ulP[i],    ulM[i],   ulV[i], \
-            ldS11[i], ldS22[i], ldS33[i],  ulS11[i],  ulS22[i],  ulS33[i], \
-            ldE11[i], ldE22[i], ldE33[i],  ulE11[i],  ulE22[i],  ulE33[i])
-        file1.write(str)
-
-    # close files and exit
+    # close files
+    files = []
+    for writer in writers:
+        started = profile.start()
+        written = writer.close(headerString, metadata)
+        profile.stop(writer.profileName, started)
+        print 'Output successfully written to the file: %s\n' %(written)
+        files.append(written)
+    if volumes is not None:
+        written = volumes.write(volumesName(outputFile), metadata)
+        print 'Volume summary written to the file: %s\n' %(written)
+        files.append(written)
+    if grid is not None:
+        written = gridName(outputFile)
+        grid.save(written, frame=opts['xyz'][0], odb=metadata['odb'],
+                  lastStepName=metadata['lastStepName'])
+        print 'Coordinate grid written to the file: %s\n' %(written)
+        files.append(written)
+    return summary, files
+
+#=================================================================
+# matchSteps
+# Step names from a comma separated list of names and/or patterns with
+# wildcards (* ? [...]), in the order of the steps in the odb
+
+def matchSteps(odb, odbName, stepPattern):
+    availableSteps = odb.steps.keys()
+    stepNames = []
+    for pattern in stepPattern.split(','):
+        pattern = pattern.strip()
+        if '*' in pattern or '?' in pattern or '[' in pattern:
+            matched = [s for s in availableSteps if fnmatch.fnmatchcase(s, pattern)]
+            if not matched:
+                raise IvolError('Error: No step in odb %s matches %s\n'\
+                                '\tIt should be one of these: %s' %(odbName, pattern, availableSteps))
+        else:
+            matched = [pattern]
+        for stepName in matched:
+            if stepName not in stepNames:
+                stepNames.append(stepName)
+    return stepNames
+
+#=================================================================
+# stepOutputName
+# Results file name for one of several steps, e.g. Job-2.diastole-01.ivol.csv
+
+def stepOutputName(outputFile, stepName):
+    stepLabel = re.sub(r'[^A-Za-z0-9_.+-]', '_', stepName)
+    if outputFile.endswith('.ivol.csv'):
+        return outputFile[:-9] + '.' + stepLabel + '.ivol.csv'
+    return outputFile + '.' + stepLabel
+
+#=================================================================
+# Manifest
+# Record of the results written by a run, next to the results file, e.g.
+# Job-2.ivol.manifest.json, like the record of a build system. key holds
+# everything the results depend on: script version, path, size and
+# modification time of each source odb, part instance, steps, and the
+# options that change the results. For each step, the files written are
+# recorded with their size and modification time as soon as the step is
+# written, so an interrupted run with several steps keeps the steps already
+# done. Results of a step are current if the key is unchanged and its files
+# are unchanged.
+
+outputOptions = ('columns', 'format', 'elset', 'cycle', 'volumes', 'symmetry',
+                 'topK', 'rankBy', 'xyz', 'splitSets', 'csvBody', 'storage',
+                 'aggregate', 'gumbel')
+
+class Manifest:
+
+    def __init__(self, path, key):
+        self.path = path
+        self.key = key
+        self.data = {'key': key, 'outputs': {}, 'steps': None}
+        try:
+            file1 = open(path)
+            data = json.load(file1)
+            file1.close()
+        except (IOError, ValueError):
+            return
+        # outputs recorded for different sources or options are out of date
+        if data.get('key') == jsonValue(key):
+            self.data = data
+
+    # files of the step, if they are current, otherwise None
+    def current(self, stepName):
+        records = self.data['outputs'].get(stepName)
+        if records is None:
+            return None
+        for record in records:
+            if fileRecord(record['path']) != record:
+                return None
+        return [record['path'] for record in records]
+
+    # files of every step of a completed run, if all are current, otherwise None
+    def upToDate(self):
+        if self.data['steps'] is None:
+            return None
+        written = []
+        for stepName in self.data['steps']:
+            files = self.current(stepName)
+            if files is None:
+                return None
+            written.extend(files)
+        return written
+
+    def record(self, stepName, files):
+        self.data['outputs'][stepName] = [fileRecord(path) for path in files]
+        self.save()
+
+    def complete(self, stepNames):
+        self.data['steps'] = list(stepNames)
+        self.save()
+
+    def save(self):
+        tmp = self.path + '.tmp'
+        file1 = open(tmp, 'w')
+        json.dump(self.data, file1, indent=2, sort_keys=True)
+        file1.close()
+        if os.path.isfile(self.path):
+            os.remove(self.path)
+        os.rename(tmp, self.path)
+
+def manifestName(outputFile):
+    return binaryName(outputFile) + '.manifest.json'
+
+# files of a run of outputToText that are all up to date, or None
+def upToDate(paramList, options=None):
+    opts = dict(defaultOptions)
+    if options:
+        opts.update(options)
+    return Manifest(manifestName(paramList[5]), manifestKey(paramList, opts)).upToDate()
+
+# key of a run, from the parameters of outputToText and its options
+def manifestKey(paramList, opts):
+    odbName, oldOdbName, partInstance, crimpStepName, lastStepName, outputFile = paramList
+    sources = [sourceRecord(odbName)]
+    if oldOdbName != None:
+        sources.append(sourceRecord(oldOdbName))
+    if opts['gumbel']:
+        sources.append(sourceRecord(opts['gumbel']))
+    key = {'script': 'ivolResults%s.py' % scriptVersion,
+           'sources': sources,
+           'partInstance': partInstance,
+           'crimpStepName': crimpStepName,
+           'lastStepName': lastStepName,
+           'options': dict([(name, opts[name]) for name in outputOptions])}
+    # a -workers part is identified by a checksum of its element labels
+    if opts['partition'] is not None:
+        key['partition'] = partitionDigest(opts['partition'])
+    return jsonValue(key)
+
+def sourceRecord(path):
+    path = os.path.abspath(path)
+    if not os.path.exists(path):
+        return {'path': path, 'size': None, 'mtime': None}
+    stat = os.stat(path)
+    return {'path': path, 'size': stat.st_size, 'mtime': stat.st_mtime}
+
+# size and modification time of a results file, or of the files of a folder
+def fileRecord(path):
+    record = {'path': path, 'size': None, 'mtime': None}
+    if os.path.isfile(path):
+        stat = os.stat(path)
+        record['size'] = stat.st_size
+        record['mtime'] = stat.st_mtime
+    elif os.path.isdir(path):
+        record['size'] = 0
+        record['mtime'] = 0
+        for name in sorted(os.listdir(path)):
+            stat = os.stat(os.path.join(path, name))
+            record['size'] += stat.st_size
+            record['mtime'] = max(record['mtime'], stat.st_mtime)
+    return jsonValue(record)
+
+# value as it reads back from a JSON file, for comparison with a manifest
+def jsonValue(value):
+    return json.loads(json.dumps(value))
+
+#=================================================================
+# gumbelReference
+# Reference to a gumbel-parameters.json file of ../210-xct-methods/xctGumbel.py
+# given with -gumbel: its name relative to the results folder, checksum and
+# material ids, recorded in the manifest and the summary of binary results
+
+def gumbelReference(gumbelFile, outputFile):
+    file1 = open(gumbelFile, 'rb')
+    data = file1.read()
     file1.close()
-    print 'Output successfully written to the file: %s\n' %(outputFile)
-    odb.close()
+    materials = json.loads(data).get('materials')
+    if not isinstance(materials, dict):
+        raise ValueError('It is not a gumbel-parameters.json file of xctGumbel.py.')
+    path = os.path.abspath(gumbelFile)
     try:
-        crimpOdb.close()
-    except:
+        path = os.path.relpath(path, os.path.dirname(os.path.abspath(outputFile)))
+    except ValueError:
+        # on another drive
         pass
-    return
+    return {'file': path.replace('\\', '/'),
+            'sha1': hashlib.sha1(data).hexdigest(),
+            'materials': sorted(materials.keys())}
+
+#=================================================================
+# planBlocks
+# Split the region of interest (or the partition of a -workers run) into
+# blocks of about blockSize integration points, from the labels of a
+# reference field (IVOL of the crimp frame, see FrameSource.labels), so that
+# fields are read one block at a time and memory depends on blockSize rather
+# than model size. Blocks are planned as the partitions of planPartitions; a
+# region of blockSize integration points or fewer is a single block, the
+# partition itself. Returns the blocks, and the plan: the number of
+# integration points and elements, and the largest element label and
+# integration point.
+
+def planBlocks(labelBlocks, blockSize, partition=None):
+    plan = {'nRows': 0, 'nElements': len(elementRows(labelBlocks)[2]),
+            'elMax': 0, 'ipMax': 0}
+    for el, code, ipMax in labelBlocks:
+        plan['nRows'] += len(el)
+        if len(el):
+            plan['elMax'] = max(plan['elMax'], int(el.max()))
+            plan['ipMax'] = max(plan['ipMax'], ipMax)
+    n = (plan['nRows'] + blockSize - 1)//blockSize
+    if n <= 1:
+        return [partition], plan
+    return planPartitions(labelBlocks, n, 'IVOL-BLOCK'), plan
+
+#=================================================================
+# planPartitions
+# Split the elements of the region of interest into n partitions for a
+# -workers run, from the labels of a reference field (IVOL of the crimp
+# frame, see FrameSource.labels). Elements are kept in the order of the odb,
+# and each partition is a run of consecutive elements with about the same
+# number of integration points, so results of the partitions written one
+# after the other are in the same order as those of a single run. Each
+# partition is a dictionary with its name and its element labels for each
+# part instance name. The blocks of planBlocks are planned in the same way.
+
+def planPartitions(labelBlocks, n, prefix='IVOL-PARTITION'):
+    el, inst, first, nRows = elementRows(labelBlocks)
+    # split at element boundaries closest to equal numbers of rows
+    bounds = numpy.searchsorted(first, numpy.linspace(0, nRows, n + 1)[1:-1])
+    bounds = numpy.unique(numpy.concatenate(([0], bounds, [len(first)])))
+    names = dict([(code, name) for name, code in instanceCodes.items()])
+    partitions = []
+    for i in range(len(bounds) - 1):
+        rows = slice(bounds[i], bounds[i + 1])
+        members = {}
+        for code in numpy.unique(inst[rows]):
+            members[names[code]] = el[rows][inst[rows] == code]
+        partitions.append({'name': '%s-%i' % (prefix, i + 1), 'members': members})
+    return partitions
+
+# element label, instance code and first row of each element of the blocks
+# of labels, in odb order, and the number of rows. Each run of rows of one
+# element may be its first row; only runs, not rows, are sorted by label.
+def elementRows(labelBlocks):
+    labels = [numpy.zeros(0, dtype=numpy.int32)]
+    codes = [numpy.zeros(0, dtype=numpy.int16)]
+    first = [numpy.zeros(0, dtype=numpy.intp)]
+    nRows = 0
+    for el, code, ipMax in labelBlocks:
+        new = numpy.ones(len(el), dtype=bool)
+        new[1:] = el[1:] != el[:-1]
+        runs = numpy.nonzero(new)[0]
+        del new
+        labels.append(el[runs])
+        codes.append(numpy.repeat(numpy.int16(code), len(runs)))
+        first.append(runs + nRows)
+        nRows += len(el)
+    labels = numpy.concatenate(labels)
+    codes = numpy.concatenate(codes)
+    first = numpy.concatenate(first)
+    keys = labelKeys(codes, labels, numpy.zeros_like(labels))
+    keep = numpy.unique(keys, return_index=True)[1]
+    keep.sort()
+    return labels[keep], codes[keep], first[keep], nRows
+
+# partitions given as element sets, one partition per set
+def setPartitions(setNames):
+    return [{'name': setName, 'elset': setName} for setName in setNames]
+
+#=================================================================
+# partitionRegion
+# Region restricting field output to one partition: its element set, or a
+# set created from its element labels. Sets are named with the checksum of
+# the labels, so that the set created for one frame is used again for the
+# others. Sets cannot always be created in an odb opened read-only; None is
+# then returned, and FrameSource drops the rows outside the partition once a
+# field is read.
+
+def partitionRegion(odb, odbName, partInstance, partition):
+    if 'elset' in partition:
+        try:
+            return regionOfInterest(odb, partInstance, partition['elset'])[-1]
+        except KeyError:
+            raise IvolError('Error: The element set %s does not exist in part instance %s\n'\
+                  '\tor the assembly of odb %s.' % (partition['elset'], partInstance, odbName))
+    members = partition['members']
+    setName = '%s-%s' % (partition['name'], partitionDigest(partition)[:12].upper())
+    try:
+        if partInstance == 'ASSEMBLY':
+            owner = odb.rootAssembly
+        else:
+            owner = odb.rootAssembly.instances[partInstance]
+        if setName in owner.elementSets.keys():
+            return owner.elementSets[setName]
+        if partInstance == 'ASSEMBLY':
+            return owner.ElementSetFromElementLabels(name=setName, elementLabels=tuple(
+                [(name, tuple(labels.tolist())) for name, labels in members.items()]))
+        labels = members.get(partInstance, numpy.zeros(0, dtype=numpy.int32))
+        return owner.ElementSetFromElementLabels(name=setName,
+                                                 elementLabels=tuple(labels.tolist()))
+    except Exception:
+        return None
+
+# checksum of the name and element labels of a partition, which identifies
+# it in manifests and the field cache; partition names are only numbers
+def partitionDigest(partition):
+    digest = hashlib.sha1(partition['name'].encode('utf-8'))
+    for name in sorted(partition.get('members', {}).keys()):
+        digest.update(name.encode('utf-8'))
+        digest.update(numpy.ascontiguousarray(partition['members'][name],
+                                              dtype=numpy.int64).tostring())
+    return digest.hexdigest()
+
+def partitionKeys(partition):
+    keys = [labelKeys(numpy.repeat(numpy.int16(instanceCode(name)), len(labels)),
+                      labels, numpy.zeros_like(labels))
+            for name, labels in partition['members'].items()]
+    if not keys:
+        return numpy.zeros(0, dtype=numpy.int64)
+    return numpy.concatenate(keys)
+
+#=================================================================
+# extractPartition
+# Run outputToText for one partition in a worker process, writing binary
+# part results, with messages written to a log file next to them. Returns
+# the files written, or None if the partition failed.
+
+def extractPartition(args):
+    paramList, options = args
+    logFile = binaryName(paramList[5]) + '.log'
+    log = open(logFile, 'w')
+    stdout = sys.stdout
+    sys.stdout = log
+    try:
+        try:
+            return outputToText(paramList, options)
+        except Exception:
+            import traceback
+            traceback.print_exc(file=log)
+            return None
+    finally:
+        sys.stdout = stdout
+        log.close()
+
+# warning messages in the log file of a part, with their continuation lines
+def partWarnings(logFile):
+    if not os.path.isfile(logFile):
+        return []
+    lines = []
+    warning = False
+    for line in open(logFile):
+        line = line.rstrip('\n')
+        if line.startswith('Warning'):
+            warning = True
+        elif not line.startswith('\t'):
+            warning = False
+        if warning:
+            lines.append(line)
+    return lines
+
+#=================================================================
+# partBlocks
+# Blocks of rows of the binary part results of a -workers run, read one
+# part after the other with memory mapping, so the merge holds only one
+# block in memory
+
+def partBlocks(partDirs, names, blockSize):
+    for partDir in partDirs:
+        arrays = dict([(name, numpy.load(os.path.join(partDir, name + '.npy'),
+                                         mmap_mode='r')) for name in names])
+        nRows = len(arrays['el'])
+        for start in range(0, nRows, blockSize):
+            yield dict([(name, numpy.array(values[start:start + blockSize]))
+                        for name, values in arrays.items()])
+        del arrays
+
+#=================================================================
+# outputPartitioned
+# -workers: extract the results of each partition of the region of interest
+# in a pool of worker processes, each opening the odb read-only and writing
+# binary part results, then merge the parts in order into the results files
+# of each step. Summary values, volume summaries, top rows and the grid are
+# calculated over the merged rows. Returns the files written, or None.
+
+def outputPartitioned(paramList, opts, stepNames, partitions, metadata, manifest,
+                      profile=noProfile):
+    import multiprocessing
+    outputFile = paramList[5]
+    partsDir = binaryName(outputFile) + '.parts'
+    if not os.path.isdir(partsDir):
+        os.makedirs(partsDir)
+
+    # parts hold every column needed for the merged results
+    columns = outputColumns(opts)
+    names = derivedColumns([name for name, description in columns], opts)
+    if opts['xyz']:
+        names += [name for name, description in selectColumns(['el'], opts['xyz'])
+                  if name not in names]
+    partOptions = dict(opts)
+    # .021 parts already written by an interrupted run are not extracted again
+    partOptions.update({'columns': names, 'format': 'npy', 'workers': 1,
+                        'volumes': False, 'topK': None, 'xyz': None,
+                        'overwrite': True, 'splitSets': None, 'update': True,
+                        'storage': 'full', 'aggregate': None})
+    # CSV rows are formatted by the workers, and only copied by the merge.
+    # Parts are at full precision, so the summaries are the same as from
+    # one process; compact CSV rows are formatted by the merge.
+    csvBodies = opts['format'] in ('csv', 'both') and not opts['topK'] and\
+                opts['storage'] != 'compact' and not opts['aggregate']
+    if csvBodies:
+        partOptions['csvBody'] = [name for name, description in columns]
+    tasks = []
+    for i, partition in enumerate(partitions):
+        partParams = list(paramList)
+        partParams[4] = ','.join(stepNames)
+        partParams[5] = os.path.join(partsDir, 'part-%04i.ivol.csv' % (i + 1))
+        partOpts = dict(partOptions)
+        partOpts['partition'] = partition
+        tasks.append((partParams, partOpts))
+
+    print 'Extracting %i partitions with %i worker processes, part results in %s\n' %(
+        len(partitions), opts['workers'], partsDir)
+    started = profile.start()
+    pool = multiprocessing.Pool(min(opts['workers'], len(tasks)), maxtasksperchild=1)
+    try:
+        results = pool.map(extractPartition, tasks, chunksize=1)
+        pool.close()
+        pool.join()
+    except KeyboardInterrupt:
+        pool.terminate()
+        raise
+    profile.stop('partitions', started, len(tasks))
+    # warnings of the parts (e.g. rows missing from a field and excluded)
+    # are repeated here, as their log files are removed after the merge
+    for partParams, partOpts in tasks:
+        for line in partWarnings(binaryName(partParams[5]) + '.log'):
+            print '%s: %s' %(os.path.basename(binaryName(partParams[5])), line)
+    failed = [i for i, written in enumerate(results) if written is None]
+    if failed:
+        print 'Error: %i of %i partitions failed; see the log files in %s' %(
+            len(failed), len(tasks), partsDir)
+        return None
+
+    written = []
+    for stepName in stepNames:
+        stepOutputFile = outputFile
+        if len(stepNames) > 1:
+            stepOutputFile = stepOutputName(outputFile, stepName)
+        partFiles = []
+        partDirs = []
+        nRows = 0
+        nElements = 0
+        labelMax = [0, 0]
+        for partParams, partOpts in tasks:
+            partFile = partParams[5]
+            if len(stepNames) > 1:
+                partFile = stepOutputName(partFile, stepName)
+            partFiles.append(partFile)
+            partDirs.append(binaryName(partFile))
+            file1 = open(os.path.join(partDirs[-1], 'summary.json'))
+            nRows += json.load(file1)['nRows']
+            file1.close()
+            if opts['aggregate']:
+                # parts are split at element boundaries
+                nElements += len(elementStarts(
+                    numpy.load(os.path.join(partDirs[-1], 'el.npy'), mmap_mode='r'),
+                    numpy.load(os.path.join(partDirs[-1], 'ip.npy'), mmap_mode='r')))
+            if opts['storage'] == 'compact':
+                for i, name in enumerate(('el', 'ip')):
+                    labels = numpy.load(os.path.join(partDirs[-1], name + '.npy'),
+                                        mmap_mode='r')
+                    if len(labels):
+                        labelMax[i] = max(labelMax[i], int(labels.max()))
+                    del labels
+        stepMetadata = dict(metadata)
+        stepMetadata['lastStepName'] = stepName
+        stepMetadata['partitions'] = len(tasks)
+        mergeOptions = dict(opts)
+        if csvBodies:
+            mergeOptions['csvBodies'] = [bodyName(partFile) for partFile in partFiles]
+        summary, files = writeBlocks(partBlocks(partDirs, names, opts['blockSize']),
+                                     nRows, columns, stepOutputFile, mergeOptions,
+                                     stepMetadata, profile, storageTypes(opts, *labelMax),
+                                     nElements)
+        written.extend(files)
+        manifest.record(stepName, files)
+    shutil.rmtree(partsDir, ignore_errors=True)
+    return written
 
 #=================================================================
 # rightTrim
@@ -497,6 +3014,7 @@ if __name__ == '__main__':
     outputFileName = None
     overwritePref = None
     paramList = []
+    options = {}
 
     # grab the arguments passed on the command line
     argList = argv
@@ -527,6 +3045,61 @@ if __name__ == '__main__':
             elif (argList[i][:3] == "-ov"):
                 i+=1
                 overwritePref = argList[i]
+            elif (argList[i][:3] == "-bl"):
+                i+=1
+                options['blockSize'] = int(argList[i])
+            elif (argList[i][:3] == "-fo"):
+                i+=1
+                options['format'] = argList[i].lower()
+            elif (argList[i][:3] == "-el"):
+                i+=1
+                # set names are upper case in the odb, like part instances
+                options['elset'] = argList[i].upper()
+            elif (argList[i][:3] == "-ca"):
+                i+=1
+                options['cache'] = argList[i]
+            elif (argList[i][:3] == "-ma"):
+                i+=1
+                options['maxCache'] = float(argList[i])
+            elif (argList[i][:3] == "-cy"):
+                i+=1
+                options['cycle'] = argList[i].lower()
+            elif (argList[i][:3] == "-co"):
+                i+=1
+                options['columns'] = [name.strip() for name in argList[i].split(',')]
+            elif (argList[i][:3] == "-pr"):
+                options['profile'] = True
+            elif (argList[i][:3] == "-vo"):
+                options['volumes'] = True
+            elif (argList[i][:3] == "-to"):
+                i+=1
+                options['topK'] = int(argList[i])
+            elif (argList[i][:3] == "-ra"):
+                i+=1
+                options['rankBy'] = argList[i]
+            elif (argList[i][:3] == "-sy"):
+                i+=1
+                options['symmetry'] = float(argList[i])
+            elif (argList[i][:3] == "-xy"):
+                i+=1
+                options['xyz'] = [name.strip().lower() for name in argList[i].split(',')]
+            elif (argList[i][:3] == "-up"):
+                options['update'] = True
+            elif (argList[i][:3] == "-ag"):
+                i+=1
+                options['aggregate'] = argList[i].lower()
+            elif (argList[i][:3] == "-gu"):
+                i+=1
+                options['gumbel'] = argList[i]
+            elif (argList[i][:3] == "-st"):
+                i+=1
+                options['storage'] = argList[i].lower()
+            elif (argList[i][:3] == "-wo"):
+                i+=1
+                options['workers'] = int(argList[i])
+            elif (argList[i][:3] == "-sp"):
+                i+=1
+                options['splitSets'] = [name.strip().upper() for name in argList[i].split(',')]
             elif (argList[i][:3] == "-he"):
                 print __doc__
                 exit(0)
@@ -547,6 +3120,11 @@ if __name__ == '__main__':
     baseName = odbName[:-4]
     outputFileName = baseName + '.ivol.csv'
 
+    # several steps write one file each, and existing files are skipped
+    # rather than prompting for a new name
+    multipleSteps = ',' in lastStepName or '*' in lastStepName or\
+                    '?' in lastStepName or '[' in lastStepName
+
     # check for overwrite preference
     positive = ['Y', 'y', 'Yes', 'yes', 'T', 'True', 'TRUE']
     if overwritePref in positive:
@@ -554,8 +3132,10 @@ if __name__ == '__main__':
     else:
         overwrite = False
 
-    # check for existing output file
-    if overwrite != True:
+    # check for existing output file; with -update, results that are out of
+    # date are replaced
+    options['overwrite'] = overwrite
+    if overwrite != True and not multipleSteps and not options.get('update'):
         msg = 'The output file %s already exists. Do you want to overwrite\n'\
               'the existing file? (Y/N)\n' %(outputFileName)
         msg1 = 'Please enter the file name to write the output.\n'
@@ -563,7 +3143,10 @@ if __name__ == '__main__':
         negative = ['N', 'n', 'No', 'no']
 
         #Prompt user to enter a different output file name if the specified file already exists.
-        if os.path.isfile(outputFileName):
+        existing = os.path.isfile(outputFileName)
+        if options.get('format') in ('npy', 'both'):
+            existing = existing or os.path.isdir(binaryName(outputFileName))
+        if existing:
             response = raw_input(msg).strip()
             if response in negative:
                 outputFileName = raw_input(msg1).strip()
@@ -576,4 +3159,4 @@ if __name__ == '__main__':
     paramList = [odbName, oldOdbName, partInstance, crimpStepName, lastStepName, outputFileName]
 
     # pass parameters to he function that does all the work
-    outputToText(paramList)
+    outputToText(paramList, options)
@@ -0,0 +1,467 @@
+'''
+ivolServer.py
+=============
+
+Keep output databases open, and extract results columns of ivolResults.004.py
+from them on request, for interactive reviews that query the same ODBs many
+times with different steps, frames, element sets or columns. Each query then
+costs neither the start of Abaqus Python nor opening and checking the ODB, and
+fields read by earlier queries are taken from memory.
+
+Usage: abaqus python ivolServer.py
+      [-odbName odbName,odbName,...]  (ODBs to open at the start)
+      [-port n]  (port on this computer, default 8765)
+      [-maxCache MB]  (memory for fields already read, default 2048)
+      [-root folder]  (folder of the ODBs that may be queried, default the
+                       current folder)
+
+Queries are sent by ivolClient.py, from any Python with numpy, e.g.
+    from ivolClient import IvolClient
+    client = IvolClient(port=8765)
+    data, header = client.extract(odb='open-frame-fatigue-v25mm-9pct.odb',
+                                  partInstance='D101-ASCUT-FRAME-1',
+                                  crimpStepName='crimp-10mm',
+                                  lastStepName='diastole-03',
+                                  columns=['cycEA', 'cycSA', 'ldV'])
+A query names the ODB (and oldOdb if the crimp step is in another ODB), part
+instance (or ASSEMBLY), crimp step, the step of the fatigue cycle, and
+optionally the load and unload frames of that step (frames, default [0, -1]),
+the crimp frame (crimpFrame, default -1), an element set (elset), the cycle
+mode (cycle, ends or full), the columns (default all) and the frames of
+coordinate columns (xyz, e.g. ['crimp']), as in ivolResults.004.py.
+The results are returned as binary column arrays, el and ip first, in the
+row order of the results file of ivolResults.004.py.
+
+ODBs are opened read-only when first named, and kept open until they are
+closed by a client, or the server stops. An ODB whose file has changed is
+opened again. Fields read for a query (restricted to the part instance,
+element set and frame) are kept in memory, and the least recently used are
+dropped when they take more than maxCache MB. A query for other columns of
+the same frames, e.g. a second look at stresses after strains, then reads
+nothing from the ODB. Frames read for the scan of every frame of "cycle
+full" are not kept.
+
+Queries are answered one at a time, as the ODB API is not thread safe, but a
+client that keeps its connection open between its queries, or stops part way
+through a query, does not hold up the others. A client that does not read
+its results is dropped after 60 seconds.
+
+The server only accepts connections from this computer, but from any user of
+it, and has no passwords: any local user may read results from (or close) any
+ODB under the root folder that the user running the server can read. ODBs
+outside the root folder, also through links, are refused. Give a root folder
+that holds only ODBs that all local users may see. Stop the server with
+Ctrl-C, or "python ivolClient.py -shutdown".
+'''
+
+# Copyright 2017 Confluent Medical Technologies
+# Released as part of nitinol-design-concepts
+# https://github.com/confluentmedical/nitinol-design-concepts
+# under terms of Apache 2.0 license
+# http://www.apache.org/licenses/LICENSE-2.0.txt
+
+import os
+import sys
+import imp
+import time
+import json
+import struct
+import socket
+import select
+import traceback
+import collections
+import numpy
+from sys import argv, exit
+
+scriptDir = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, scriptDir)
+from ivolClient import sendMessage, defaultPort
+
+# ivolResults.004.py cannot be imported by name because of the dots
+ivolResults = imp.load_source('ivolResults', os.path.join(scriptDir, 'ivolResults.004.py'))
+
+# seconds a client may take to read a response
+connectionTimeout = 60.0
+
+#=================================================================
+# MemoryFieldCache
+# Fields read from open odbs, kept in memory with the same keys and
+# interface as the FieldCache folder of ivolResults.004.py, least recently
+# used first out once they take more than maxBytes. Arrays are read-only,
+# as they are shared by the queries that use them.
+
+class MemoryFieldCache(ivolResults.FieldCache):
+
+    def __init__(self, maxBytes):
+        self.maxBytes = maxBytes
+        self.fields = collections.OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, odbName, stepName, frameIndex, partInstance, elsetName, fieldName):
+        path = os.path.abspath(odbName)
+        stat = os.stat(path)
+        return (path, stat.st_size, stat.st_mtime, stepName, frameIndex,
+                partInstance, elsetName, fieldName)
+
+    def load(self, key):
+        result = self.fields.pop(key, None)
+        if result is None:
+            self.misses += 1
+            return None
+        # most recently used last
+        self.fields[key] = result
+        self.hits += 1
+        return result
+
+    def save(self, key, el, ip, data, inst, componentLabels):
+        for array in (el, ip, data, inst):
+            array.flags.writeable = False
+        self.fields[key] = (el, ip, data, inst, componentLabels)
+        self.bytes += fieldBytes(self.fields[key])
+        self.evict()
+
+    def evict(self):
+        while self.bytes > self.maxBytes and self.fields:
+            key, result = self.fields.popitem(last=False)
+            self.bytes -= fieldBytes(result)
+
+    # drop the fields of an odb
+    def drop(self, odbName):
+        path = os.path.abspath(odbName)
+        for key in [key for key in self.fields if key[0] == path]:
+            self.bytes -= fieldBytes(self.fields.pop(key))
+
+def fieldBytes(result):
+    return sum([array.nbytes for array in result[:4]])
+
+# True if path is in folder, or one of its subfolders, once links are resolved
+def inFolder(path, folder):
+    path = os.path.normcase(os.path.realpath(path))
+    folder = os.path.normcase(os.path.realpath(folder))
+    return path == folder or path.startswith(folder.rstrip(os.sep) + os.sep)
+
+#=================================================================
+# OdbServer
+# Open odbs, the field cache, and the answer to each request
+
+class OdbServer:
+
+    def __init__(self, maxCacheBytes, root='.'):
+        self.root = os.path.realpath(root)
+        self.odbs = {}
+        self.cache = MemoryFieldCache(maxCacheBytes)
+        self.requests = 0
+        self.stop = False
+
+    # an open odb, opened again if its file has changed
+    def getOdb(self, odbName):
+        path = os.path.abspath(odbName)
+        if not inFolder(path, self.root):
+            raise ivolResults.IvolError('Error: The odb %s is not in the folder %s of '
+                                        'the server.' %(odbName, self.root))
+        if not os.path.isfile(path):
+            raise ivolResults.IvolError('Error: The odb %s does not exist.' %(odbName))
+        stat = os.stat(path)
+        if path in self.odbs:
+            odb, opened = self.odbs[path]
+            if opened == (stat.st_size, stat.st_mtime):
+                return odb
+            print 'The odb %s has changed, and is opened again.' %(odbName)
+            self.closeOdb(odbName)
+        started = time.time()
+        try:
+            odb = ivolResults.openOdb(path, readOnly=ivolResults.TRUE)
+        except Exception, e:
+            raise ivolResults.IvolError('Error: Unable to open the specified odb %s. %s'
+                                        %(odbName, e))
+        self.odbs[path] = (odb, (stat.st_size, stat.st_mtime))
+        print 'Opened %s in %.1f seconds' %(odbName, time.time() - started)
+        return odb
+
+    def closeOdb(self, odbName):
+        path = os.path.abspath(odbName)
+        if path in self.odbs:
+            odb, opened = self.odbs.pop(path)
+            try:
+                odb.close()
+            except:
+                pass
+        self.cache.drop(path)
+
+    def handle(self, request):
+        command = request.get('command', 'extract')
+        if command == 'extract':
+            return self.extract(request)
+        if command == 'status':
+            return {'status': 'ok', 'odbs': sorted(self.odbs.keys()),
+                    'cachedFields': len(self.cache.fields),
+                    'cacheMB': round(self.cache.bytes/1024.0/1024.0, 1),
+                    'maxCacheMB': round(self.cache.maxBytes/1024.0/1024.0, 1),
+                    'requests': self.requests}, []
+        if command == 'close':
+            self.closeOdb(request['odb'])
+            return {'status': 'ok'}, []
+        if command == 'shutdown':
+            self.stop = True
+            return {'status': 'ok'}, []
+        raise ivolResults.IvolError('Error: Unknown command %s. Use extract, status, '
+                                    'close or shutdown.' %(command))
+
+    #=================================================================
+    # extract
+    # Results columns of a request, as readRaw and deriveBlock of
+    # ivolResults.004.py calculate them for the results file
+
+    def extract(self, request):
+        started = time.time()
+        hits, misses = self.cache.hits, self.cache.misses
+        odbName = request['odb']
+        oldOdbName = request.get('oldOdb')
+        # part instance and set names are upper case in the odb
+        partInstance = request['partInstance'].upper()
+        crimpStepName = request['crimpStepName']
+        stepName = request['lastStepName']
+        elsetName = request.get('elset')
+        if elsetName:
+            elsetName = elsetName.upper()
+        loadFrame, unloadFrame = request.get('frames') or (0, -1)
+        cycleMode = request.get('cycle') or 'ends'
+        if cycleMode not in ('ends', 'full'):
+            raise ivolResults.IvolError('Error: Unknown cycle mode %s. Use ends or full.'
+                                        %(cycleMode))
+        opts = dict(ivolResults.defaultOptions)
+        try:
+            columns = ivolResults.selectColumns(request.get('columns'),
+                                                request.get('xyz'))
+        except ValueError, e:
+            raise ivolResults.IvolError('Error: %s' %(e))
+        names = ivolResults.derivedColumns([name for name, d in columns], opts)
+
+        odb = self.getOdb(odbName)
+        ivolResults.checkOdb(odb, odbName, stepName, partInstance)
+        crimpOdbName = oldOdbName or odbName
+        crimpOdb = self.getOdb(crimpOdbName)
+        ivolResults.checkOdb(crimpOdb, crimpOdbName, crimpStepName, partInstance,
+                             'If the crimp results are in a different ODB, use oldOdb.')
+
+        def source(getOdb, name, step, frameIndex, cache=self.cache):
+            return ivolResults.FrameSource(getOdb, name, step, frameIndex, partInstance,
+                                           elsetName, cache)
+        frameSources = {
+            'crimp':  source(lambda: crimpOdb, crimpOdbName, crimpStepName,
+                             request.get('crimpFrame', -1)),
+            'load':   source(lambda: odb, odbName, stepName, loadFrame),
+            'unload': source(lambda: odb, odbName, stepName, unloadFrame)}
+        cycleSources = None
+        if cycleMode == 'full':
+            # frames of the scan are not kept, so that a scan of every frame
+            # does not push the fields of other queries out of memory
+            cycleSources = [source(lambda: odb, odbName, stepName, i, None)
+                            for i in range(len(odb.steps[stepName].frames))]
+        try:
+            raw = ivolResults.readRaw(frameSources, names, cycleSources)
+        except IndexError:
+            raise ivolResults.IvolError('Error: The step %s of odb %s has %i frames; '
+                                        'frames %s are not all in it.' %(
+                stepName, odbName, len(odb.steps[stepName].frames),
+                [request.get('crimpFrame', -1), loadFrame, unloadFrame]))
+
+        nRows = len(raw['el'])
+        blocks = {}
+        for start in range(0, nRows, opts['blockSize']):
+            col = ivolResults.deriveBlock(raw, start, min(start + opts['blockSize'], nRows),
+                                          names)
+            for name, description in columns:
+                blocks.setdefault(name, []).append(col[name])
+        arrays = []
+        header = {'status': 'ok', 'nRows': nRows, 'arrays': [],
+                  'odb': odbName, 'oldOdb': oldOdbName, 'partInstance': partInstance,
+                  'crimpStepName': crimpStepName, 'lastStepName': stepName,
+                  'frames': [loadFrame, unloadFrame], 'elset': elsetName,
+                  'cycle': cycleMode}
+        for name, description in columns:
+            if blocks:
+                array = numpy.concatenate(blocks[name])
+            else:
+                array = numpy.zeros(0)
+            arrays.append(array)
+            header['arrays'].append({'name': name, 'description': description,
+                                      'dtype': array.dtype.str, 'shape': list(array.shape)})
+        header['fieldsCached'] = self.cache.hits - hits
+        header['fieldsRead'] = header['fieldsCached'] + self.cache.misses - misses
+        header['seconds'] = round(time.time() - started, 3)
+        return header, arrays
+
+#=================================================================
+# answer
+# Response to one request, and a line for the log
+
+def answer(server, request):
+    server.requests += 1
+    try:
+        response, arrays = server.handle(request)
+    except ivolResults.IvolError, e:
+        response, arrays = {'status': 'error', 'message': str(e)}, []
+    except KeyError, e:
+        response, arrays = {'status': 'error', 'message':
+                            'Error: The request has no %s, or names an '
+                            'item not in the odb.' %(e)}, []
+    except Exception, e:
+        traceback.print_exc()
+        response, arrays = {'status': 'error', 'message':
+                            'Error: %s: %s' %(e.__class__.__name__, e)}, []
+    command = request.get('command', 'extract')
+    if 'message' in response:
+        print '%s: %s' %(command, response['message'])
+    elif command == 'extract':
+        print 'extract %s %s: %i rows in %.2f seconds, %i of %i fields cached' %(
+            request['odb'], request['lastStepName'], response['nRows'],
+            response['seconds'], response['fieldsCached'], response['fieldsRead'])
+    else:
+        print command
+    sys.stdout.flush()
+    return response, arrays
+
+#=================================================================
+# Connection
+# A connection of a client, and the bytes of its next request received so
+# far. Requests are read as their bytes arrive, and answered once all of a
+# request has arrived, so a client that stops part way through a request
+# does not hold up the others. Requests are JSON headers without arrays.
+
+maxRequestBytes = 1024*1024
+
+class Connection:
+
+    def __init__(self, sock):
+        self.sock = sock
+        self.received = b''
+
+    def fileno(self):
+        return self.sock.fileno()
+
+    # requests completed by the bytes that have arrived; raises EOFError
+    # when the client has closed the connection
+    def requests(self):
+        data = self.sock.recv(1 << 16)
+        if not data:
+            raise EOFError('connection closed')
+        self.received += data
+        requests = []
+        while len(self.received) >= 4:
+            length, = struct.unpack('!I', self.received[:4])
+            if length > maxRequestBytes:
+                raise ValueError('request of %i bytes' %(length))
+            if len(self.received) < 4 + length:
+                break
+            requests.append(json.loads(self.received[4:4 + length].decode('utf-8')))
+            self.received = self.received[4 + length:]
+        return requests
+
+    def close(self):
+        self.sock.close()
+
+#=================================================================
+# serve
+# Answer requests on a local port until a shutdown request. Clients may keep
+# their connections open; the listening socket and every open connection are
+# watched together, and requests are answered one at a time as they arrive,
+# so one client never holds up the others for longer than a request.
+
+def serve(port=defaultPort, odbNames=(), maxCacheBytes=2048*1024*1024, root='.'):
+    server = OdbServer(maxCacheBytes, root)
+    for odbName in odbNames:
+        server.getOdb(odbName)
+    listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    listener.bind(('127.0.0.1', port))
+    listener.listen(5)
+    print 'ivolServer.py is waiting for queries on port %i for odbs in %s' %(
+        port, server.root)
+    sys.stdout.flush()
+    connections = []
+    try:
+        while not server.stop:
+            readable = select.select([listener] + connections, [], [])[0]
+            for connection in readable:
+                if server.stop:
+                    break
+                if connection is listener:
+                    sock, address = listener.accept()
+                    # a client that does not read its response is dropped
+                    sock.settimeout(connectionTimeout)
+                    connections.append(Connection(sock))
+                    continue
+                try:
+                    for request in connection.requests():
+                        sendMessage(connection.sock, *answer(server, request))
+                except EOFError:
+                    # closed by the client
+                    connections.remove(connection)
+                    connection.close()
+                except (socket.error, ValueError, TypeError, AttributeError), e:
+                    # the connection is dropped, and the others are still answered
+                    print 'Connection closed: %s' %(e)
+                    connections.remove(connection)
+                    connection.close()
+    finally:
+        for connection in connections:
+            connection.close()
+        listener.close()
+        for path in server.odbs.keys():
+            server.closeOdb(path)
+    print 'ivolServer.py stopped'
+
+#==================================================================
+# S T A R T
+#
+if __name__ == '__main__':
+
+    port = defaultPort
+    odbNames = []
+    maxCache = 2048
+    root = '.'
+
+    argList = argv
+    argCount = len(argList)
+    i=1
+    try:
+        while (i < argCount):
+            if (argList[i][:3] == "-od"):
+                i+=1
+                odbNames = [name.strip() for name in argList[i].split(',')]
+            elif (argList[i][:3] == "-po"):
+                i+=1
+                port = int(argList[i])
+            elif (argList[i][:3] == "-ma"):
+                i+=1
+                maxCache = float(argList[i])
+            elif (argList[i][:3] == "-ro"):
+                i+=1
+                root = argList[i]
+            elif (argList[i][:3] == "-he"):
+                print __doc__
+                exit(0)
+            else:
+                print "***ERROR: Unknown argument %s" %(argList[i])
+                print __doc__
+                exit(1)
+            i+=1
+    except (IndexError, ValueError):
+        print "***ERROR: Arguments are missing or not valid"
+        print __doc__
+        exit(1)
+
+    if not os.path.isdir(root):
+        print "***ERROR: The root folder %s does not exist" %(root)
+        exit(1)
+
+    try:
+        serve(port, odbNames, int(maxCache*1024*1024), root)
+    except ivolResults.IvolError, e:
+        print e
+        exit(1)
+    except KeyboardInterrupt:
+        print 'ivolServer.py stopped'
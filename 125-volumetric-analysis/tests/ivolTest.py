@@ -0,0 +1,91 @@
+'''
+ivolTest.py
+===========
+
+Setup shared by the regression tests in this folder. The tests run the
+scripts on synthetic output databases of ../bench/odbAccess.py, so they need
+Python 2.7 with numpy, as Abaqus python, but not Abaqus. Run them all from
+the 125-volumetric-analysis folder with
+
+    python -m unittest discover -s tests -p "test*.py"
+
+The bench folder is put first on the Python path, so the synthetic odbAccess
+is found before any Abaqus module.
+'''
+
+# Copyright 2017 Confluent Medical Technologies
+# Released as part of nitinol-design-concepts
+# https://github.com/confluentmedical/nitinol-design-concepts
+# under terms of Apache 2.0 license
+# http://www.apache.org/licenses/LICENSE-2.0.txt
+
+import os
+import sys
+import imp
+import shutil
+import tempfile
+import unittest
+
+testDir = os.path.dirname(os.path.abspath(__file__))
+scriptDir = os.path.dirname(testDir)
+benchDir = os.path.join(scriptDir, 'bench')
+dataDir = os.path.join(testDir, 'data')
+
+for folder in (scriptDir, benchDir):
+    if folder not in sys.path:
+        sys.path.insert(0, folder)
+
+import numpy
+import odbAccess
+ivolResults = imp.load_source('ivolResults', os.path.join(scriptDir, 'ivolResults.004.py'))
+
+#=================================================================
+# Quiet
+# Send what the scripts print to nowhere while a test runs
+
+class Quiet:
+
+    def __enter__(self):
+        self.stdout = sys.stdout
+        sys.stdout = open(os.devnull, 'w')
+
+    def __exit__(self, *args):
+        sys.stdout.close()
+        sys.stdout = self.stdout
+
+#=================================================================
+# SyntheticTestCase
+# Each test runs in a new temporary folder, with a synthetic odb job.odb in
+# it (an empty file of that name, and the synthetic odb registered under it)
+
+class SyntheticTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.startDir = os.getcwd()
+        self.folder = tempfile.mkdtemp(prefix='ivolTest')
+        os.chdir(self.folder)
+
+    def tearDown(self):
+        os.chdir(self.startDir)
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    def synthetic(self, odbName='job.odb', **kwargs):
+        open(odbName, 'w').close()
+        return odbAccess.synthetic(odbName, **kwargs)
+
+    # run outputToText, and return the name of the results file
+    def extract(self, outputFile, options=None, odbName='job.odb', oldOdbName=None,
+                partInstance='PART-1-1', lastStepName='cycle'):
+        paramList = [odbName, oldOdbName, partInstance, 'crimp', lastStepName, outputFile]
+        with Quiet():
+            written = ivolResults.outputToText(paramList, options)
+        self.assertTrue(written, 'outputToText wrote no results for %s' %(options))
+        return outputFile
+
+    # columns of binary results of outputToText (format npy)
+    def readNpy(self, outputFile, names=None):
+        folder = ivolResults.binaryName(outputFile)
+        if names is None:
+            names = [name[:-4] for name in os.listdir(folder) if name.endswith('.npy')]
+        return dict([(name, numpy.load(os.path.join(folder, name + '.npy')))
+                     for name in names])
@@ -0,0 +1,122 @@
+'''
+testIvolBatch.py
+================
+
+Regression tests of ivolBatch.py: failed jobs are retried, a job with no
+result is failed -timeout hours after its worker started it (not after the
+jobs before it are done), and the summary file lists every job.
+'''
+
+# Copyright 2017 Confluent Medical Technologies
+# Released as part of nitinol-design-concepts
+# https://github.com/confluentmedical/nitinol-design-concepts
+# under terms of Apache 2.0 license
+# http://www.apache.org/licenses/LICENSE-2.0.txt
+
+import os
+import csv
+import time
+import unittest
+from ivolTest import SyntheticTestCase, Quiet
+import ivolBatch
+
+def newJob(odbName, **job):
+    return ivolBatch.completeJob(dict(job, odb=odbName, partInstance='PART-1-1',
+                                      crimpStepName='crimp', lastStepName='cycle'))
+
+# outputToText of the worker processes, replaced by a job that sleeps for
+# the seconds in the name of its odb (e.g. sleep-1.5.odb), or fails in its
+# first attempt (fail-once.odb)
+def jobOutputToText(paramList, options):
+    name = os.path.basename(paramList[0])[:-4]
+    if name.startswith('sleep-'):
+        time.sleep(float(name[6:]))
+        return [paramList[5]]
+    if name == 'fail-once':
+        if not os.path.exists('failed-once'):
+            open('failed-once', 'w').close()
+            raise ValueError('first attempt')
+        return [paramList[5]]
+    return outputToText(paramList, options)
+
+outputToText = ivolBatch.ivolResults.outputToText
+
+class TestBatch(SyntheticTestCase):
+
+    def setUp(self):
+        SyntheticTestCase.setUp(self)
+        ivolBatch.ivolResults.outputToText = jobOutputToText
+        self.pollSeconds = ivolBatch.pollSeconds
+        ivolBatch.pollSeconds = 0.1
+
+    def tearDown(self):
+        ivolBatch.ivolResults.outputToText = outputToText
+        ivolBatch.pollSeconds = self.pollSeconds
+        SyntheticTestCase.tearDown(self)
+
+    def runBatch(self, jobs, options=None, **kwargs):
+        with Quiet():
+            return ivolBatch.runBatch(jobs, options or {}, **kwargs)
+
+    # a job that fails is run again, up to retries more times
+    def testRetries(self):
+        self.synthetic(nEl=40)
+        jobs = [newJob('job.odb'), newJob('fail-once.odb'), newJob('missing.odb')]
+        results = self.runBatch(jobs, workers=2, retries=2)
+        self.assertEqual([(r['status'], r['attempts']) for r in results],
+                         [('done', 1), ('done', 2), ('failed', 3)])
+        self.assertEqual(results[0]['files'], 'job.ivol.csv')
+        self.assertTrue(os.path.isfile('job.ivol.csv'))
+        self.assertTrue('missing.ivol.log' in results[2]['message'])
+        # without retries
+        os.remove('failed-once')
+        results = self.runBatch(jobs[1:2], {'overwrite': True}, retries=0)
+        self.assertEqual((results[0]['status'], results[0]['attempts']), ('failed', 1))
+        self.assertEqual(results[0]['message'], 'ValueError: first attempt')
+
+    # the job that hangs is started with the one before it, and fails
+    # timeout after its start, while that one is still running
+    def testTimeout(self):
+        timeout = 2.0
+        jobs = [newJob('sleep-1.5.odb'), newJob('sleep-60.odb'), newJob('sleep-0.odb')]
+        started = time.time()
+        results = self.runBatch(jobs, workers=2, retries=0, timeout=timeout/3600.0)
+        elapsed = time.time() - started
+        self.assertEqual([r['status'] for r in results], ['done', 'failed', 'done'])
+        self.assertTrue(timeout <= results[1]['seconds'] < timeout + 1.0, results[1])
+        self.assertTrue('no result after' in results[1]['message'])
+        self.assertTrue(elapsed < timeout + 1.0, elapsed)
+
+    # jobs waiting for a worker that has a job with no result fail with it,
+    # and are retried with it
+    def testTimeoutWaiting(self):
+        timeout = 1.0
+        jobs = [newJob('sleep-60.odb'), newJob('sleep-0.odb')]
+        started = time.time()
+        results = self.runBatch(jobs, workers=1, retries=1, timeout=timeout/3600.0)
+        self.assertEqual([(r['status'], r['attempts']) for r in results],
+                         [('failed', 2), ('failed', 2)])
+        self.assertTrue('not started' in results[1]['message'])
+        self.assertEqual(results[1]['seconds'], 0)
+        self.assertTrue(time.time() - started < 2*(timeout + 1.0))
+
+    # a summary row for every job, done, skipped and failed
+    def testSummary(self):
+        self.synthetic(nEl=40)
+        open('old.ivol.csv', 'w').close()
+        jobs = [newJob('job.odb'), newJob('old.odb'), newJob('missing.odb')]
+        results = self.runBatch(jobs, retries=0)
+        with Quiet():
+            counts = ivolBatch.writeSummary('summary.csv', results)
+        self.assertEqual(counts, {'done': 1, 'skipped': 1, 'failed': 1})
+        rows = list(csv.reader(open('summary.csv', 'rb')))
+        self.assertEqual(rows[0], ivolBatch.summaryKeys)
+        self.assertEqual([row[:4] for row in rows[1:]],
+                         [['job.odb', 'cycle', 'done', '1'],
+                          ['old.odb', 'cycle', 'skipped', '0'],
+                          ['missing.odb', 'cycle', 'failed', '1']])
+        self.assertEqual(rows[1][5], 'job.ivol.csv')
+        self.assertEqual(rows[2][6], 'results file exists')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,78 @@
+'''
+testIvolMonteCarlo.py
+=====================
+
+Regression tests of the Monte-Carlo runs of ivolMonteCarlo.py: the quantiles
+of each run, the distribution of the largest inclusion, and runs that do not
+depend on -workers, -batch or -first.
+'''
+
+# Copyright 2017 Confluent Medical Technologies
+# Released as part of nitinol-design-concepts
+# https://github.com/confluentmedical/nitinol-design-concepts
+# under terms of Apache 2.0 license
+# http://www.apache.org/licenses/LICENSE-2.0.txt
+
+import math
+import unittest
+import numpy
+import ivolTest  # puts the scripts on the Python path
+from ivolMonteCarlo import quantiles, monteCarlo, materials, mcHeader
+
+# integration point results, with volumes of about probV*volume inclusions
+def syntheticResults(n, inclusions, seed=1):
+    rs = numpy.random.RandomState(seed)
+    volume = inclusions/materials['eli']['probV']
+    data = {'cycEA': rs.standard_normal(n)*0.003, 'cycSA': rs.standard_normal(n)*200.0,
+            'ldV': rs.random_sample(n)*2*volume, 'ulV': rs.random_sample(n)*2*volume}
+    for direction in ('11', '22', '33'):
+        data['ldS' + direction] = rs.standard_normal(n)*300.0
+        data['ulS' + direction] = rs.standard_normal(n)*300.0
+    return data
+
+class TestQuantiles(unittest.TestCase):
+
+    # values of points without inclusions are -1, and sort first
+    def testType7(self):
+        rs = numpy.random.RandomState(2)
+        values = rs.random_sample((50, 40))
+        counts = rs.randint(1, 41, size=50)
+        for i, count in enumerate(counts):
+            values[i, rs.permutation(40)[count:]] = -1.0
+        result = quantiles(values, counts, (0.0, 0.5, 0.99, 1.0))
+        for i in range(50):
+            kept = values[i][values[i] >= 0]
+            for p, q in zip((0, 50, 99, 100), result):
+                # numpy's linear interpolation is R's quantile type 7
+                self.assertAlmostEqual(q[i], numpy.percentile(kept, p), places=12)
+
+class TestMonteCarlo(unittest.TestCase):
+
+    def testBatches(self):
+        data = syntheticResults(500, 0.2)
+        serial = list(monteCarlo(data, materials['eli'], runs=12))
+        batched = list(monteCarlo(data, materials['eli'], runs=12, batch=5, workers=3))
+        split = list(monteCarlo(data, materials['eli'], runs=7)) +\
+                list(monteCarlo(data, materials['eli'], runs=5, first=8, batch=2))
+        self.assertEqual([row[0] for row in serial], range(1, 13))
+        self.assertEqual(len(serial[0]), len(mcHeader) - 2)
+        numpy.testing.assert_array_equal(numpy.array(batched), numpy.array(serial))
+        numpy.testing.assert_array_equal(numpy.array(split), numpy.array(serial))
+
+    # every run has exactly three inclusions at one point, so the defect
+    # size of its largest is Gumbel distributed with mu + s log(3) and s
+    def testLargestInclusion(self):
+        material = materials['eli']
+        volume = 3.0/material['probV']
+        data = syntheticResults(1, 0)
+        data['ldV'] = data['ulV'] = numpy.array([volume])
+        data['ldS33'] = numpy.array([500.0])
+        rows = numpy.array(list(monteCarlo(data, material, runs=4000)))
+        size = rows[:, mcHeader.index('dK33.D') - 2]
+        mu = material['xy']['mu'] + material['xy']['s']*math.log(3.0)
+        median = mu - material['xy']['s']*math.log(math.log(2.0))
+        self.assertAlmostEqual(numpy.median(size), median, delta=0.03)
+        self.assertAlmostEqual(size.mean(), mu + 0.5772157*material['xy']['s'], delta=0.03)
+
+if __name__ == '__main__':
+    unittest.main()
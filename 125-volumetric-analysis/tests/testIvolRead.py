@@ -0,0 +1,128 @@
+'''
+testIvolRead.py
+===============
+
+Regression tests of the voxel grid of ivolRead.py: rows found by
+PointGrid.box and PointGrid.radius, of a grid as built, as read back with
+readGrid, and as written by ivolResults.004.py -xyz, are the rows a scan of
+every coordinate finds, including points on the boundary of a query or of a
+cell, and queries that find nothing.
+'''
+
+# Copyright 2017 Confluent Medical Technologies
+# Released as part of nitinol-design-concepts
+# https://github.com/confluentmedical/nitinol-design-concepts
+# under terms of Apache 2.0 license
+# http://www.apache.org/licenses/LICENSE-2.0.txt
+
+import unittest
+import numpy
+from ivolTest import SyntheticTestCase, ivolResults
+from ivolRead import PointGrid, readGrid, readIvol
+
+# rows found by scanning every point
+def scanBox(xyz, lo, hi):
+    return numpy.nonzero(numpy.all((xyz >= lo) & (xyz <= hi), axis=1))[0]
+
+def scanRadius(xyz, center, radius):
+    return numpy.nonzero(numpy.sum((xyz - center)**2, axis=1) <= radius*radius)[0]
+
+# points of a strut: a thin band of random points, and points on a lattice
+# of the cell size, so that some lie on cell boundaries
+def strutPoints(seed=1):
+    rs = numpy.random.RandomState(seed)
+    band = rs.random_sample((2000, 3))*[10.0, 0.5, 0.3]
+    lattice = numpy.mgrid[0:10:0.5, 0:1:0.5, 0:1:0.5].reshape(3, -1).T
+    return numpy.vstack((band, lattice, lattice[:5]))
+
+#=================================================================
+# PointGrid
+
+class TestPointGrid(SyntheticTestCase):
+
+    def assertQueries(self, grid, xyz, seed=2):
+        rs = numpy.random.RandomState(seed)
+        lo = xyz.min(axis=0)
+        extent = xyz.max(axis=0) - lo
+        for i in range(200):
+            a = lo - 0.1*extent + rs.random_sample(3)*1.2*extent
+            b = a + rs.random_sample(3)*extent*rs.choice([0.05, 0.3, 1.2])
+            self.assertTrue(numpy.array_equal(grid.box(a, b), scanBox(xyz, a, b)))
+            r = float(rs.random_sample()*extent.max()*rs.choice([0.01, 0.1, 1.0]))
+            self.assertTrue(numpy.array_equal(grid.radius(a, r), scanRadius(xyz, a, r)))
+
+    def testQueries(self):
+        xyz = strutPoints()
+        self.assertQueries(PointGrid(xyz), xyz)
+        # every point in one cell, and one point in each of many cells
+        self.assertQueries(PointGrid(xyz, cellSize=100.0), xyz)
+        self.assertQueries(PointGrid(xyz, cellSize=0.01), xyz)
+
+    # queries whose faces or radius meet points exactly, with the cell size
+    # of the lattice, so the points are on cell boundaries too
+    def testBoundary(self):
+        xyz = strutPoints()
+        grid = PointGrid(xyz, cellSize=0.5)
+        for lo, hi in (([1.0, 0.0, 0.0], [2.0, 0.5, 0.5]),
+                       ([0.0, 0.0, 0.0], [0.0, 0.0, 0.0]),      # a point, twice
+                       (xyz.min(axis=0), xyz.max(axis=0))):
+            rows = grid.box(lo, hi)
+            self.assertTrue(numpy.array_equal(rows, scanBox(xyz, lo, hi)))
+            self.assertTrue(len(rows) >= 2)
+        # the center and its four lattice neighbours at exactly the radius
+        center = numpy.array([3.0, 0.5, 0.5])
+        rows = grid.radius(center, 0.5)
+        self.assertTrue(numpy.array_equal(rows, scanRadius(xyz, center, 0.5)))
+        for point in ([3.0, 0.5, 0.5], [2.5, 0.5, 0.5], [3.5, 0.5, 0.5],
+                      [3.0, 0.0, 0.5], [3.0, 0.5, 0.0]):
+            self.assertTrue(numpy.all(xyz[rows] == point, axis=1).any(), point)
+
+    def testEmpty(self):
+        xyz = strutPoints()
+        grid = PointGrid(xyz)
+        for lo, hi in (([20.0, 0.0, 0.0], [30.0, 1.0, 1.0]),     # outside the extent
+                       ([-5.0, -5.0, -5.0], [-1.0, -1.0, -1.0]),
+                       ([2.0, 0.2, 0.2], [1.0, 0.3, 0.3])):      # lo > hi
+            self.assertEqual(len(grid.box(lo, hi)), 0)
+            self.assertEqual(len(scanBox(xyz, numpy.array(lo), numpy.array(hi))), 0)
+        self.assertEqual(len(grid.radius([5.0, 5.0, 5.0], 1.0)), 0)
+        # a grid of no points
+        empty = PointGrid(numpy.zeros((0, 3)))
+        self.assertEqual(len(empty.box([0.0, 0.0, 0.0], [1.0, 1.0, 1.0])), 0)
+        self.assertEqual(len(empty.radius([0.0, 0.0, 0.0], 1.0)), 0)
+
+    def testReadGrid(self):
+        xyz = strutPoints()
+        PointGrid(xyz).save('grid.npz', frame='crimp')
+        grid, meta = readGrid('grid.npz')
+        self.assertEqual(meta, {'frame': 'crimp'})
+        self.assertQueries(grid, xyz)
+
+#=================================================================
+# -xyz
+
+class TestXyz(SyntheticTestCase):
+
+    # the grid written with the results indexes the coordinates of the
+    # first -xyz frame, by row of the results
+    def testGrid(self):
+        self.synthetic(nEl=40, coordinates=True)
+        for options in ({}, {'elset': 'HALF', 'blockSize': 7}):
+            options = dict(options, xyz=['load', 'crimp'], format='npy', overwrite=True)
+            self.extract('job.ivol.csv', options)
+            data, meta = readIvol(ivolResults.binaryName('job.ivol.csv'))
+            xyz = numpy.column_stack([data['ldC' + c] for c in ('1', '2', '3')])
+            grid, gridMeta = readGrid(ivolResults.gridName('job.ivol.csv'))
+            self.assertEqual(gridMeta['frame'], 'load')
+            self.assertTrue(numpy.array_equal(grid.xyz, xyz))
+            lo = xyz.min(axis=0)
+            hi = xyz.max(axis=0)
+            for a, b in ((lo, hi), (lo, (lo + hi)/2), (hi + 1, hi + 2)):
+                self.assertTrue(numpy.array_equal(grid.box(a, b), scanBox(xyz, a, b)))
+            center = xyz[len(xyz)//2]
+            for r in (0.0, float((hi - lo).max())/4):
+                self.assertTrue(numpy.array_equal(grid.radius(center, r),
+                                                  scanRadius(xyz, center, r)))
+
+if __name__ == '__main__':
+    unittest.main()
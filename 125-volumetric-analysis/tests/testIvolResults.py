@@ -0,0 +1,824 @@
+'''
+testIvolResults.py
+==================
+
+Regression tests of ivolResults.004.py on synthetic output databases. The
+results of the default options must be the same, byte for byte, as
+data/synthetic-40.ivol.csv, written by the original ivolResults.004.py
+(before .005) for odbAccess.synthetic('job.odb', nEl=40).
+'''
+
+# Copyright 2017 Confluent Medical Technologies
+# Released as part of nitinol-design-concepts
+# https://github.com/confluentmedical/nitinol-design-concepts
+# under terms of Apache 2.0 license
+# http://www.apache.org/licenses/LICENSE-2.0.txt
+
+import os
+import sys
+import json
+import unittest
+import StringIO
+import numpy
+from ivolTest import SyntheticTestCase, Quiet, ivolResults, odbAccess, dataDir
+from ivolRead import readCsv
+
+baselineFile = os.path.join(dataDir, 'synthetic-40.ivol.csv')
+
+def headerLines(path, n=47):
+    f = open(path)
+    lines = [f.readline() for i in range(n)]
+    f.close()
+    return lines
+
+def bulkData(odb, stepName, frameIndex, fieldName):
+    block = odb.steps[stepName].frames[frameIndex].fieldOutputs[fieldName].bulkDataBlocks[0]
+    return block.data.astype(numpy.float64)
+
+# sorted principal values of tensors (11, 22, 33, 12, 13, 23)
+def eigenvalues(t):
+    full = numpy.zeros((len(t), 3, 3))
+    for k, (i, j) in enumerate([(0, 0), (1, 1), (2, 2), (0, 1), (0, 2), (1, 2)]):
+        full[:, i, j] = full[:, j, i] = t[:, k]
+    return numpy.linalg.eigvalsh(full)
+
+labelsS = ('S11', 'S22', 'S33', 'S12', 'S13', 'S23')
+
+def absMax(values):
+    return numpy.where(abs(values[:, 2]) > abs(values[:, 0]), values[:, 2], values[:, 0])
+
+# fields read from each frame of a synthetic odb, recorded as (step, frame,
+# field) in the list returned each time a field output is looked up
+def recordFields(odb):
+    read = []
+    class Recorded(odbAccess.Repository):
+        def __getitem__(self, name):
+            read.append(self.frameKey + (name,))
+            return odbAccess.Repository.__getitem__(self, name)
+    for stepName, step in odb.steps.items():
+        for frameIndex, frame in enumerate(step.frames):
+            fieldOutputs = Recorded(frame.fieldOutputs)
+            fieldOutputs.frameKey = (stepName, frameIndex)
+            frame.fieldOutputs = fieldOutputs
+    return read
+
+#=================================================================
+# default results, -blockSize and -workers
+
+class TestResults(SyntheticTestCase):
+
+    def testBaseline(self):
+        self.synthetic(nEl=40)
+        self.extract('job.ivol.csv')
+        self.assertEqual(open('job.ivol.csv').read(), open(baselineFile).read())
+
+    def testSmallBlocks(self):
+        self.synthetic(nEl=40)
+        self.extract('whole.ivol.csv')
+        self.extract('blocks.ivol.csv', {'blockSize': 7})
+        self.assertEqual(open('blocks.ivol.csv').read(), open('whole.ivol.csv').read())
+
+    # fields are read one block of whole elements at a time; only the labels
+    # of IVOL of the crimp frame are read for the whole region, to plan them
+    def testBlockReads(self):
+        self.synthetic(nEl=40, coordinates=True)
+        options = {'cycle': 'full', 'elset': 'HALF', 'xyz': ['crimp'], 'format': 'both'}
+        self.extract('whole.ivol.csv', options)
+        sizes = []
+        fieldArrays = ivolResults.fieldArrays
+        def counted(field):
+            result = fieldArrays(field)
+            sizes.append(len(result[0]))
+            return result
+        ivolResults.fieldArrays = counted
+        try:
+            self.extract('blocks.ivol.csv', dict(options, blockSize=7))
+        finally:
+            ivolResults.fieldArrays = fieldArrays
+        self.assertTrue(max(sizes) <= 7 + 5)
+        self.assertEqual(open('blocks.ivol.csv').read(), open('whole.ivol.csv').read())
+        whole = self.readNpy('whole.ivol.csv')
+        blocks = self.readNpy('blocks.ivol.csv')
+        self.assertEqual(sorted(blocks), sorted(whole))
+        for name in whole:
+            self.assertTrue(numpy.array_equal(blocks[name], whole[name]), name)
+
+    # rows missing from a field of one block are excluded, and binary
+    # results are cut to the rows written
+    def testBlockMissingRows(self):
+        odb = self.synthetic(nEl=40)
+        field = odb.steps['cycle'].frames[0].fieldOutputs['IVOL']
+        instance, el, ip, getData = field.blocks[0]
+        keep = el != 3
+        field.blocks = [(instance, el[keep], ip[keep],
+                         lambda rows=slice(None): getData()[keep][rows])]
+        self.extract('whole.ivol.csv', {'format': 'both'})
+        self.extract('blocks.ivol.csv', {'format': 'both', 'blockSize': 7})
+        self.assertEqual(open('blocks.ivol.csv').read(), open('whole.ivol.csv').read())
+        blocks = self.readNpy('blocks.ivol.csv')
+        self.assertEqual(len(blocks['el']), 195)
+        for name, values in self.readNpy('whole.ivol.csv').items():
+            self.assertTrue(numpy.array_equal(blocks[name], values), name)
+
+    def testWorkers(self):
+        self.synthetic(nEl=40, nInstances=2)
+        self.extract('serial.ivol.csv', partInstance='ASSEMBLY')
+        self.extract('workers.ivol.csv', {'workers': 3, 'blockSize': 7},
+                     partInstance='ASSEMBLY')
+        self.assertEqual(open('workers.ivol.csv').read(), open('serial.ivol.csv').read())
+
+    def testWorkersElset(self):
+        self.synthetic(nEl=40)
+        self.extract('serial.ivol.csv', {'elset': 'HALF'})
+        self.extract('workers.ivol.csv', {'elset': 'HALF', 'workers': 2})
+        self.assertEqual(open('workers.ivol.csv').read(), open('serial.ivol.csv').read())
+
+    # parts of another number of workers are other elements, whose cached
+    # crimp fields must not be used
+    def testWorkersCache(self):
+        self.synthetic(nEl=40)
+        self.extract('serial.ivol.csv')
+        for workers in (2, 4, 3):
+            self.extract('workers.ivol.csv', {'workers': workers, 'cache': 'cache'})
+            self.assertEqual(open('workers.ivol.csv').read(),
+                             open('serial.ivol.csv').read(), workers)
+
+    # rows missing from a field of one part are reported by the merge
+    def testWorkersWarnings(self):
+        odb = self.synthetic(nEl=40)
+        field = odb.steps['cycle'].frames[0].fieldOutputs['IVOL']
+        instance, el, ip, getData = field.blocks[0]
+        keep = el != 3
+        field.blocks = [(instance, el[keep], ip[keep],
+                         lambda rows=slice(None): getData()[keep][rows])]
+        output = StringIO.StringIO()
+        stdout = sys.stdout
+        sys.stdout = output
+        try:
+            ivolResults.outputToText(['job.odb', None, 'PART-1-1', 'crimp', 'cycle',
+                                      'workers.ivol.csv'], {'workers': 2})
+        finally:
+            sys.stdout = stdout
+        self.assertTrue('part-0001.ivol: Warning: 5 integration points' in output.getvalue())
+        self.assertEqual(readCsv('workers.ivol.csv')[1]['nRows'], 195)
+
+#=================================================================
+# several steps
+
+class TestSteps(SyntheticTestCase):
+
+    # the crimp frame is read as often for three steps as for one, and the
+    # results of each step are those of a run of that step alone
+    def testSteps(self):
+        for options in ({}, {'blockSize': 7}, {'cycle': 'full', 'format': 'both'}):
+            options = dict(options, overwrite=True)
+            read = recordFields(self.synthetic(nEl=40, steps=('crimp', 'cycle-1',
+                                                              'cycle-2', 'cycle-3')))
+            self.extract('one.ivol.csv', options, lastStepName='cycle-2')
+            once = [key for key in read if key[0] == 'crimp']
+            del read[:]
+            self.extract('job.ivol.csv', options, lastStepName='cycle-*')
+            self.assertTrue(once)
+            self.assertEqual(sorted([key for key in read if key[0] == 'crimp']),
+                             sorted(once))
+            for step in ('cycle-1', 'cycle-2', 'cycle-3'):
+                self.extract('single.ivol.csv', options, lastStepName=step)
+                self.assertEqual(open('job.%s.ivol.csv' %(step)).read(),
+                                 open('single.ivol.csv').read(), step)
+                if options.get('format') == 'both':
+                    single = self.readNpy('single.ivol.csv')
+                    for name, values in self.readNpy('job.%s.ivol.csv' %(step)).items():
+                        self.assertTrue(numpy.array_equal(values, single[name]), name)
+
+#=================================================================
+# -profile
+
+class TestProfile(SyntheticTestCase):
+
+    # run with -profile, returning what it printed
+    def profiled(self, outputFile, options):
+        output = StringIO.StringIO()
+        stdout = sys.stdout
+        sys.stdout = output
+        try:
+            written = ivolResults.outputToText(['job.odb', None, 'PART-1-1', 'crimp', 'cycle',
+                                                outputFile], dict(options, profile=True))
+        finally:
+            sys.stdout = stdout
+        self.assertTrue(written)
+        return output.getvalue()
+
+    # each stage is listed in the table printed and in the profile file,
+    # with the rows written, and the results are those of a run without
+    # -profile (the second run has the crimp fields of the first in its cache)
+    def testStages(self):
+        self.synthetic(nEl=40, coordinates=True)
+        for options, stages, nRows in (
+                ({'volumes': True, 'xyz': ['crimp'], 'cache': 'cache'},
+                 ['openOdb', 'subset', 'readLabels', 'cacheSave', 'planBlocks', 'readField',
+                  'alignRows', 'cycleField', 'derive', 'volumes', 'writeCsv', 'writeNpy',
+                  'grid', 'closeOdb'], 200),
+                ({'cycle': 'full', 'topK': 10, 'cache': 'cache'},
+                 ['openOdb', 'cacheLoad', 'planBlocks', 'alignRows', 'subset', 'readField',
+                  'cycleExtremes', 'derive', 'topK', 'writeCsv', 'writeNpy', 'closeOdb'], 10),
+                ({'aggregate': 'element'},
+                 ['openOdb', 'subset', 'readLabels', 'planBlocks', 'readField', 'alignRows',
+                  'cycleField', 'derive', 'aggregate', 'writeCsv', 'writeNpy', 'closeOdb'], 40),
+                # the parts are read and derived by the workers
+                ({'workers': 2},
+                 ['openOdb', 'subset', 'readLabels', 'planPartitions', 'partitions',
+                  'writeCsv', 'writeNpy', 'closeOdb'], 200)):
+            options = dict(options, format='both', blockSize=70, overwrite=True)
+            printed = self.profiled('profiled.ivol.csv', options)
+            report = json.load(open(ivolResults.profileName('profiled.ivol.csv')))
+            phases = dict([(phase['phase'], phase) for phase in report['phases']])
+            self.assertEqual(sorted(phases), sorted(stages), options)
+            for name in stages + ['total']:
+                self.assertTrue('\n%-14s ' %(name) in printed, (name, options))
+            self.assertEqual(phases['writeNpy']['count'], nRows)
+            self.assertTrue(report['total']['wallSeconds'] >= 0.0)
+
+            self.extract('plain.ivol.csv', options)
+            self.assertEqual(open('profiled.ivol.csv').read(), open('plain.ivol.csv').read())
+            plain = self.readNpy('plain.ivol.csv')
+            for name, values in self.readNpy('profiled.ivol.csv').items():
+                self.assertTrue(numpy.array_equal(values, plain[name]), name)
+            self.assertFalse(os.path.exists(ivolResults.profileName('plain.ivol.csv')))
+
+#=================================================================
+# -elset and part instances
+
+class TestSubsets(SyntheticTestCase):
+
+    def assertRows(self, outputFile, full, rows):
+        subset = self.readNpy(outputFile)
+        self.assertEqual(sorted(subset), sorted(full))
+        for name, values in full.items():
+            self.assertTrue(numpy.array_equal(subset[name], values[rows]), name)
+
+    # a run of an element set has exactly the rows of its elements in a run
+    # of the whole part instance
+    def testElset(self):
+        self.synthetic(nEl=40)
+        self.extract('all.ivol.csv', {'format': 'npy'})
+        full = self.readNpy('all.ivol.csv')
+        rows = numpy.nonzero(full['el'] <= 20)[0]
+        for options in ({}, {'blockSize': 7}, {'workers': 2}):
+            self.extract('half.ivol.csv', dict(options, elset='HALF', format='npy',
+                                               overwrite=True))
+            self.assertRows('half.ivol.csv', full, rows)
+
+    # a run of one part instance has exactly its rows in a run of the
+    # assembly, which are those of each instance in turn
+    def testInstance(self):
+        self.synthetic(nEl=40, nInstances=2)
+        self.extract('all.ivol.csv', {'format': 'npy'}, partInstance='ASSEMBLY')
+        full = self.readNpy('all.ivol.csv')
+        self.assertEqual(len(full['el']), 400)
+        for partInstance, rows in (('PART-1-1', numpy.arange(200)),
+                                   ('PART-2-1', numpy.arange(200, 400))):
+            for options in ({}, {'blockSize': 7}):
+                self.extract('part.ivol.csv', dict(options, format='npy', overwrite=True),
+                             partInstance=partInstance)
+                self.assertRows('part.ivol.csv', full, rows)
+        # and an element set of the first instance
+        self.extract('half.ivol.csv', {'format': 'npy', 'elset': 'HALF'},
+                     partInstance='PART-1-1')
+        self.assertRows('half.ivol.csv', full, numpy.arange(100))
+
+#=================================================================
+# -columns
+
+class TestColumns(SyntheticTestCase):
+
+    # fields of each frame of the odb read by a run, as (step, frame, field)
+    def readFields(self, options):
+        read = recordFields(self.synthetic(nEl=40))
+        self.extract('columns.ivol.csv', dict(options, format='npy', overwrite=True))
+        return set(read)
+
+    # only LE of the crimp frame, and the labels of its IVOL that plan the
+    # blocks, are read for columns of the crimp frame; no frame of the cycle
+    # step is read, even with -cycle full
+    def testCrimpOnly(self):
+        for options in ({}, {'cycle': 'full'}, {'blockSize': 7}):
+            read = self.readFields(dict(options, columns=['el', 'ip', 'preE']))
+            self.assertEqual(read, set([('crimp', 2, 'LE'), ('crimp', 2, 'IVOL')]), options)
+            self.extract('all.ivol.csv', {'format': 'npy', 'overwrite': True})
+            columns = self.readNpy('columns.ivol.csv')
+            self.assertEqual(sorted(columns), ['el', 'ip', 'preE'])
+            for name, values in columns.items():
+                self.assertTrue(numpy.array_equal(values, self.readNpy('all.ivol.csv')[name]))
+
+    def testLoadFrame(self):
+        read = self.readFields({'columns': ['el', 'ip', 'ldV']})
+        self.assertEqual(read, set([('cycle', 0, 'IVOL'), ('crimp', 2, 'IVOL')]))
+
+#=================================================================
+# principalValues
+
+class TestPrincipalValues(unittest.TestCase):
+
+    # to tolerance of the largest principal value of each tensor
+    def assertEigenvalues(self, t, tolerance):
+        pMin, pMax = ivolResults.principalValues(ivolResults.fullTensor(t, labelsS))
+        expected = eigenvalues(t.astype(numpy.float64))
+        scale = tolerance*abs(expected).max(axis=1)
+        self.assertTrue((abs(pMin - expected[:, 0]) <= scale).all())
+        self.assertTrue((abs(pMax - expected[:, 2]) <= scale).all())
+
+    def testRandom(self):
+        rs = numpy.random.RandomState(1)
+        self.assertEigenvalues(rs.standard_normal((10000, 6))*300.0, 1e-13)
+        self.assertEigenvalues(rs.standard_normal((10000, 6))*0.01, 1e-13)
+
+    # single precision components, as read from the odb
+    def testSinglePrecision(self):
+        rs = numpy.random.RandomState(3)
+        t = (rs.standard_normal((10000, 6))*300.0).astype(numpy.float32)
+        self.assertEqual(ivolResults.principalValues(ivolResults.fullTensor(
+            t, labelsS))[1].dtype, numpy.float64)
+        self.assertEigenvalues(t, 1e-13)
+
+    # two or three equal principal values, where the closed form loses half
+    # its digits
+    def testRepeated(self):
+        t = numpy.zeros((5, 6))
+        t[1, :3] = 1.0                      # hydrostatic
+        t[2, 0] = 2.0                       # uniaxial
+        t[3, :2] = -1.5                     # equal biaxial
+        t[4, 3:] = 1e-3                     # pure shear
+        self.assertEigenvalues(t, 2e-8)
+        rs = numpy.random.RandomState(2)
+        rotated = []
+        for i in range(1000):
+            q = numpy.linalg.qr(rs.standard_normal((3, 3)))[0]
+            values = rs.standard_normal(3)
+            values[1] = values[0]
+            d = numpy.dot(q*values, q.T)
+            rotated.append([d[0, 0], d[1, 1], d[2, 2], d[0, 1], d[0, 2], d[1, 2]])
+        self.assertEigenvalues(numpy.array(rotated), 2e-8)
+
+#=================================================================
+# LabelIndex
+
+class TestLabelIndex(unittest.TestCase):
+
+    def testAlign(self):
+        rs = numpy.random.RandomState(4)
+        el = numpy.repeat(numpy.arange(1, 101, dtype=numpy.int32), 4)
+        ip = numpy.tile(numpy.arange(1, 5, dtype=numpy.int32), 100)
+        inst = numpy.zeros(len(el), dtype=numpy.int32)
+        index = ivolResults.LabelIndex(ivolResults.labelKeys(inst, el, ip))
+        data = rs.random_sample((len(el), 6))
+
+        # shuffled, with 10 rows missing and 3 rows of other elements
+        order = rs.permutation(len(el))[10:]
+        otherEl = numpy.append(el[order], [200, 201, 202])
+        otherIp = numpy.append(ip[order], [1, 1, 1])
+        otherInst = numpy.zeros(len(otherEl), dtype=numpy.int32)
+        otherData = numpy.vstack((data[order], rs.random_sample((3, 6))))
+        aligned, found, extra = index.align(
+            ivolResults.labelKeys(otherInst, otherEl, otherIp), otherData)
+        self.assertEqual(extra, 3)
+        self.assertEqual(numpy.sum(found), len(el) - 10)
+        self.assertTrue(numpy.array_equal(numpy.sort(numpy.nonzero(found)[0]),
+                                          numpy.sort(order)))
+        self.assertTrue(numpy.array_equal(aligned[found], data[found]))
+
+    def testInstances(self):
+        el = numpy.array([1, 1, 1, 1], dtype=numpy.int32)
+        ip = numpy.array([1, 2, 1, 2], dtype=numpy.int32)
+        inst = numpy.array([0, 0, 1, 1], dtype=numpy.int32)
+        index = ivolResults.LabelIndex(ivolResults.labelKeys(inst, el, ip))
+        order = numpy.array([3, 2, 1, 0])
+        aligned, found, extra = index.align(
+            ivolResults.labelKeys(inst[order], el[order], ip[order]), order*10.0)
+        self.assertTrue(numpy.array_equal(aligned, [0.0, 10.0, 20.0, 30.0]))
+        self.assertTrue(found.all())
+
+    def testDuplicate(self):
+        el = numpy.array([1, 1, 2], dtype=numpy.int32)
+        ip = numpy.array([1, 1, 1], dtype=numpy.int32)
+        inst = numpy.zeros(3, dtype=numpy.int32)
+        self.assertRaises(ValueError, ivolResults.LabelIndex,
+                          ivolResults.labelKeys(inst, el, ip))
+
+class TestReordered(SyntheticTestCase):
+
+    # results with the crimp step in another odb, whose fields list the
+    # integration points in reverse order, are those of a single odb, in the
+    # row order of the crimp odb (read first)
+    def testOldOdb(self):
+        self.synthetic(nEl=40)
+        crimpOdb = self.synthetic('crimp.odb', nEl=40, steps=('crimp',))
+        for frame in crimpOdb.steps['crimp'].frames:
+            for field in frame.fieldOutputs.values():
+                field.blocks = [(instance, el[::-1], ip[::-1],
+                                 lambda rows=slice(None), getData=getData: getData()[::-1][rows])
+                                for instance, el, ip, getData in field.blocks]
+        self.extract('single.ivol.csv', {'format': 'npy'})
+        self.extract('two.ivol.csv', {'format': 'npy'}, oldOdbName='crimp.odb')
+        single = self.readNpy('single.ivol.csv')
+        two = self.readNpy('two.ivol.csv')
+        self.assertEqual(sorted(two), sorted(single))
+        for name in single:
+            self.assertTrue(numpy.array_equal(two[name][::-1], single[name]), name)
+
+#=================================================================
+# -cache
+
+class TestFieldCache(SyntheticTestCase):
+
+    def setUp(self):
+        SyntheticTestCase.setUp(self)
+        self.opened = []
+        self.openOdb = ivolResults.openOdb
+        def openOdb(path, **kwargs):
+            self.opened.append(path)
+            return self.openOdb(path, **kwargs)
+        ivolResults.openOdb = openOdb
+
+    def tearDown(self):
+        ivolResults.openOdb = self.openOdb
+        SyntheticTestCase.tearDown(self)
+
+    def synthetic(self, odbName='job.odb', **kwargs):
+        SyntheticTestCase.synthetic(self, 'job.odb', nEl=40, steps=('cycle',), **kwargs)
+        return SyntheticTestCase.synthetic(self, 'crimp.odb', nEl=40, steps=('crimp',),
+                                           **kwargs)
+
+    def extract(self, outputFile, options=None):
+        del self.opened[:]
+        return SyntheticTestCase.extract(self, outputFile, options, oldOdbName='crimp.odb')
+
+    # a warm cache gives the results of a cold one, without opening the
+    # crimp odb
+    def testWarm(self):
+        self.synthetic()
+        self.extract('plain.ivol.csv', {'format': 'both'})
+        self.extract('cold.ivol.csv', {'format': 'both', 'cache': 'cache'})
+        self.assertEqual(self.opened, ['job.odb', 'crimp.odb'])
+        self.extract('warm.ivol.csv', {'format': 'both', 'cache': 'cache'})
+        self.assertEqual(self.opened, ['job.odb'])
+        for name in ('cold.ivol.csv', 'warm.ivol.csv'):
+            self.assertEqual(open(name).read(), open('plain.ivol.csv').read())
+            for column, values in self.readNpy('plain.ivol.csv').items():
+                self.assertTrue(numpy.array_equal(self.readNpy(name)[column], values), column)
+
+    # a crimp odb written again has another modification time, and its
+    # fields are read again
+    def testModified(self):
+        self.synthetic()
+        self.extract('old.ivol.csv', {'cache': 'cache'})
+        self.synthetic(seed=2)
+        stat = os.stat('crimp.odb')
+        os.utime('crimp.odb', (stat.st_atime, stat.st_mtime + 10))
+        self.extract('new.ivol.csv', {'cache': 'cache'})
+        self.assertEqual(self.opened, ['job.odb', 'crimp.odb'])
+        self.extract('plain.ivol.csv')
+        self.assertEqual(open('new.ivol.csv').read(), open('plain.ivol.csv').read())
+        self.assertNotEqual(readCsv('old.ivol.csv')[0]['preE'].tolist(),
+                            readCsv('new.ivol.csv')[0]['preE'].tolist())
+
+    # the least recently used fields are removed once the folder is larger
+    # than maxBytes
+    def testEvict(self):
+        values = numpy.arange(1000, dtype=numpy.float32)
+        labels = numpy.arange(1000, dtype=numpy.int32)
+        inst = numpy.repeat(numpy.int16(ivolResults.instanceCode('PART-1-1')), 1000)
+        probe = ivolResults.FieldCache('probe', 1 << 30)
+        probe.save('probe', labels, labels, values, inst, ())
+        size = os.path.getsize(os.path.join('probe', 'probe.npz'))
+        cache = ivolResults.FieldCache('cache', int(3.5*size))
+        for i, key in enumerate(('a', 'b', 'c')):
+            cache.save(key, labels, labels, values, inst, ())
+            os.utime(os.path.join('cache', key + '.npz'), (1000*(i + 1), 1000*(i + 1)))
+        self.assertTrue(numpy.array_equal(cache.load('a')[2], values))
+        cache.save('d', labels, labels, values, inst, ())
+        self.assertEqual(sorted(os.listdir('cache')), ['a.npz', 'c.npz', 'd.npz'])
+        self.assertEqual(cache.load('b'), None)
+
+        # and after a run
+        self.synthetic()
+        self.extract('small.ivol.csv', {'cache': 'small', 'maxCache': 0.01})
+        files = [os.path.join('small', name) for name in os.listdir('small')]
+        self.assertTrue(files)
+        self.assertTrue(sum([os.path.getsize(f) for f in files]) <= int(0.01*1024*1024))
+
+#=================================================================
+# -cycle full
+
+class TestFullCycle(SyntheticTestCase):
+
+    # cycle mean and amplitude from the frames of the highest and lowest
+    # maximum principal value of each integration point, found frame by frame
+    def testPeakValley(self):
+        odb = self.synthetic(nEl=40, frames=5)
+        self.extract('full.ivol.csv', {'format': 'npy', 'cycle': 'full'})
+        data = self.readNpy('full.ivol.csv')
+        for fieldName, shear, mean, amp in (('LE', 0.5, 'cycEM', 'cycEA'),
+                                            ('S', 1.0, 'cycSM', 'cycSA')):
+            frames = numpy.array([bulkData(odb, 'cycle', i, fieldName) for i in range(5)])
+            frames[:, :, 3:] *= shear
+            pMax = numpy.array([eigenvalues(t)[:, 2] for t in frames])
+            rows = numpy.arange(frames.shape[1])
+            peak = frames[pMax.argmax(axis=0), rows]
+            valley = frames[pMax.argmin(axis=0), rows]
+            expectedMean = eigenvalues(0.5*(peak + valley))[:, 2]
+            expectedAmp = absMax(eigenvalues(0.5*(peak - valley)))
+            scale = abs(frames).max()
+            numpy.testing.assert_allclose(data[mean], expectedMean, rtol=0, atol=1e-12*scale)
+            numpy.testing.assert_allclose(data[amp], expectedAmp, rtol=0, atol=1e-12*scale)
+
+    # load and unload frame columns are still from the first and last frame
+    def testFrameColumns(self):
+        self.synthetic(nEl=40, frames=5)
+        self.extract('ends.ivol.csv', {'format': 'npy'})
+        self.extract('full.ivol.csv', {'format': 'npy', 'cycle': 'full'})
+        ends = self.readNpy('ends.ivol.csv')
+        full = self.readNpy('full.ivol.csv')
+        for name in ends:
+            if not name.startswith('cyc'):
+                self.assertTrue(numpy.array_equal(full[name], ends[name]), name)
+
+    # tensors of the first and last frame read for load and unload columns
+    # are not read again by the scan of every frame
+    def testScanReads(self):
+        self.synthetic(nEl=40, frames=5)
+        read = []
+        frameRead = ivolResults.FrameSource.read
+        def recorded(source, fieldName, invariant=None):
+            read.append((source.stepName, source.frameIndex % 5, fieldName, invariant))
+            return frameRead(source, fieldName, invariant)
+        ivolResults.FrameSource.read = recorded
+        try:
+            for columns in (['ldS11', 'ulE11', 'cycSA', 'cycEA'], ['ldS11', 'cycSA'],
+                            ['ldP', 'cycSA']):
+                del read[:]
+                self.extract('full.ivol.csv', {'format': 'npy', 'cycle': 'full',
+                                               'columns': columns, 'overwrite': True})
+                for fieldName in ('LE', 'S'):
+                    tensors = [frameIndex for step, frameIndex, name, invariant in read
+                               if step == 'cycle' and name == fieldName and invariant is None]
+                    if 'cyc' + fieldName[0] + 'A' in columns:
+                        self.assertEqual(sorted(tensors), range(5), (fieldName, columns))
+        finally:
+            ivolResults.FrameSource.read = frameRead
+        self.extract('ends.ivol.csv', {'format': 'npy', 'columns': columns})
+        full = self.readNpy('full.ivol.csv')
+        self.assertTrue(numpy.array_equal(full['ldP'], self.readNpy('ends.ivol.csv')['ldP']))
+
+#=================================================================
+# -storage compact
+
+class TestCompact(SyntheticTestCase):
+
+    def testTypes(self):
+        self.synthetic(nEl=300, nIp=4)
+        self.extract('full.ivol.csv', {'format': 'npy'})
+        self.extract('compact.ivol.csv', {'format': 'npy', 'storage': 'compact'})
+        full = self.readNpy('full.ivol.csv')
+        compact = self.readNpy('compact.ivol.csv')
+        self.assertEqual(sorted(compact), sorted(full))
+        self.assertEqual(compact['el'].dtype, numpy.uint16)
+        self.assertEqual(compact['ip'].dtype, numpy.uint8)
+        for name in full:
+            if name not in ('el', 'ip'):
+                self.assertEqual(compact[name].dtype, numpy.float32, name)
+            # values are those of full storage, rounded
+            self.assertTrue(numpy.array_equal(full[name].astype(compact[name].dtype),
+                                              compact[name]), name)
+
+    def testSummary(self):
+        self.synthetic(nEl=40)
+        self.extract('full.ivol.csv')
+        self.extract('compact.ivol.csv', {'storage': 'compact'})
+        self.assertEqual(headerLines('compact.ivol.csv'), headerLines('full.ivol.csv'))
+        full = readCsv('full.ivol.csv')[0]
+        compact = readCsv('compact.ivol.csv')[0]
+        for name in full:
+            numpy.testing.assert_allclose(compact[name], full[name], rtol=1e-5,
+                                          atol=1e-7*abs(full[name]).max(), err_msg=name)
+
+#=================================================================
+# -aggregate element
+
+class TestAggregate(SyntheticTestCase):
+
+    # element rows, from blocks that end part way through elements, against
+    # a reduction of the integration point results one element at a time
+    def testElements(self):
+        self.synthetic(nEl=40, nIp=4)
+        self.extract('points.ivol.csv', {'format': 'npy'})
+        self.extract('elements.ivol.csv', {'format': 'npy', 'aggregate': 'element',
+                                           'blockSize': 7})
+        points = self.readNpy('points.ivol.csv')
+        elements = self.readNpy('elements.ivol.csv')
+        self.assertTrue(numpy.array_equal(elements['el'], numpy.arange(1, 41)))
+        self.assertTrue((elements['nIp'] == 4).all())
+        for i, label in enumerate(elements['el']):
+            rows = points['el'] == label
+            def value(name):
+                return points[name][rows].astype(numpy.float64)
+            expected = {'preV': value('preV').sum(), 'ldV': value('ldV').sum(),
+                        'ulV': value('ulV').sum()}
+            for frame in ('pre', 'ld', 'ul'):
+                expected[frame + 'M'] = (value(frame + 'M')*value(frame + 'V')).sum()/\
+                                        expected[frame + 'V']
+            expected['cycEA'] = (abs(value('cycEA'))*value('ldV')).sum()/expected['ldV']
+            for name, column in (('cycEAmax', 'cycEA'), ('cycSA', 'cycSA')):
+                values = value(column)
+                expected[name] = values[abs(values).argmax()]
+            for name in expected:
+                self.assertAlmostEqual(elements[name][i], expected[name],
+                                       delta=1e-12*abs(expected[name]))
+
+    def testSummary(self):
+        self.synthetic(nEl=40, nIp=4)
+        self.extract('points.ivol.csv')
+        self.extract('elements.ivol.csv', {'aggregate': 'element', 'blockSize': 7})
+        points = readCsv('points.ivol.csv')[1]
+        elements = readCsv('elements.ivol.csv')[1]
+        self.assertEqual(elements['elements'], 40)
+        for key in ('nRows', 'vTotal', 'cycEMmax', 'cycEAmax'):
+            self.assertEqual(elements[key], points[key])
+
+#=================================================================
+# -topK
+
+class TestTopRows(SyntheticTestCase):
+
+    # rows kept block by block are the first k of a stable sort of every
+    # row, with ties (of either sign) in and across blocks
+    def testTies(self):
+        rs = numpy.random.RandomState(4)
+        values = rs.randint(-5, 6, size=500).astype(numpy.float64)
+        col = {'el': numpy.arange(500), 'cycEA': values}
+        expected = numpy.argsort(-abs(values), kind='mergesort')
+        for k in (1, 7, 50, 500, 800):
+            for size in (1, 7, 64, 500):
+                top = ivolResults.TopRows(k, 'cycEA')
+                for start in range(0, 500, size):
+                    top.update(dict([(name, column[start:start + size])
+                                     for name, column in col.items()]))
+                rows = top.result()
+                self.assertTrue(numpy.array_equal(rows['el'], expected[:k]), (k, size))
+                self.assertTrue(numpy.array_equal(rows['cycEA'], values[expected[:k]]))
+
+    # rows of the results ranked by the absolute value of rankBy, with topK
+    # and rankBy in the header, and the summary of every row
+    def testResults(self):
+        self.synthetic(nEl=40)
+        self.extract('all.ivol.csv', {'format': 'npy'})
+        full = self.readNpy('all.ivol.csv')
+        nRows = len(full['el'])
+        for topK, rankBy in ((10, 'cycSA'), (nRows + 50, 'cycEA')):
+            self.extract('top.ivol.csv', {'format': 'both', 'topK': topK, 'rankBy': rankBy,
+                                          'blockSize': 7, 'overwrite': True})
+            rows = numpy.argsort(-abs(full[rankBy]), kind='mergesort')[:topK]
+            top = self.readNpy('top.ivol.csv')
+            for name in full:
+                self.assertTrue(numpy.array_equal(top[name], full[name][rows]), name)
+            header = open('top.ivol.csv').read()
+            self.assertTrue('topK     = %i\n' %(min(topK, nRows)) in header)
+            self.assertTrue('rankBy   = %s\n' %(rankBy) in header)
+            self.assertEqual(readCsv('top.ivol.csv')[1]['nRows'], nRows)
+            self.assertEqual(len(readCsv('top.ivol.csv')[0]['el']), min(topK, nRows))
+
+#=================================================================
+# -volumes
+
+class TestVolumeSummary(SyntheticTestCase):
+
+    # totals of postprocessFEA.R (v.Total, vX.pre, vX.ld, vX.ul, vX.delta),
+    # summed over blocks, times the symmetry factor
+    def testTotals(self):
+        self.synthetic(nEl=40)
+        for symmetry in (1, 4):
+            self.extract('job.ivol.csv', {'format': 'both', 'volumes': True,
+                                          'symmetry': symmetry, 'blockSize': 7,
+                                          'overwrite': True})
+            # in double precision, as R reads the CSV file
+            df = dict([(name, values.astype(numpy.float64))
+                       for name, values in self.readNpy('job.ivol.csv').items()])
+            vTotal = numpy.sum(df['ulV'])
+            vXpre = numpy.sum(df['preM']*df['preV'])
+            vXld = numpy.sum(df['ldM']*df['ldV'])
+            vXul = numpy.sum(df['ulM']*df['ulV'])
+            vXdelta = abs(vXld - vXul)
+            volumes = json.load(open(ivolResults.volumesName('job.ivol.csv')))
+            self.assertEqual(volumes['symmetry'], symmetry)
+            for value, expected in ((volumes['vTotal'], vTotal),
+                                    (volumes['vX']['pre'], vXpre),
+                                    (volumes['vX']['ld'], vXld),
+                                    (volumes['vX']['ul'], vXul),
+                                    (volumes['vX']['delta'], vXdelta)):
+                self.assertAlmostEqual(value/(symmetry*expected), 1.0, places=12)
+
+#=================================================================
+# -update and the manifest
+
+class TestManifest(SyntheticTestCase):
+
+    # odbs opened, and results files written (by worker processes too)
+    def setUp(self):
+        SyntheticTestCase.setUp(self)
+        self.opened = []
+        self.written = os.path.join(self.folder, 'written.txt')
+        self.interrupt = None
+        self.openOdb = ivolResults.openOdb
+        self.writeResults = ivolResults.writeResults
+        def openOdb(path, **kwargs):
+            self.opened.append(path)
+            return self.openOdb(path, **kwargs)
+        def writeResults(raws, plan, columns, outputFile, *args):
+            file1 = open(self.written, 'a')
+            file1.write(os.path.basename(outputFile) + '\n')
+            file1.close()
+            if self.interrupt and self.interrupt[0] in outputFile:
+                raise self.interrupt[1]('interrupted')
+            return self.writeResults(raws, plan, columns, outputFile, *args)
+        ivolResults.openOdb = openOdb
+        ivolResults.writeResults = writeResults
+
+    def tearDown(self):
+        ivolResults.openOdb = self.openOdb
+        ivolResults.writeResults = self.writeResults
+        SyntheticTestCase.tearDown(self)
+
+    def runScript(self, outputFile, options, lastStepName='cycle'):
+        del self.opened[:]
+        if os.path.exists(self.written):
+            os.remove(self.written)
+        with Quiet():
+            return ivolResults.outputToText(['job.odb', None, 'PART-1-1', 'crimp',
+                                             lastStepName, outputFile], options)
+
+    def writtenFiles(self):
+        if not os.path.exists(self.written):
+            return []
+        return sorted(open(self.written).read().split())
+
+    # every run writes the manifest; with -update, a run whose results are
+    # up to date neither opens the odb nor writes results
+    def testUpToDate(self):
+        self.synthetic(nEl=40)
+        written = self.runScript('job.ivol.csv', {'format': 'both'})
+        self.assertTrue(os.path.isfile('job.ivol.manifest.json'))
+        self.assertEqual(self.runScript('job.ivol.csv', {'format': 'both', 'update': True}),
+                         written)
+        self.assertEqual(self.opened, [])
+        self.assertEqual(self.writtenFiles(), [])
+        # other options are other results
+        self.runScript('job.ivol.csv', {'format': 'csv', 'update': True})
+        self.assertEqual(self.writtenFiles(), ['job.ivol.csv'])
+
+    # results of an odb written again are extracted again
+    def testTouched(self):
+        self.synthetic(nEl=40)
+        self.runScript('job.ivol.csv', {'update': True})
+        stat = os.stat('job.odb')
+        os.utime('job.odb', (stat.st_atime, stat.st_mtime + 10))
+        self.runScript('job.ivol.csv', {'update': True})
+        self.assertEqual(self.opened, ['job.odb'])
+        self.assertEqual(self.writtenFiles(), ['job.ivol.csv'])
+        self.runScript('job.ivol.csv', {'update': True})
+        self.assertEqual(self.writtenFiles(), [])
+
+    # a run with several steps interrupted in the second step only extracts
+    # the second step when it is started again
+    def testResumeSteps(self):
+        self.synthetic(nEl=40, steps=('crimp', 'cycle', 'cycle2'))
+        self.interrupt = ('cycle2', KeyboardInterrupt)
+        self.assertRaises(KeyboardInterrupt, self.runScript, 'job.ivol.csv', {'update': True},
+                          'cycle,cycle2')
+        self.interrupt = None
+        self.runScript('job.ivol.csv', {'update': True}, 'cycle,cycle2')
+        self.assertEqual(self.writtenFiles(), ['job.cycle2.ivol.csv'])
+        self.runScript('clean.ivol.csv', {}, 'cycle,cycle2')
+        for step in ('cycle', 'cycle2'):
+            self.assertEqual(open('job.%s.ivol.csv' %(step)).read(),
+                             open('clean.%s.ivol.csv' %(step)).read(), step)
+        self.runScript('job.ivol.csv', {'update': True}, 'cycle,cycle2')
+        self.assertEqual(self.opened, [])
+
+    # parts written by an interrupted -workers run are kept, and only the
+    # missing part is extracted when it is started again
+    def testResumeWorkers(self):
+        self.synthetic(nEl=40)
+        options = {'workers': 3, 'update': True}
+        self.interrupt = ('part-0002', ValueError)
+        self.assertEqual(self.runScript('job.ivol.csv', options), None)
+        self.assertEqual(self.writtenFiles(),
+                         ['part-0001.ivol.csv', 'part-0002.ivol.csv', 'part-0003.ivol.csv'])
+        self.assertTrue(os.path.isdir('job.ivol.parts'))
+        self.interrupt = None
+        self.runScript('job.ivol.csv', options)
+        self.assertEqual(self.writtenFiles(), ['part-0002.ivol.csv'])
+        self.assertFalse(os.path.exists('job.ivol.parts'))
+        self.runScript('serial.ivol.csv', {})
+        self.assertEqual(open('job.ivol.csv').read(), open('serial.ivol.csv').read())
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,153 @@
+'''
+testIvolServer.py
+=================
+
+Regression tests of ivolServer.py and ivolClient.py: a server on a free port
+of this computer answers queries for a synthetic odb with the columns of
+ivolResults.004.py, does not keep the frames of a full cycle scan, keeps
+answering after errors, answers other clients while one keeps its
+connection open, and refuses odbs outside its root folder.
+'''
+
+# Copyright 2017 Confluent Medical Technologies
+# Released as part of nitinol-design-concepts
+# https://github.com/confluentmedical/nitinol-design-concepts
+# under terms of Apache 2.0 license
+# http://www.apache.org/licenses/LICENSE-2.0.txt
+
+import os
+import time
+import socket
+import unittest
+import threading
+import numpy
+from ivolTest import SyntheticTestCase, Quiet
+import ivolServer
+from ivolClient import IvolClient, IvolServerError
+
+def freePort():
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.bind(('127.0.0.1', 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return port
+
+class TestServer(SyntheticTestCase):
+
+    def setUp(self):
+        SyntheticTestCase.setUp(self)
+        self.odbName = os.path.join(self.folder, 'job.odb')
+        self.synthetic(self.odbName, nEl=40, frames=4)
+        self.quiet = Quiet()
+        self.quiet.__enter__()
+        self.port = freePort()
+        self.thread = threading.Thread(target=ivolServer.serve,
+                                       args=(self.port, (), 64*1024*1024, self.folder))
+        self.thread.daemon = True
+        self.thread.start()
+        self.client = self.connect()
+
+    def tearDown(self):
+        try:
+            if self.thread.is_alive():
+                self.connect().shutdown()
+            self.thread.join(10)
+        finally:
+            self.quiet.__exit__()
+            SyntheticTestCase.tearDown(self)
+
+    def connect(self):
+        for i in range(100):
+            try:
+                return IvolClient(self.port)
+            except socket.error:
+                time.sleep(0.05)
+        return IvolClient(self.port)
+
+    def extract(self, **options):
+        return self.client.extract(self.odbName, 'PART-1-1', 'crimp', 'cycle', **options)
+
+    # all columns, as written by ivolResults.004.py, then from the cache
+    def testExtract(self):
+        self.synthetic(nEl=40, frames=4)
+        for options in ({}, {'cycle': 'full'}, {'elset': 'HALF'}):
+            SyntheticTestCase.extract(self, 'job.ivol.csv', dict(options, format='npy'))
+            expected = self.readNpy('job.ivol.csv')
+            data, header = self.extract(**options)
+            self.assertEqual(sorted(data), sorted(expected))
+            self.assertEqual(header['nRows'], len(expected['el']))
+            for name in expected:
+                self.assertTrue(numpy.array_equal(data[name], expected[name]), name)
+            data, header = self.extract(**options)
+            self.assertEqual(header['fieldsCached'], header['fieldsRead'])
+
+    # load and unload frames other than the first and last
+    def testFrames(self):
+        odb = self.synthetic(self.odbName, nEl=40, frames=4)
+        data, header = self.extract(columns=['ldS11', 'ulV'], frames=[1, 2])
+        frames = odb.steps['cycle'].frames
+        self.assertTrue(numpy.array_equal(
+            data['ldS11'], frames[1].fieldOutputs['S'].bulkDataBlocks[0].data[:, 0]))
+        self.assertTrue(numpy.array_equal(
+            data['ulV'], frames[2].fieldOutputs['IVOL'].bulkDataBlocks[0].data))
+
+    # frames read by the scan of every frame of a full cycle are not kept;
+    # the load and unload frames read for their own columns are
+    def testFullCycle(self):
+        data, header = self.extract(columns=['cycEA'], cycle='full')
+        self.assertEqual(self.client.status()['cachedFields'], 0)
+        again, header = self.extract(columns=['cycEA'], cycle='full')
+        self.assertTrue(numpy.array_equal(again['cycEA'], data['cycEA']))
+        data, header = self.extract(columns=['ldE11', 'cycEA'], cycle='full')
+        self.assertEqual(self.client.status()['cachedFields'], 1)
+        data, header = self.extract(columns=['ldE11'])
+        self.assertEqual(header['fieldsCached'], header['fieldsRead'])
+
+    def testColumns(self):
+        data, header = self.extract(columns=['cycEA', 'ldV'])
+        self.assertEqual(sorted(data), ['cycEA', 'el', 'ip', 'ldV'])
+        # only LE of the load and unload frames, and IVOL of the load frame
+        self.assertEqual(header['fieldsRead'], 3)
+        # part instance and element set names in lower case
+        lower, header = self.client.extract(self.odbName, 'part-1-1', 'crimp', 'cycle',
+                                            columns=['cycEA'], elset='half')
+        self.assertEqual(len(lower['el']), len(data['el'])//2)
+
+    def testErrors(self):
+        for options in ({'lastStepName': 'nope'}, {'columns': ['zz']}, {'elset': 'NOPE'},
+                        {'frames': [0, 9]}):
+            request = dict(odb=self.odbName, partInstance='PART-1-1', crimpStepName='crimp',
+                           lastStepName='cycle')
+            request.update(options)
+            self.assertRaises(IvolServerError, self.client.extract, **request)
+        self.assertRaises(IvolServerError, self.client.extract,
+                          os.path.join(self.folder, 'missing.odb'), 'PART-1-1', 'crimp', 'cycle')
+        self.assertEqual(self.client.status()['requests'], 6)
+
+    def testRoot(self):
+        outside = os.path.join(os.path.dirname(self.folder), 'job.odb')
+        for odbName in (outside, os.path.join(self.folder, '..', 'job.odb')):
+            try:
+                self.client.extract(odbName, 'PART-1-1', 'crimp', 'cycle')
+                self.fail('%s outside the root folder was opened' %(odbName))
+            except IvolServerError, e:
+                self.assertTrue('is not in the folder' in str(e))
+        self.assertEqual(self.client.status()['odbs'], [])
+
+    # a client that keeps its connection open, or has sent part of a message,
+    # does not hold up the others
+    def testClients(self):
+        self.extract(columns=['cycEA'])
+        waiting = socket.create_connection(('127.0.0.1', self.port))
+        waiting.sendall('\x00\x00')
+        other = self.connect()
+        self.assertEqual(other.status()['odbs'], [self.odbName])
+        self.assertEqual(self.client.closeOdb(self.odbName), {'status': 'ok'})
+        self.assertEqual(other.status()['odbs'], [])
+        other.shutdown()
+        self.thread.join(10)
+        self.assertFalse(self.thread.is_alive())
+        waiting.close()
+
+if __name__ == '__main__':
+    unittest.main()
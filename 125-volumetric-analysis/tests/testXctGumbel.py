@@ -0,0 +1,86 @@
+'''
+testXctGumbel.py
+================
+
+Regression tests of the Gumbel fits of ../210-xct-methods/xctGumbel.py, with
+the XCT scans of ../210-xct-methods/image-data, against the parameters of
+xct-process-imagej-results.R in ../210-xct-methods/out/gumbel-parameters.csv.
+R finds the maximum likelihood by numerical optimization, to about 1e-4 of
+each parameter; xctGumbel.py solves the likelihood equations.
+'''
+
+# Copyright 2017 Confluent Medical Technologies
+# Released as part of nitinol-design-concepts
+# https://github.com/confluentmedical/nitinol-design-concepts
+# under terms of Apache 2.0 license
+# http://www.apache.org/licenses/LICENSE-2.0.txt
+
+import os
+import sys
+import csv
+import unittest
+import numpy
+from ivolTest import scriptDir
+
+xctDir = os.path.join(os.path.dirname(scriptDir), '210-xct-methods')
+if xctDir not in sys.path:
+    sys.path.insert(0, xctDir)
+
+import xctGumbel
+
+settings = {'cutoff': 8.0, 'voxel': 0.500973555972, 'cache': None, 'chunk': 100000}
+
+# values of each group, and group numbers, drawn from Gumbel distributions
+def gumbelSamples(parameters, n, seed=1):
+    rs = numpy.random.RandomState(seed)
+    x = numpy.concatenate([rs.gumbel(mu, s, n) for mu, s in parameters])
+    group = numpy.repeat(numpy.arange(len(parameters)), n)
+    return x, group
+
+class TestFitGumbel(unittest.TestCase):
+
+    # s = mean(x) - sum(x w)/sum(w) and mu = -s log(mean(w)), w = exp(-x/s)
+    def assertLikelihoodEquations(self, x, mu, s):
+        w = numpy.exp(-(x - x.min())/s)
+        self.assertAlmostEqual(s, x.mean() - (x*w).sum()/w.sum(), delta=1e-9*s)
+        self.assertAlmostEqual(mu, x.min() - s*numpy.log(w.mean()), delta=1e-9*s)
+
+    def testGroups(self):
+        parameters = [(2.8, 1.4), (3.6, 2.0), (1.8, 0.4), (-5.0, 0.01), (1e3, 50.0)]
+        x, group = gumbelSamples(parameters, 2000)
+        mu, s = xctGumbel.fitGumbel(x, group, len(parameters))
+        for i, (mu0, s0) in enumerate(parameters):
+            values = x[group == i]
+            self.assertLikelihoodEquations(values, mu[i], s[i])
+            # each group as fitted on its own
+            mu1, s1 = xctGumbel.fitGumbel(values, numpy.zeros(len(values), dtype=int), 1)
+            self.assertAlmostEqual(mu[i], mu1[0], delta=1e-9*s0)
+            self.assertAlmostEqual(s[i], s1[0], delta=1e-9*s0)
+            # within 4 standard errors of the parameters drawn from
+            self.assertAlmostEqual(mu[i], mu0, delta=4*1.05*s0/numpy.sqrt(2000))
+            self.assertAlmostEqual(s[i], s0, delta=4*0.78*s0/numpy.sqrt(2000))
+
+    def testTooFew(self):
+        self.assertRaises(ValueError, xctGumbel.fitGumbel, numpy.array([1.0, 2.0, 3.0]),
+                          numpy.array([0, 0, 1]), 2)
+
+class TestScans(unittest.TestCase):
+
+    def testParameters(self):
+        folder = os.path.join(xctDir, 'image-data')
+        scans = xctGumbel.readScans(xctGumbel.defaultScans, folder, settings)
+        parameters = xctGumbel.gumbelParameters(scans, settings)
+        f = open(os.path.join(xctDir, 'out', 'gumbel-parameters.csv'))
+        expected = list(csv.DictReader(f))
+        f.close()
+        self.assertEqual(len(expected), 6)
+        for row in expected:
+            material = parameters['materials'][row['matl']]
+            self.assertAlmostEqual(material['probV'], float(row['nPerMm3']),
+                                   delta=1e-9*float(row['nPerMm3']))
+            for name in ('mu', 's'):
+                self.assertAlmostEqual(material[row['plane']][name], float(row[name]),
+                                       delta=5e-4*float(row[name]))
+
+if __name__ == '__main__':
+    unittest.main()
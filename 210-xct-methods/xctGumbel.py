@@ -0,0 +1,435 @@
+'''
+xctGumbel.py
+============
+
+Inclusion density and Gumbel parameters of root area inclusion size from the
+ImageJ / MorphoLibJ results of XCT scans, as in xct-process-imagej-results.R,
+for scans with millions of labelled particles. The result tables are read in
+chunks of rows, filtered with numpy, and every scan is read by its own worker
+process. Results of each scan are cached by the checksums of its files, so
+adding a scan to a lot only reads the new scan.
+
+Usage: python xctGumbel.py
+      [-scans scan01=SE508,scan02=SE508ELI,...]  (scan prefix=description,
+                                                  default as the R script)
+      [-folder imageDataFolder]  (default image-data)
+      [-output outputFolder]  (default out)
+      [-cutoff volume]  (smallest particle volume in cubic micron, default 8)
+      [-voxel size]  (voxel edge length in micron, default 0.500973555972)
+      [-workers n]  (worker processes, default 1)
+      [-cache cacheFolder]  (default outputFolder/cache, or none)
+      [-chunk n]  (rows read at a time, default 100000)
+
+Each scan has three tab separated files in the image data folder:
+    scanNN-mask-histogram.tsv  voxels of the mask (value 0) and matrix (255)
+    scanNN-lbl-morpho.tsv      particle volumes (MorphoLibJ Particle Analysis 3D)
+    scanNN-lbl-bounds.tsv      particle bounding boxes (MorphoLibJ Bounding Box 3D)
+
+Particles are kept if their volume is over the cutoff, and their ellipsoid
+radius ratios are not NaN or Infinity (ImageJ writes these for particles one
+voxel thick). Root areas in the xy, yz and xz planes are estimated from the
+volume divided by the bounding box size normal to each plane. Gumbel
+parameters mu and s are fitted by maximum likelihood, for every plane of
+every material (scans with the same description together) and of every scan,
+all at once.
+
+Written to the output folder:
+    gumbel-parameters.csv   matl, plane, cutoff, nPerMm3, mu, s (as the R script)
+    count-by-scan.csv       scanID, scanDesc, vMatrix, n, nPerUm3, nPerMm3
+    count-by-type.csv       scanDesc, vMatrix, n, nPerUm3, nPerMm3
+    gumbel-parameters.json  the parameters of each material and scan, with the
+                            checksums of the scan files
+
+Material ids in the results are the descriptions in lower case, except SE508ELI,
+which is eli as in monte-carlo-xct-fea.R. Each material in gumbel-parameters.json
+has probV (particles per cubic mm) and mu and s of each plane, as used by
+../125-volumetric-analysis/ivolMonteCarlo.py. ivolResults.004.py records the
+file and its checksum in its results with "-gumbel gumbel-parameters.json".
+'''
+
+# Copyright 2017 Confluent Medical Technologies
+# Released as part of nitinol-design-concepts
+# https://github.com/confluentmedical/nitinol-design-concepts
+# under terms of Apache 2.0 license
+# http://www.apache.org/licenses/LICENSE-2.0.txt
+
+import os
+import csv
+import json
+import time
+import hashlib
+import itertools
+import multiprocessing
+import numpy
+from sys import argv, exit
+
+# version of the cached scan results; change when readScan changes
+cacheVersion = 1
+
+defaultScans = [('scan01', 'SE508'), ('scan02', 'SE508ELI'), ('scan03', 'SE508ELI')]
+materialIds = {'SE508ELI': 'eli'}
+
+# plane, and the bounding box size normal to it
+planes = [('xy', 'zBox'), ('yz', 'xBox'), ('xz', 'yBox')]
+
+morphoColumns = ['Label', 'Volume', 'Elli.R1/R2', 'Elli.R1/R3', 'Elli.R2/R3']
+boundsColumns = ['Label', 'XMin', 'XMax', 'YMin', 'YMax', 'ZMin', 'ZMax']
+
+#=================================================================
+# readTsv
+# Generate chunks of rows of a tab separated results table with a header
+# line, as dictionaries of float64 column arrays. NaN and Infinity are read
+# as numpy nan and inf.
+
+def readTsv(path, columns, chunkRows=100000):
+    f = open(path, 'rb')
+    try:
+        header = [name.strip() for name in f.readline().rstrip('\r\n').split('\t')]
+        missing = [name for name in columns if name not in header]
+        if missing:
+            raise ValueError('%s has no column %s' %(path, ', '.join(missing)))
+        index = [header.index(name) for name in columns]
+        while True:
+            lines = [line for line in itertools.islice(f, chunkRows) if line.strip()]
+            if not lines:
+                break
+            values = numpy.fromstring(''.join(lines), sep=' ')
+            if values.size != len(lines)*len(header):
+                raise ValueError('%s has rows that are not %i numbers' %(path, len(header)))
+            values = values.reshape(len(lines), len(header))
+            yield dict([(name, values[:, j]) for name, j in zip(columns, index)])
+    finally:
+        f.close()
+
+#=================================================================
+# readHistogram
+# Voxel counts of the mask (value 0) and matrix (value 255) of a scan
+
+def readHistogram(path):
+    counts = {}
+    for chunk in readTsv(path, ['value', 'count']):
+        for value, count in zip(chunk['value'], chunk['count']):
+            counts[int(value)] = count
+    if 0 not in counts or 255 not in counts:
+        raise ValueError('%s has no count of value 0 or 255' %(path))
+    return counts[0], counts[255]
+
+#=================================================================
+# readScan
+# Matrix volume and root areas of the particles of one scan kept by the
+# cutoff, read from its three files, or from the cache if the files have
+# not changed. Returns a dictionary of the scan, with the root areas of
+# each plane as arrays.
+
+def scanFiles(folder, scan):
+    return dict([(kind, os.path.join(folder, '%s-%s.tsv' %(scan, kind)))
+                 for kind in ('mask-histogram', 'lbl-morpho', 'lbl-bounds')])
+
+def fileChecksum(path):
+    sha1 = hashlib.sha1()
+    f = open(path, 'rb')
+    while True:
+        data = f.read(1 << 20)
+        if not data:
+            break
+        sha1.update(data)
+    f.close()
+    return sha1.hexdigest()
+
+def readScan(task):
+    scan, description, folder, settings = task
+    files = scanFiles(folder, scan)
+    checksums = dict([(kind, fileChecksum(path)) for kind, path in files.items()])
+    key = hashlib.sha1(json.dumps([cacheVersion, checksums, settings['cutoff'],
+                                   settings['voxel']], sort_keys=True)).hexdigest()
+    cacheFile = None
+    if settings['cache']:
+        cacheFile = os.path.join(settings['cache'], '%s-%s.npz' %(scan, key))
+
+    result = {'scan': scan, 'description': description,
+              'files': dict([(kind, {'file': os.path.basename(path), 'sha1': checksums[kind]})
+                             for kind, path in files.items()])}
+    if cacheFile and os.path.isfile(cacheFile):
+        cached = numpy.load(cacheFile)
+        for name in cached.files:
+            result[name] = cached[name]
+        for name in ('vMatrix', 'vMask'):
+            result[name] = float(result[name])
+        for name in ('particles', 'small', 'degenerate'):
+            result[name] = int(result[name])
+        result['cached'] = True
+        return result
+
+    voxels0, voxels255 = readHistogram(files['mask-histogram'])
+    cubicUmPerVoxel = settings['voxel']**3
+    arrays = {'vMatrix': voxels255*cubicUmPerVoxel, 'vMask': voxels0*cubicUmPerVoxel,
+              'particles': 0, 'small': 0, 'degenerate': 0}
+    roots = dict([(plane, []) for plane, box in planes])
+    for morpho, bounds in itertools.izip(
+            readTsv(files['lbl-morpho'], morphoColumns, settings['chunk']),
+            readTsv(files['lbl-bounds'], boundsColumns, settings['chunk'])):
+        if len(morpho['Label']) != len(bounds['Label']) or \
+           (morpho['Label'] != bounds['Label']).any():
+            raise ValueError('labels of %s and %s do not match'
+                             %(files['lbl-morpho'], files['lbl-bounds']))
+        volume = morpho['Volume']
+        large = numpy.isfinite(volume) & (volume > settings['cutoff'])
+        finite = numpy.isfinite(morpho['Elli.R1/R2']) & numpy.isfinite(morpho['Elli.R1/R3']) &\
+                 numpy.isfinite(morpho['Elli.R2/R3'])
+        keep = large & finite
+        arrays['particles'] += len(volume)
+        arrays['small'] += int((~large).sum())
+        arrays['degenerate'] += int((large & ~finite).sum())
+        sizes = {}
+        for axis in ('X', 'Y', 'Z'):
+            sizes[axis.lower() + 'Box'] = (bounds[axis + 'Max'][keep] -
+                                           bounds[axis + 'Min'][keep])*settings['voxel']
+        for plane, box in planes:
+            roots[plane].append(numpy.sqrt(volume[keep]/sizes[box]))
+    for plane, box in planes:
+        arrays['root' + plane] = numpy.concatenate(roots[plane] or [numpy.zeros(0)])
+
+    if cacheFile:
+        if not os.path.isdir(settings['cache']):
+            try:
+                os.makedirs(settings['cache'])
+            except OSError:
+                # made by another worker
+                pass
+        temporary = cacheFile + '.%i.npz' %(os.getpid())
+        numpy.savez(temporary, **arrays)
+        os.rename(temporary, cacheFile)
+    result.update(arrays)
+    result['cached'] = False
+    return result
+
+#=================================================================
+# fitGumbel
+# Maximum likelihood Gumbel (largest extreme value) parameters mu and s of
+# each group of values, for values x with group numbers 0..nGroups-1. s
+# solves s = mean(x) - sum(x w)/sum(w) with w = exp(-x/s), by Newton
+# iterations for every group at once; then mu = -s log(mean(w)).
+
+def fitGumbel(x, group, nGroups, tolerance=1e-12, maxIterations=100):
+    x = numpy.asarray(x, dtype=numpy.float64)
+    n = numpy.bincount(group, minlength=nGroups).astype(numpy.float64)
+    if (n < 2).any():
+        raise ValueError('a Gumbel fit needs at least 2 values in each group')
+    mean = numpy.bincount(group, x, nGroups)/n
+    # shift by the group minimum so that exp(-x/s) does not underflow
+    order = numpy.argsort(group, kind='mergesort')
+    starts = numpy.searchsorted(group[order], numpy.arange(nGroups))
+    minimum = numpy.minimum.reduceat(x[order], starts)
+    shifted = x - minimum[group]
+    variance = numpy.bincount(group, (x - mean[group])**2, nGroups)/n
+    # moment estimate to start
+    s = numpy.sqrt(6.0*variance)/numpy.pi
+    for iteration in range(maxIterations):
+        w = numpy.exp(-shifted/s[group])
+        sumW = numpy.bincount(group, w, nGroups)
+        meanW = numpy.bincount(group, w*shifted, nGroups)/sumW
+        varW = numpy.bincount(group, w*shifted**2, nGroups)/sumW - meanW**2
+        g = s - (mean - minimum) + meanW
+        step = g/(1.0 + varW/s**2)
+        s = numpy.maximum(s - step, 0.5*s)
+        if (abs(step) <= tolerance*s).all():
+            break
+    w = numpy.exp(-shifted/s[group])
+    mu = minimum - s*numpy.log(numpy.bincount(group, w, nGroups)/n)
+    return mu, s
+
+#=================================================================
+# gumbelParameters
+# Inclusion density and Gumbel parameters of each material and each scan
+
+def materialId(description):
+    return materialIds.get(description, description.lower())
+
+def gumbelParameters(scans, settings):
+    materials = []
+    for scan in scans:
+        if materialId(scan['description']) not in materials:
+            materials.append(materialId(scan['description']))
+    # groups: every plane of every material, then of every scan
+    owners = [('material', m) for m in materials] + [('scan', s['scan']) for s in scans]
+    values = []
+    groups = []
+    for i, (kind, name) in enumerate(owners):
+        members = [s for s in scans if (kind == 'scan' and s['scan'] == name) or
+                   (kind == 'material' and materialId(s['description']) == name)]
+        for j, (plane, box) in enumerate(planes):
+            data = numpy.concatenate([s['root' + plane] for s in members])
+            values.append(data)
+            groups.append(numpy.repeat(len(planes)*i + j, len(data)))
+    mu, s = fitGumbel(numpy.concatenate(values), numpy.concatenate(groups),
+                      len(planes)*len(owners))
+
+    result = {'source': 'xctGumbel.py', 'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+              'cutoff': settings['cutoff'], 'umPerVoxel': settings['voxel'],
+              'materials': {}, 'scans': {}, 'order': materials,
+              'scanOrder': [scan['scan'] for scan in scans]}
+    for i, (kind, name) in enumerate(owners):
+        members = [scan for scan in scans if (kind == 'scan' and scan['scan'] == name) or
+                   (kind == 'material' and materialId(scan['description']) == name)]
+        vMatrix = sum([scan['vMatrix'] for scan in members])
+        n = sum([len(scan['rootxy']) for scan in members])
+        entry = {'n': n, 'vMatrix': vMatrix, 'nPerUm3': n/vMatrix,
+                 'probV': n/vMatrix*1e9, 'cutoff': settings['cutoff']}
+        for j, (plane, box) in enumerate(planes):
+            entry[plane] = {'mu': float(mu[len(planes)*i + j]), 's': float(s[len(planes)*i + j])}
+        if kind == 'material':
+            entry['id'] = name
+            entry['description'] = members[0]['description']
+            entry['scans'] = [scan['scan'] for scan in members]
+            result['materials'][name] = entry
+        else:
+            scan = members[0]
+            entry.update({'description': scan['description'],
+                          'material': materialId(scan['description']),
+                          'particles': scan['particles'], 'small': scan['small'],
+                          'degenerate': scan['degenerate'], 'files': scan['files']})
+            result['scans'][name] = entry
+    return result
+
+#=================================================================
+# writeParameters
+# Write the CSV tables of the R script, and the JSON parameter file.
+# Returns the names of the files written.
+
+def writeParameters(parameters, outputFolder):
+    if not os.path.isdir(outputFolder):
+        os.makedirs(outputFolder)
+    written = []
+    def writeCsv(name, header, rows):
+        path = os.path.join(outputFolder, name)
+        f = open(path, 'wb')
+        writer = csv.writer(f, lineterminator='\n')
+        writer.writerow(header)
+        for row in rows:
+            writer.writerow([repr(value) if isinstance(value, float) else value
+                             for value in row])
+        f.close()
+        written.append(path)
+
+    cutoff = float(parameters['cutoff'])
+    writeCsv('gumbel-parameters.csv', ['matl', 'plane', 'cutoff', 'nPerMm3', 'mu', 's'],
+             [[m, plane, cutoff, parameters['materials'][m]['probV'],
+               parameters['materials'][m][plane]['mu'], parameters['materials'][m][plane]['s']]
+              for m in parameters['order'] for plane, box in planes])
+    writeCsv('count-by-scan.csv', ['scanID', 'scanDesc', 'vMatrix', 'n', 'nPerUm3', 'nPerMm3'],
+             [[name, scan['description'], scan['vMatrix'], scan['n'], scan['nPerUm3'],
+               scan['probV']]
+              for name, scan in [(name, parameters['scans'][name])
+                                 for name in parameters['scanOrder']]])
+    writeCsv('count-by-type.csv', ['scanDesc', 'vMatrix', 'n', 'nPerUm3', 'nPerMm3'],
+             [[material['description'], material['vMatrix'], material['n'],
+               material['nPerUm3'], material['probV']]
+              for material in [parameters['materials'][m] for m in parameters['order']]])
+
+    path = os.path.join(outputFolder, 'gumbel-parameters.json')
+    f = open(path, 'w')
+    json.dump(parameters, f, indent=2, sort_keys=True)
+    f.close()
+    written.append(path)
+    return written
+
+#=================================================================
+# readScans
+# Read every scan, by workers processes
+
+def readScans(scans, folder, settings, workers=1):
+    tasks = [(scan, description, folder, settings) for scan, description in scans]
+    if workers > 1 and len(tasks) > 1:
+        pool = multiprocessing.Pool(min(workers, len(tasks)))
+        try:
+            results = pool.map(readScan, tasks)
+            pool.close()
+        finally:
+            pool.terminate()
+            pool.join()
+        return results
+    return [readScan(task) for task in tasks]
+
+#==================================================================
+# S T A R T
+#
+if __name__ == '__main__':
+
+    # initialize parameters
+    scans = defaultScans
+    folder = 'image-data'
+    outputFolder = 'out'
+    workers = 1
+    cacheFolder = ''
+    settings = {'cutoff': 8.0, 'voxel': 0.500973555972, 'cache': None, 'chunk': 100000}
+
+    # parse the parameters from the argument list
+    argList = argv
+    argCount = len(argList)
+    i=1
+    try:
+        while (i < argCount):
+            if (argList[i][:3] == "-sc"):
+                i+=1
+                scans = [tuple([part.strip() for part in scan.split('=')])
+                         for scan in argList[i].split(',')]
+                if [scan for scan in scans if len(scan) != 2]:
+                    raise ValueError
+            elif (argList[i][:3] == "-fo"):
+                i+=1
+                folder = argList[i]
+            elif (argList[i][:3] == "-ou"):
+                i+=1
+                outputFolder = argList[i]
+            elif (argList[i][:3] == "-cu"):
+                i+=1
+                settings['cutoff'] = float(argList[i])
+            elif (argList[i][:3] == "-vo"):
+                i+=1
+                settings['voxel'] = float(argList[i])
+            elif (argList[i][:3] == "-wo"):
+                i+=1
+                workers = int(argList[i])
+            elif (argList[i][:3] == "-ca"):
+                i+=1
+                cacheFolder = argList[i]
+            elif (argList[i][:3] == "-ch"):
+                i+=1
+                settings['chunk'] = int(float(argList[i]))
+            elif (argList[i][:3] == "-he"):
+                print __doc__
+                exit(0)
+            else:
+                print "***ERROR: Unknown argument %s" %(argList[i])
+                print __doc__
+                exit(1)
+            i+=1
+    except (IndexError, ValueError):
+        print "***ERROR: Arguments are missing or not valid"
+        print __doc__
+        exit(1)
+
+    if cacheFolder == '':
+        cacheFolder = os.path.join(outputFolder, 'cache')
+    if cacheFolder.lower() != 'none':
+        settings['cache'] = cacheFolder
+
+    started = time.time()
+    try:
+        results = readScans(scans, folder, settings, workers)
+        parameters = gumbelParameters(results, settings)
+    except (IOError, ValueError), e:
+        print "***ERROR: %s" %(e)
+        exit(1)
+    for scan in results:
+        print '%s (%s): %i of %i particles over %g cubic micron%s' %(
+            scan['scan'], scan['description'], len(scan['rootxy']), scan['particles'],
+            settings['cutoff'], ' (cached)' if scan['cached'] else '')
+    for name in parameters['order']:
+        material = parameters['materials'][name]
+        print '%s: %.6g particles per cubic mm, %s' %(name, material['probV'], ', '.join(
+            ['%s mu=%.6g s=%.6g' %(plane, material[plane]['mu'], material[plane]['s'])
+             for plane, box in planes]))
+    for path in writeParameters(parameters, outputFolder):
+        print 'Written: %s' %(path)
+    print 'Done in %.1f seconds' %(time.time() - started)